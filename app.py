@@ -134,6 +134,7 @@
 
 from flask import Flask, session, redirect, render_template, url_for
 from dotenv import load_dotenv
+import click
 import os
 from datetime import datetime
 
@@ -166,6 +167,35 @@ def create_app():
     # ================= INIT MONGO =================
     mongo.init_app(app)
 
+    # ================= INDEXES =================
+    if os.getenv("ENSURE_INDEXES", "1") != "0":
+        try:
+            from services.indexes import ensure_indexes
+            for collection, names in ensure_indexes().items():
+                for name in names:
+                    if name.startswith("FAILED"):
+                        print(f"Index setup failed on {collection}: {name}")
+        except Exception as e:
+            print("Index setup failed:", e)
+
+    # ================= NOTIFICATION DISPATCHER =================
+    from services.notification_dispatcher import dispatcher
+    dispatcher.init_app(app)
+
+    # ================= PROJECTION AUDIT (DEBUG) =================
+    from services import projections
+    projections.init_app(app)
+
+    # ================= LIVE DRIVER LOCATIONS =================
+    from services.location_hub import location_hub
+    location_hub.init_app(app)
+
+    # ================= NEAREST-HUB GRID =================
+    from services.geo import WAREHOUSES, REGIONAL_WAREHOUSES
+    from services.hub_locator import get_hub_locator
+    get_hub_locator(WAREHOUSES)
+    get_hub_locator(REGIONAL_WAREHOUSES)
+
     # ================= HEALTH CHECK (DEBUG) =================
     @app.route("/__health")
     def health():
@@ -224,6 +254,59 @@ def create_app():
     app.register_blueprint(status_bp)
     app.register_blueprint(payment_bp)
 
+    # ================= CLI COMMANDS =================
+    @app.cli.command("rebuild-kpis")
+    def rebuild_kpis():
+        """Recompute the kpi_snapshots view from pickup_requests"""
+        from services.kpi_snapshots import rebuild_kpi_snapshot
+        totals = rebuild_kpi_snapshot()
+        print(f"KPI snapshot rebuilt: {totals['total_requests']} requests, {totals['total_weight']} g")
+
+    @app.cli.command("ensure-indexes")
+    def ensure_indexes_command():
+        """Apply the index manifest (idempotent)"""
+        from services.indexes import ensure_indexes
+        for collection, names in ensure_indexes().items():
+            print(f"{collection}: {', '.join(names)}")
+
+    @app.cli.command("verify-indexes")
+    def verify_indexes_command():
+        """explain() the hot route queries and flag COLLSCANs"""
+        from services.indexes import verify_indexes
+        results = verify_indexes()
+        for r in results:
+            flag = "COLLSCAN" if r["collscan"] else "ok"
+            print(f"{flag:>8}  {r['label']:<32} {r['collection']:<20} {' > '.join(r['stages'])}")
+        if any(r["collscan"] for r in results):
+            raise SystemExit(1)
+
+    @app.cli.command("backfill-geo")
+    def backfill_geo():
+        """Add GeoJSON location and geohash fields to existing pickups and clusters"""
+        from services.spatial_index import backfill_geo_fields
+        from services.incremental_clustering import backfill_cluster_geo_fields
+        print(f"Backfilled {backfill_geo_fields()} pickups")
+        print(f"Backfilled {backfill_cluster_geo_fields()} clusters")
+
+    @app.cli.command("migrate")
+    @click.argument("name")
+    @click.option("--apply", is_flag=True, help="Apply changes (otherwise dry-run)")
+    @click.option("--batch-size", type=int, default=None, help="Documents per cursor batch / bulk_write")
+    @click.option("--workers", type=int, default=1, help="Parallel _id ranges")
+    @click.option("--restart", is_flag=True, help="Ignore the saved checkpoint")
+    def migrate(name, apply, batch_size, workers, restart):
+        """Run (or dry-run) a registered data migration"""
+        from services.migrations import run_migration, MIGRATION_BATCH_SIZE
+        result = run_migration(name, apply=apply, batch_size=batch_size or MIGRATION_BATCH_SIZE,
+                               workers=workers, resume=not restart)
+        for diff in result["sample"]:
+            print(f"DOC {diff['_id']} {diff['before']} -> {diff['after']}")
+        verb = "Updated" if apply else "Would update"
+        print(f"{verb} {result['modified'] if apply else result['changed']} of {result['scanned']} documents "
+              f"in {result['seconds']}s ({result['docs_per_second']} docs/s)")
+        if result["kpis_rebuilt"]:
+            print("KPI snapshot rebuilt")
+
     # ================= ROUTES =================
     @app.route('/')
     def index():
@@ -0,0 +1,90 @@
+"""
+Benchmark the analyze-routes clustering engines on synthetic Mumbai pickups.
+
+Usage:
+  python benchmarks/bench_analyze_routes.py
+  python benchmarks/bench_analyze_routes.py --sizes 1000 10000 100000 --max-bruteforce 10000
+
+Brute force is O(N^2); above --max-bruteforce its time is projected from the
+largest measured size instead of being run.
+
+The default radius is the incremental clusterer's 15 km. analyze_routes' own
+CLUSTER_RADIUS_KM (100 km) spans the whole synthetic box, so every range query
+would return every point and the KD-tree's pruning would never be exercised.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.clustering import BruteForceEngine, KDTreeEngine, CLUSTER_WEIGHT_THRESHOLD
+
+# Rough Mumbai metropolitan bounding box
+LAT_RANGE = (18.89, 19.30)
+LNG_RANGE = (72.77, 73.10)
+# services/incremental_clustering.py CLUSTER_RADIUS_KM
+BENCH_RADIUS_KM = 15
+
+
+def synthetic_pickups(n, seed=42):
+    rng = random.Random(seed)
+    return [{
+        "_id": i,
+        "latitude": rng.uniform(*LAT_RANGE),
+        "longitude": rng.uniform(*LNG_RANGE),
+        "approx_weight": rng.randint(5, 60)
+    } for i in range(n)]
+
+
+def timed(engine, pickups, radius_km, threshold):
+    start = time.perf_counter()
+    plans = engine.plan(pickups, radius_km, threshold)
+    return time.perf_counter() - start, plans
+
+
+def plan_members(plans):
+    """Per plan, in order: (anchor _id, member _ids)"""
+    return [(plan["anchor"]["_id"], frozenset(p["_id"] for p, _ in plan["members"])) for plan in plans]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--max-bruteforce", type=int, default=10000)
+    parser.add_argument("--radius-km", type=float, default=BENCH_RADIUS_KM)
+    parser.add_argument("--threshold", type=float, default=CLUSTER_WEIGHT_THRESHOLD)
+    args = parser.parse_args()
+
+    print(f"{'pickups':>10} {'clusters':>9} {'bruteforce s':>14} {'kdtree s':>10} {'speedup':>9}")
+    last_measured = None  # (n, seconds) of the largest brute-force run
+    for n in args.sizes:
+        pickups = synthetic_pickups(n)
+        kd_time, kd_plans = timed(KDTreeEngine(), pickups, args.radius_km, args.threshold)
+
+        if n <= args.max_bruteforce:
+            bf_time, bf_plans = timed(BruteForceEngine(), pickups, args.radius_km, args.threshold)
+            assert len(bf_plans) == len(kd_plans), "engines disagree on the number of clusters"
+            for i, (bf, kd) in enumerate(zip(plan_members(bf_plans), plan_members(kd_plans))):
+                assert bf == kd, f"engines disagree on the members of cluster {i}"
+            last_measured = (n, bf_time)
+            bf_label = f"{bf_time:.3f}"
+        elif last_measured:
+            bf_time = last_measured[1] * (n / last_measured[0]) ** 2
+            bf_label = f"~{bf_time:.1f}*"
+        else:
+            bf_time = None
+            bf_label = "skipped"
+
+        speedup = f"{bf_time / kd_time:.1f}x" if bf_time else "-"
+        print(f"{n:>10} {len(kd_plans):>9} {bf_label:>14} {kd_time:>10.3f} {speedup:>9}")
+
+    if any(n > args.max_bruteforce for n in args.sizes):
+        print("* projected from the largest measured brute-force run (O(N^2))")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Compare database round-trips for the engineer dashboard: the old per-cluster
+loop (pickups $in + driver + doctor lookups per cluster) against the single
+$lookup aggregation in services/engineer_dashboard.py.
+
+Needs a reachable MongoDB (not mongomock); seeds a throwaway database and
+drops it afterwards.
+
+Usage:
+  python benchmarks/bench_engineer_dashboard.py
+  python benchmarks/bench_engineer_dashboard.py --uri mongodb://localhost:27017 --clusters 50 --stops 10
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo import MongoClient, monitoring
+
+from services.engineer_dashboard import engineer_jobs
+
+BENCH_DB = "ewaste_bench_engineer_dashboard"
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts started commands by name (find, aggregate, getMore, ...)"""
+
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        if event.database_name == BENCH_DB:
+            self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def seed(db, n_clusters, stops, seed=42):
+    rng = random.Random(seed)
+    engineer_id = ObjectId()
+    staff = [{"_id": ObjectId(), "name": f"Staff {i}", "role": role}
+             for i, role in enumerate(["driver", "doctor"] * 5)]
+    db.users.insert_many([{"_id": engineer_id, "name": "Bench Engineer", "role": "engineer"}] + staff)
+    drivers = [s for s in staff if s["role"] == "driver"]
+    doctors = [s for s in staff if s["role"] == "doctor"]
+
+    clusters = []
+    for c in range(n_clusters):
+        pickups = [{
+            "_id": ObjectId(),
+            "user_name": f"User {c}-{i}",
+            "ewaste_type": rng.choice(["Laptop", "Mobile", "Battery", "Monitor"]),
+            "address": f"{i} Bench Road",
+            "area": "Andheri",
+            "approx_weight": rng.randint(100, 5000),
+            "items": [{"type": "Laptop", "weight": 1000, "description": "bench"}],
+            "description": "x" * 200,
+            "status": "clustered"
+        } for i in range(stops)]
+        db.pickup_requests.insert_many(pickups)
+        clusters.append({
+            "engineer_id": str(engineer_id),
+            "driver_id": str(rng.choice(drivers)["_id"]),
+            "doctor_id": str(rng.choice(doctors)["_id"]),
+            "destination": "Andheri Hub",
+            "status": "assigned",
+            "user_count": stops,
+            "users": [{"user_id": p["_id"], "weight": p["approx_weight"]} for p in pickups]
+        })
+    db.collection_clusters.insert_many(clusters)
+    db.collection_clusters.create_index([("engineer_id", 1), ("status", 1)])
+    return str(engineer_id)
+
+
+def legacy_engineer_jobs(db, engineer_id):
+    """The dashboard loop before the aggregation (kept here for comparison)"""
+    jobs = []
+    for c in db.collection_clusters.find({"engineer_id": engineer_id}):
+        u_ids = [u["user_id"] for u in c.get("users", [])]
+        pickups = list(db.pickup_requests.find({"_id": {"$in": u_ids}})) if u_ids else []
+        driver = doctor = None
+        if c.get("driver_id") and ObjectId.is_valid(c["driver_id"]):
+            driver = db.users.find_one({"_id": ObjectId(c["driver_id"])})
+        if c.get("doctor_id") and ObjectId.is_valid(c["doctor_id"]):
+            doctor = db.users.find_one({"_id": ObjectId(c["doctor_id"])})
+        jobs.append({"cluster": c, "pickups": pickups, "driver": driver, "doctor": doctor})
+    return jobs
+
+
+def job_ids(jobs):
+    """{cluster _id: (pickup _ids, driver _id, doctor _id)}, to compare the two versions"""
+    return {
+        j["cluster"]["_id"]: (
+            frozenset(p["_id"] for p in j["pickups"]),
+            j["driver"]["_id"] if j["driver"] else None,
+            j["doctor"]["_id"] if j["doctor"] else None
+        )
+        for j in jobs
+    }
+
+
+def measure(counter, fn):
+    counter.commands.clear()
+    start = time.perf_counter()
+    jobs = fn()
+    return jobs, time.perf_counter() - start, sum(counter.commands.values()), dict(counter.commands)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--stops", type=int, default=10)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = MongoClient(args.uri, event_listeners=[counter])
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    try:
+        engineer_id = seed(db, args.clusters, args.stops)
+
+        before, before_s, before_n, before_cmds = measure(counter, lambda: legacy_engineer_jobs(db, engineer_id))
+        after, after_s, after_n, after_cmds = measure(counter, lambda: engineer_jobs(engineer_id, db))
+
+        assert len(before) == len(after) == args.clusters, "cluster counts differ"
+        before_ids, after_ids = job_ids(before), job_ids(after)
+        for cluster_id, (pickups, driver, doctor) in before_ids.items():
+            assert cluster_id in after_ids, f"cluster {cluster_id} missing"
+            assert after_ids[cluster_id][0] == pickups, f"cluster {cluster_id}: pickups differ"
+            assert after_ids[cluster_id][1:] == (driver, doctor), f"cluster {cluster_id}: driver/doctor differ"
+        assert all(j["driver"] and j["doctor"] for j in after), "staff lookup missed"
+
+        print(f"engineer with {args.clusters} clusters x {args.stops} stops")
+        print(f"{'version':>12} {'round-trips':>12} {'ms':>9}  commands")
+        print(f"{'per-cluster':>12} {before_n:>12} {before_s * 1000:>9.1f}  {before_cmds}")
+        print(f"{'aggregate':>12} {after_n:>12} {after_s * 1000:>9.1f}  {after_cmds}")
+    finally:
+        client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+Gunicorn settings (loaded automatically from the working directory).
+
+Driver-location streams (services/location_hub.py) keep their request open, so
+each one occupies a thread: gthread workers serve them alongside normal
+requests instead of one stream blocking a whole sync worker.
+"""
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:" + os.getenv("PORT", "8000"))
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+# Streams send a heartbeat every 15s and end after LOCATION_STREAM_MAX_SECONDS
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
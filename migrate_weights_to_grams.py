@@ -1,77 +1,66 @@
 """
 Migration helper: multiply weight fields by 1000 when values appear to be in kilograms (small values).
+Runs the "weights_to_grams" migration from services/migrations.py: pickups are
+streamed in batches, bulk-written, checkpointed on the last _id (a rerun
+resumes) and optionally split over parallel _id ranges.
 Usage:
-  python migrate_weights_to_grams.py        # dry-run
+  python migrate_weights_to_grams.py        # dry-run (counts + sampled diffs)
   python migrate_weights_to_grams.py --apply
+  python migrate_weights_to_grams.py --apply --workers 4 --batch-size 2000
+  python migrate_weights_to_grams.py --apply --restart    # ignore the saved progress (pickups created
+                                                          # after the first applied run stay untouched)
 """
 
-from pymongo import MongoClient
 import argparse
+import os
+from pymongo import MongoClient
+from services.migrations import run_migration, MIGRATION_BATCH_SIZE, DIFF_SAMPLE_SIZE
 
 # 🔥 Explicit DB name + timeout
-MONGO_URI = (
+MONGO_URI = os.getenv("MONGO_URI", (
     "mongodb+srv://darpanmeher1346_db_user:E8kreTF6Z8G5mFbn"
     "@cluster0.mhkyevr.mongodb.net/ewaste_db"
     "?retryWrites=true&w=majority"
-)
-
-client = MongoClient(
-    MONGO_URI,
-    serverSelectionTimeoutMS=5000
-)
-
-# 🔥 Fail fast if Mongo is unreachable
-client.admin.command("ping")
-
-db = client["ewaste_db"]
-pickups = db.pickup_requests
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--apply', action='store_true', help='Apply changes (otherwise dry-run)')
-args = parser.parse_args()
-
-# Fields to consider
-weight_fields = ['approx_weight', 'ewaste_weight', 'final_weight']
-
-# Collect updates per document
-updates = {}
+))
 
-for doc in pickups.find():
-    doc_updates = {}
-    for wf in weight_fields:
-        val = doc.get(wf)
-        try:
-            num = float(val)
-        except Exception:
-            continue
 
-        # Heuristic: kg → grams
-        if 0 < num < 1000:
-            doc_updates[wf] = num * 1000
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--apply', action='store_true', help='Apply changes (otherwise dry-run)')
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE, help='Documents per cursor batch / bulk_write')
+    parser.add_argument('--workers', type=int, default=1, help='Parallel _id ranges')
+    parser.add_argument('--sample', type=int, default=DIFF_SAMPLE_SIZE, help='Diffs to show')
+    parser.add_argument('--restart', action='store_true', help='Ignore the saved checkpoint')
+    args = parser.parse_args()
 
-    if doc_updates:
-        updates[doc['_id']] = doc_updates
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    # 🔥 Fail fast if Mongo is unreachable
+    client.admin.command("ping")
+    db = client["ewaste_db"]
 
-print(f'Found {sum(len(v) for v in updates.values())} candidate fields across {len(updates)} documents.')
+    result = run_migration(
+        "weights_to_grams",
+        apply=args.apply,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        resume=not args.restart,
+        sample_size=args.sample,
+        db=db
+    )
 
-if not args.apply:
-    print('Dry run mode. Use --apply to perform updates.')
-    shown = 0
-    for _id, fields in updates.items():
-        for f, v in fields.items():
-            print(f'DOC {_id} {f} -> {v}')
-            shown += 1
-            if shown >= 50:
-                break
-        if shown >= 50:
-            break
-else:
-    print('Applying updates...')
-    updated = 0
-    for _id, fields in updates.items():
-        pickups.update_one({'_id': _id}, {'$set': fields})
-        updated += len(fields)
+    for diff in result['sample']:
+        print(f"DOC {diff['_id']} {diff['before']} -> {diff['after']}")
+    print(f"Scanned {result['scanned']} documents in {result['ranges']} range(s), "
+          f"{result['seconds']}s ({result['docs_per_second']} docs/s).")
+    if not args.apply:
+        print(f"Found {result['changed']} documents to update.")
+        print('Dry run mode. Use --apply to perform updates.')
+    else:
+        print(f"Updated {result['modified']} of {result['changed']} documents.")
+        if result['kpis_rebuilt']:
+            print('KPI snapshot rebuilt with the new weights.')
+    print('Done.')
 
-    print(f'Updated {updated} fields.')
 
-print('Done.')
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
-from flask import Blueprint, render_template, session, redirect, url_for
+from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify
 from routes.auth_routes import login_required
 from mongo import mongo
+from services.pagination import keyset_page, page_size, serialize
+from services.projections import FieldSet
 
 all_users_bp = Blueprint('all_users', __name__)
 
+USER_LIST_FIELDS = FieldSet("admin.users", "name", "email", "role", "mobile")
+
 @all_users_bp.route('/users')
 @login_required
 def all_users_page():
@@ -11,5 +15,24 @@ def all_users_page():
     if session.get('role') not in ['admin', 'warehouse']:
         return redirect('/')
 
-    users = list(mongo.db.users.find())
-    return render_template('all_users.html', users=users, user_role=session.get('role'))
+    users, next_cursor = keyset_page(mongo.db.users, {}, "_id", projection=USER_LIST_FIELDS)
+    return render_template('all_users.html', users=users, next_cursor=next_cursor, user_role=session.get('role'))
+
+@all_users_bp.route('/api/users')
+@login_required
+def users_api():
+    """Next page of users: {users, html, next_cursor}"""
+    if session.get('role') not in ['admin', 'warehouse']:
+        return jsonify({"error": "Unauthorized"}), 403
+    try:
+        users, next_cursor = keyset_page(
+            mongo.db.users, {}, "_id",
+            request.args.get("cursor"), page_size(request.args.get("limit")), USER_LIST_FIELDS
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "users": [serialize(u, list(USER_LIST_FIELDS)) for u in users],
+        "html": render_template('_user_rows.html', users=users),
+        "next_cursor": next_cursor
+    })
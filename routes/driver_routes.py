@@ -2,9 +2,17 @@ from flask import Blueprint, render_template, session, redirect, url_for, jsonif
 from bson import ObjectId
 from datetime import timedelta, datetime
 from mongo import mongo
+from routes.notification_routes import create_notifications
+from services.location_hub import location_hub
+from services.breadcrumbs import compact_track
+from services.route_optimizer import ordered_pickups
+from services.projections import FieldSet
 
 driver_bp = Blueprint('driver', __name__)
 
+JOB_FIELDS = FieldSet('driver.jobs', 'destination', 'status', 'user_count', 'users.user_id', 'route_distance_km', 'scheduled_for', 'estimated_duration_minutes')
+JOB_PICKUP_FIELDS = FieldSet('driver.job_pickups', 'user_name', 'ewaste_type', 'address', 'area', 'approx_weight', 'ewaste_weight')
+
 
 @driver_bp.route('/driver/dashboard')
 def dashboard():
@@ -14,14 +22,14 @@ def dashboard():
     driver_id = session.get('user_id')
 
     # Find clusters assigned to this driver
-    clusters = list(mongo.db.collection_clusters.find({'driver_id': driver_id}))
+    clusters = JOB_FIELDS.find(mongo.db.collection_clusters, {'driver_id': driver_id})
 
     clusters_with_pickups = []
     for c in clusters:
         u_ids = [u['user_id'] for u in c.get('users', [])]
         pickup_docs = []
         if u_ids:
-            pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+            pickup_docs = JOB_PICKUP_FIELDS.find(mongo.db.pickup_requests, {'_id': {'$in': u_ids}})
 
         # compute schedule times
         scheduled_for = c.get('scheduled_for')
@@ -60,12 +68,8 @@ def route_view(cluster_id):
     if not cluster:
         return redirect(url_for('driver.dashboard'))
     
-    # Get all user pickups in the cluster
-    u_ids = [u['user_id'] for u in cluster.get('users', [])]
-    pickup_docs = []
-    
-    if u_ids:
-        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+    # Cluster pickups in optimized stop order (see services/route_optimizer.py)
+    pickup_docs, route_plan = ordered_pickups(cluster)
     
     # Prepare waypoints with coordinates
     waypoints = []
@@ -99,8 +103,12 @@ def share_route():
             'status': 'active'
         }
         
-        # Store route in real-time tracking collection
-        mongo.db.active_routes.insert_one(route_data)
+        # Keep one active route document per driver, updated at each stop
+        mongo.db.active_routes.update_one(
+            {'driver_id': driver_id, 'status': 'active'},
+            {'$set': route_data},
+            upsert=True
+        )
         
         # Notify engineers assigned to this driver
         engineers = list(mongo.db.users.find(
@@ -108,16 +116,15 @@ def share_route():
             {'_id': 1}
         ))
         
-        for engineer in engineers:
-            mongo.db.notifications.insert_one({
-                'engineer_id': engineer['_id'],
-                'type': 'route_update',
-                'driver_id': driver_id,
-                'message': f"Driver {route_data['driver_name']} is at Stop {route_data['route'].get('stopNumber', 0)}",
-                'route_data': route_data['route'],
-                'timestamp': datetime.now(),
-                'read': False
-            })
+        create_notifications([{
+            'engineer_id': engineer['_id'],
+            'type': 'route_update',
+            'driver_id': driver_id,
+            'message': f"Driver {route_data['driver_name']} is at Stop {route_data['route'].get('stopNumber', 0)}",
+            'route_data': route_data['route'],
+            'timestamp': datetime.now(),
+            'read': False
+        } for engineer in engineers])
         
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -134,19 +141,13 @@ def update_location():
     data = request.get_json()
     
     try:
-        # Update driver location in database
-        mongo.db.driver_locations.update_one(
-            {'driver_id': driver_id},
-            {
-                '$set': {
-                    'lat': data.get('lat'),
-                    'lng': data.get('lng'),
-                    'stopNumber': data.get('stopNumber', 0),
-                    'timestamp': datetime.fromisoformat(data.get('timestamp', datetime.now().isoformat()))
-                }
-            },
-            upsert=True
-        )
+        # Fan out to live subscribers; Mongo is written by the hub's throttled flusher
+        location_hub.publish(driver_id, {
+            'lat': data.get('lat'),
+            'lng': data.get('lng'),
+            'stopNumber': data.get('stopNumber', 0),
+            'timestamp': datetime.fromisoformat(data.get('timestamp', datetime.now().isoformat()))
+        })
         
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -169,6 +170,10 @@ def trip_complete():
             {'$set': {'status': 'completed', 'completed_at': datetime.now()}}
         )
         
+        # Simplify and pack today's breadcrumb track
+        location_hub.flush()
+        compact_track(driver_id)
+
         # Get driver name
         driver = mongo.db.users.find_one({'_id': ObjectId(driver_id)}, {'name': 1})
         
@@ -178,15 +183,14 @@ def trip_complete():
             {'_id': 1}
         ))
         
-        for engineer in engineers:
-            mongo.db.notifications.insert_one({
-                'engineer_id': engineer['_id'],
-                'type': 'trip_complete',
-                'driver_id': driver_id,
-                'message': f"Driver {driver.get('name', 'Unknown')} completed all {data.get('completedStops', 0)} stops",
-                'timestamp': datetime.now(),
-                'read': False
-            })
+        create_notifications([{
+            'engineer_id': engineer['_id'],
+            'type': 'trip_complete',
+            'driver_id': driver_id,
+            'message': f"Driver {driver.get('name', 'Unknown')} completed all {data.get('completedStops', 0)} stops",
+            'timestamp': datetime.now(),
+            'read': False
+        } for engineer in engineers])
         
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -1,12 +1,16 @@
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, current_app
 from bson import ObjectId
 from datetime import datetime
+import hashlib
+import json
 from mongo import mongo
-try:
-    from services.pricing_engine import calculate_final_price
-except Exception:
-    # Fallback to top-level pricing_engine if services package import fails
-    from pricing_engine import calculate_final_price
+from pymongo import ReturnDocument
+from services.kpi_snapshots import record_status_change
+from services.location_hub import location_hub
+from services.breadcrumbs import load_trail, SIMPLIFY_EPSILON_M
+from services.route_optimizer import ordered_pickups
+from services.engineer_dashboard import engineer_jobs
+from services.pricing_engine import calculate_final_price, pricing_engine
 
 engineer_bp = Blueprint("engineer", __name__)
 
@@ -17,41 +21,9 @@ def dashboard():
         return redirect("/")
 
     engineer_id = session["user_id"]
-    
-    # 1. Find clusters assigned to this engineer
-    assigned_clusters = list(mongo.db.collection_clusters.find({
-        "engineer_id": engineer_id
-    }))
-    
-    # 2. Get individual pickups from these clusters
-    pickup_ids = []
-    for c in assigned_clusters:
-        for u in c.get("users", []):
-            pickup_ids.append(u["user_id"])
-            
-    # 3. Fetch pickup details grouped by cluster
-    clusters_with_pickups = []
-    for c in assigned_clusters:
-        u_ids = [u['user_id'] for u in c.get('users', [])]
-        pickup_docs = []
-        if u_ids:
-            pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
-
-        # Attach driver and doctor info
-        driver = None
-        doctor = None
-        if c.get('driver_id'):
-            driver = mongo.db.users.find_one({'_id': ObjectId(c['driver_id'])}) if ObjectId.is_valid(c['driver_id']) else None
-        if c.get('doctor_id'):
-            doctor = mongo.db.users.find_one({'_id': ObjectId(c['doctor_id'])}) if ObjectId.is_valid(c['doctor_id']) else None
-
-        c['_id_str'] = str(c.get('_id'))
-        clusters_with_pickups.append({
-            'cluster': c,
-            'pickups': pickup_docs,
-            'driver': driver,
-            'doctor': doctor
-        })
+
+    # Assigned clusters with their pickups, driver and doctor in one aggregation
+    clusters_with_pickups = engineer_jobs(engineer_id)
 
     return render_template(
         "engineer/engineer_dashboard.html",
@@ -117,6 +89,42 @@ def calculate_price_api():
     return jsonify(pricing)
 
 
+# ---------------- BATCH PRICE API ----------------
+MAX_PRICE_ITEMS = 200
+
+
+@engineer_bp.route("/engineer/calculate-price/batch", methods=["POST"])
+def calculate_price_batch_api():
+    """
+    Price every line item of an inspection in one call.
+    Body: {"items": [{category, weight (g), condition, age_years}, ...]}.
+    The ETag hashes the items plus the rates' content fingerprint (identical
+    across workers), so a client that resends unchanged items with
+    If-None-Match gets a 304 until a rate actually changes.
+    """
+    items = (request.get_json(silent=True) or {}).get("items")
+    if not isinstance(items, list) or not items or len(items) > MAX_PRICE_ITEMS:
+        return jsonify({"error": f"items must be a list of 1-{MAX_PRICE_ITEMS} line items"}), 400
+
+    snapshot = pricing_engine.snapshot()
+    canonical = json.dumps(items, sort_keys=True, separators=(",", ":"))
+    etag = hashlib.sha256(f"{snapshot.fingerprint}:{canonical}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        pricing = pricing_engine.price_many(items, snapshot)
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({"error": "Each item needs a numeric weight and age_years"}), 400
+
+    response = jsonify(pricing)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
 # ---------------- FINAL SUBMISSION ----------------
 @engineer_bp.route("/engineer/submit/<pickup_id>", methods=["POST"])
 def submit_inspection(pickup_id):
@@ -127,14 +135,18 @@ def submit_inspection(pickup_id):
     final_price = payload.get("total_price")
 
     # Update pickup request with final price and status
-    mongo.db.pickup_requests.update_one(
+    previous = mongo.db.pickup_requests.find_one_and_update(
         {"_id": ObjectId(pickup_id)},
         {"$set": {
             "status": "collected", # Mark as collected after inspection
             "engineer_price": final_price,
             "inspected_at": datetime.utcnow()
-        }}
+        }},
+        projection={"status": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    if previous:
+        record_status_change(previous.get("status"), "collected")
 
     return jsonify({"success": True})
 
@@ -159,16 +171,18 @@ def accept_inspection(pickup_id):
     engineer_id = session['user_id']
     estimated_price = request.json.get('price', 0)
     
-    # Update pickup with acceptance
-    mongo.db.pickup_requests.update_one(
-        {'_id': ObjectId(pickup_id)},
-        {'$set': {
-            'inspection_status': 'accepted',
-            'engineer_price': estimated_price,
-            'engineer_id': engineer_id,
-            'accepted_at': datetime.utcnow()
-        }}
-    )
+    # Update pickup with acceptance (condition/age are kept for later repricing)
+    accepted = {
+        'inspection_status': 'accepted',
+        'engineer_price': estimated_price,
+        'engineer_id': engineer_id,
+        'accepted_at': datetime.utcnow()
+    }
+    if request.json.get('condition'):
+        accepted['condition'] = request.json['condition']
+    if request.json.get('age_years') is not None:
+        accepted['age_years'] = int(request.json['age_years'])
+    mongo.db.pickup_requests.update_one({'_id': ObjectId(pickup_id)}, {'$set': accepted})
     
     # Fetch user and notify them
     pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
@@ -231,25 +245,28 @@ def mark_collected(pickup_id):
     final_quality = request.json.get('quality', 'good')
     
     # Update pickup status to 'collected'
-    mongo.db.pickup_requests.update_one(
+    pickup = mongo.db.pickup_requests.find_one_and_update(
         {'_id': ObjectId(pickup_id)},
         {'$set': {
             'status': 'collected',
             'engineer_id': engineer_id,
             'final_weight': final_weight,
+            'weight_unit': 'g',
             'final_quality': final_quality,
             'collected_at': datetime.utcnow()
-        }}
+        }},
+        projection={'status': 1, 'user_id': 1},
+        return_document=ReturnDocument.BEFORE
     )
     
     # Notify user that collection is complete
-    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
     if pickup:
+        record_status_change(pickup.get('status'), 'collected')
         from routes.notification_routes import create_notification
         create_notification(
             recipient_id=str(pickup.get('user_id')),
             title='Item Collected',
-            message=f'Your e-waste has been successfully collected (Weight: {final_weight}kg). It is now at our warehouse.',
+            message=f'Your e-waste has been successfully collected (Weight: {final_weight}g). It is now at our warehouse.',
             notification_type='item_collected',
             related_data={'pickup_id': str(pickup_id), 'weight': final_weight}
         )
@@ -268,11 +285,8 @@ def route_view(cluster_id):
     if not cluster:
         return redirect(url_for('engineer.dashboard'))
     
-    # Get all user pickups in the cluster
-    u_ids = [u['user_id'] for u in cluster.get('users', [])]
-    pickup_docs = []
-    if u_ids:
-        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+    # Cluster pickups in optimized stop order (see services/route_optimizer.py)
+    pickup_docs, route_plan = ordered_pickups(cluster)
     
     waypoints = []
     for pickup in pickup_docs:
@@ -305,18 +319,33 @@ def track_driver(driver_id):
     ).sort('timestamp', -1).limit(10))
     
     # Get current location
-    current_location = mongo.db.driver_locations.find_one(
-        {'driver_id': driver_id}
-    )
+    current_location = location_hub.get_location(driver_id)
+
+    # Today's simplified breadcrumb trail for replay
+    trail = load_trail(driver_id)
     
     return render_template(
         'engineer/track_driver.html',
         driver=driver,
         active_routes=active_routes,
-        current_location=current_location
+        current_location=current_location,
+        trail=trail
     )
 
 
+@engineer_bp.route("/api/engineer/driver-trail/<driver_id>")
+def get_driver_trail(driver_id):
+    """Simplified breadcrumb trail for one day (?day=YYYY-MM-DD, default today)"""
+    if session.get("role") != "engineer":
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        epsilon = float(request.args.get('epsilon', SIMPLIFY_EPSILON_M))
+        return jsonify(load_trail(driver_id, request.args.get('day'), epsilon)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @engineer_bp.route("/api/engineer/driver-location/<driver_id>")
 def get_driver_location(driver_id):
     """Get current driver location (for AJAX updates)"""
@@ -324,9 +353,7 @@ def get_driver_location(driver_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        location = mongo.db.driver_locations.find_one({'driver_id': driver_id})
-        if location:
-            location['_id'] = str(location['_id'])
+        location = location_hub.get_location(driver_id)
         return jsonify(location or {}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
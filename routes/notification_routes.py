@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, session, redirect, request
 from mongo import mongo
 from bson import ObjectId
 from datetime import datetime
+from services.notification_dispatcher import dispatcher
 
 notification_bp = Blueprint('notification', __name__, url_prefix='/notifications')
 
@@ -50,20 +51,30 @@ def unread_count():
     
     return jsonify({'unread': count})
 
+def build_notification(recipient_id, title, message, notification_type, related_data=None):
+    return {
+        'recipient_id': recipient_id,
+        'title': title,
+        'message': message,
+        'type': notification_type,  # 'cluster_assigned', 'engineer_coming', 'inspection_accepted', etc.
+        'read': False,
+        'related_data': related_data or {},
+        'created_at': datetime.utcnow()
+    }
+
 def create_notification(recipient_id, title, message, notification_type, related_data=None):
-    """Helper to create a notification"""
+    """Helper to create a notification (published asynchronously)"""
     try:
-        notif = {
-            'recipient_id': recipient_id,
-            'title': title,
-            'message': message,
-            'type': notification_type,  # 'cluster_assigned', 'engineer_coming', 'inspection_accepted', etc.
-            'read': False,
-            'related_data': related_data or {},
-            'created_at': datetime.utcnow()
-        }
-        result = mongo.db.notifications.insert_one(notif)
-        return str(result.inserted_id)
+        notif = build_notification(recipient_id, title, message, notification_type, related_data)
+        return dispatcher.enqueue(notif)
     except Exception as e:
         print(f"Error creating notification: {e}")
         return None
+
+def create_notifications(notifications):
+    """Queue many notifications (dicts from build_notification or raw docs) in one call"""
+    try:
+        return dispatcher.enqueue_many(notifications)
+    except Exception as e:
+        print(f"Error creating notifications: {e}")
+        return []
@@ -1,31 +1,70 @@
-from flask import Blueprint, render_template, redirect, session, flash, url_for
+from flask import Blueprint, render_template, redirect, session, flash, url_for, request, jsonify
 from mongo import mongo
 from bson import ObjectId
+from pymongo import ReturnDocument
+from services.kpi_snapshots import record_status_change
+from services.pagination import keyset_page, page_size, serialize
+from services.projections import FieldSet
 
 recycler_bp = Blueprint('recycler', __name__, url_prefix='/recycler')
 
+ITEM_LIST_FIELDS = FieldSet('recycler.items', 'ewaste_type', 'approx_weight', 'area', 'updated_at')
+ITEM_PARTIALS = {
+    'collected': 'recycler/_collected_rows.html',
+    'recycled': 'recycler/_recycled_cards.html'
+}
+
 @recycler_bp.route('/dashboard')
 def dashboard():
     if session.get('role') != 'recycler':
         return redirect('/')
 
     # Fetch items that have been collected by engineers (Ready for recycling)
-    collected_items = list(mongo.db.pickup_requests.find({'status': 'collected'}).sort('updated_at', -1))
+    collected_items, collected_cursor = keyset_page(mongo.db.pickup_requests, {'status': 'collected'}, 'updated_at', projection=ITEM_LIST_FIELDS)
     
     # Fetch history of recycled items
-    recycled_items = list(mongo.db.pickup_requests.find({'status': 'recycled'}).sort('updated_at', -1))
+    recycled_items, recycled_cursor = keyset_page(mongo.db.pickup_requests, {'status': 'recycled'}, 'updated_at', projection=ITEM_LIST_FIELDS)
+
+    return render_template(
+        'recycler/dashboard.html',
+        collected=collected_items, collected_cursor=collected_cursor,
+        recycled=recycled_items, recycled_cursor=recycled_cursor
+    )
 
-    return render_template('recycler/dashboard.html', collected=collected_items, recycled=recycled_items)
+@recycler_bp.route('/api/items')
+def items_api():
+    """Next page of collected or recycled items: {items, html, next_cursor}"""
+    if session.get('role') != 'recycler':
+        return jsonify({'error': 'Unauthorized'}), 403
+    status = request.args.get('status', 'collected')
+    if status not in ITEM_PARTIALS:
+        return jsonify({'error': 'status must be collected or recycled'}), 400
+    try:
+        items, next_cursor = keyset_page(
+            mongo.db.pickup_requests, {'status': status}, 'updated_at',
+            request.args.get('cursor'), page_size(request.args.get('limit')), ITEM_LIST_FIELDS
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'items': [serialize(i, list(ITEM_LIST_FIELDS)) for i in items],
+        'html': render_template(ITEM_PARTIALS[status], **{status: items}),
+        'next_cursor': next_cursor
+    })
 
 @recycler_bp.route('/process/<request_id>')
 def process_item(request_id):
     if session.get('role') != 'recycler':
         return redirect('/')
     
-    mongo.db.pickup_requests.update_one(
+    previous = mongo.db.pickup_requests.find_one_and_update(
         {'_id': ObjectId(request_id)},
-        {'$set': {'status': 'recycled'}}
+        {'$set': {'status': 'recycled'}},
+        projection={'status': 1},
+        return_document=ReturnDocument.BEFORE
     )
+    if previous:
+        record_status_change(previous.get('status'), 'recycled')
     
     flash('Item processed and recycled successfully.', 'success')
     return redirect(url_for('recycler.dashboard'))
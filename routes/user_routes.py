@@ -1,37 +1,87 @@
-from flask import Blueprint, render_template, request, redirect, session, flash
+from flask import Blueprint, render_template, request, redirect, session, flash, jsonify
 from mongo import mongo
 from datetime import datetime
 from bson import ObjectId
-import math
+from services.kpi_snapshots import record_pickup_created
+from services.spatial_index import geo_fields
+from services.incremental_clustering import assign_pickup
+from services.pagination import keyset_page, page_size, serialize
+from services.projections import FieldSet
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
 
-@user_bp.route('/dashboard')
-def dashboard():
-    if session.get('role') != 'user':
-        return redirect('/')
+REQUEST_PARTIALS = {
+    'dashboard': 'user/_request_cards.html',
+    'request': 'user/_request_pickup_cards.html'
+}
+REQUEST_FIELDS = {
+    'dashboard': FieldSet('user.dashboard_requests', 'ewaste_type', 'area', 'status', 'approx_weight', 'created_at'),
+    'request': FieldSet('user.pickup_requests', 'ewaste_type', 'area', 'status', 'approx_weight', 'engineer_price', 'items', 'created_at')
+}
+
 
+def _user_query():
     # Handle both ObjectId and email-based user_id (for demo users)
     user_id = session['user_id']
     try:
-        from bson import ObjectId
-        user_query = {'$or': [{'user_id': user_id}, {'user_id': ObjectId(user_id)}]}
+        return {'$or': [{'user_id': user_id}, {'user_id': ObjectId(user_id)}]}
     except Exception:
-        user_query = {'user_id': user_id}
+        return {'user_id': user_id}
 
-    # Fetch requests for this user, sorted by newest first
-    requests = list(mongo.db.pickup_requests.find(user_query).sort('created_at', -1))
 
-    # Calculate total weight for profile panel
+def _request_summary(user_query):
+    """Total donated weight, request count and pending count in one aggregation"""
     pipeline = [
         {'$match': user_query},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$approx_weight', '$ewaste_weight']}}}}
+        {'$group': {
+            '_id': None,
+            'total': {'$sum': {'$ifNull': ['$approx_weight', '$ewaste_weight']}},
+            'count': {'$sum': 1},
+            'pending': {'$sum': {'$cond': [{'$eq': ['$status', 'pending']}, 1, 0]}}
+        }}
     ]
-    weight_res = list(mongo.db.pickup_requests.aggregate(pipeline))
-    total_donated = weight_res[0]['total'] if weight_res else 0
+    res = list(mongo.db.pickup_requests.aggregate(pipeline))
+    return res[0] if res else {'total': 0, 'count': 0, 'pending': 0}
 
-    return render_template('user/dashboard.html', requests=requests, total_donated=total_donated)
+
+@user_bp.route('/dashboard')
+def dashboard():
+    if session.get('role') != 'user':
+        return redirect('/')
+
+    user_query = _user_query()
+
+    # First page of requests, newest first; the rest loads from /api/requests
+    requests, next_cursor = keyset_page(mongo.db.pickup_requests, user_query, 'created_at', projection=REQUEST_FIELDS['dashboard'])
+
+    # Totals for the profile panel and stat cards
+    summary = _request_summary(user_query)
+
+    return render_template('user/dashboard.html', requests=requests, next_cursor=next_cursor,
+                           summary=summary, total_donated=summary['total'])
+
+
+@user_bp.route('/api/requests')
+def requests_api():
+    """Next page of the user's requests: {requests, html, next_cursor}"""
+    if session.get('role') != 'user':
+        return jsonify({'error': 'Unauthorized'}), 403
+    view = request.args.get('view', 'dashboard')
+    if view not in REQUEST_PARTIALS:
+        return jsonify({'error': 'view must be dashboard or request'}), 400
+    try:
+        requests, next_cursor = keyset_page(
+            mongo.db.pickup_requests, _user_query(), 'created_at',
+            request.args.get('cursor'), page_size(request.args.get('limit')), REQUEST_FIELDS[view]
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'requests': [serialize(r, list(REQUEST_FIELDS[view])) for r in requests],
+        'html': render_template(REQUEST_PARTIALS[view], requests=requests),
+        'next_cursor': next_cursor
+    })
 
 
 @user_bp.route('/request', methods=['GET', 'POST'])
@@ -39,27 +89,14 @@ def create_request():
     if session.get('role') != 'user':
         return redirect('/')
     
-    # Handle both ObjectId and email-based user_id (for demo users)
-    user_id = session['user_id']
-    try:
-        from bson import ObjectId
-        user_query = {'$or': [{'user_id': user_id}, {'user_id': ObjectId(user_id)}]}
-    except Exception:
-        user_query = {'user_id': user_id}
-    
     if request.method == 'GET':
-        # Render the pickup request form (preserve existing behavior)
-        # Ensure we pass a list (not a Cursor) so templates can use length/iteration safely
-        requests = list(mongo.db.pickup_requests.find(user_query).sort('created_at', -1))
+        # Render the pickup request form with the first page of the user's requests
+        user_query = _user_query()
+        requests, next_cursor = keyset_page(mongo.db.pickup_requests, user_query, 'created_at', projection=REQUEST_FIELDS['request'])
+        summary = _request_summary(user_query)
 
-        pipeline = [
-            {'$match': user_query},
-            {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$approx_weight', '$ewaste_weight']}}}}
-        ]
-        weight_res = list(mongo.db.pickup_requests.aggregate(pipeline))
-        total_donated = weight_res[0]['total'] if weight_res else 0
-
-        return render_template('user/request_pickup.html', requests=requests, total_donated=total_donated)
+        return render_template('user/request_pickup.html', requests=requests, next_cursor=next_cursor,
+                               total_donated=summary['total'])
 
     try:
         # 1. Handle Multiple Items (Arrays from form)
@@ -107,6 +144,7 @@ def create_request():
             'ewaste_type': final_ewaste_type,
             'description': final_description,
             'approx_weight': total_weight,
+            'weight_unit': 'g',  # keeps weights_to_grams from converting it again
             'items': items,
             'latitude': float(lat) if lat else None,
             'longitude': float(lng) if lng else None,
@@ -118,104 +156,26 @@ def create_request():
             'inspection_status': None,  # pending, accepted, rejected
             'created_at': datetime.utcnow()
         }
+        if lat and lng:
+            data.update(geo_fields(float(lat), float(lng)))
 
         result = mongo.db.pickup_requests.insert_one(data)
         pickup_id = result.inserted_id
+        record_pickup_created(data)
         
         # ============ AUTO-CLUSTER FORMATION ============
-        CLUSTER_RADIUS_KM = 15
-        CLUSTER_MIN_WEIGHT = 50
-        CLUSTER_MAX_WEIGHT = 150
-        
         lat_pickup = float(lat) if lat else None
         lng_pickup = float(lng) if lng else None
         
         if lat_pickup and lng_pickup:
-            nearby = list(mongo.db.pickup_requests.find({
-                'status': {'$in': ['pending', 'clustered']},
-                'cluster_id': {'$exists': False}
-            }))
-            
-            def haversine_km(lat1, lon1, lat2, lon2):
-                R = 6371
-                d_lat = math.radians(lat2 - lat1)
-                d_lon = math.radians(lon2 - lon1)
-                a = (math.sin(d_lat/2)**2 + 
-                     math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon/2)**2)
-                return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1-a))
-            
-            cluster_users = [{
-                'user_id': pickup_id,
-                'weight': total_weight,
-                'distance_km': 0
-            }]
-            total_cluster_weight = total_weight
-            
-            for p in nearby:
-                if p['_id'] == pickup_id:
-                    continue
-                p_lat = p.get('latitude')
-                p_lng = p.get('longitude')
-                if not (p_lat and p_lng):
-                    continue
-                
-                dist = haversine_km(lat_pickup, lng_pickup, p_lat, p_lng)
-                p_weight = p.get('approx_weight', p.get('ewaste_weight', 0))
-                
-                if dist <= CLUSTER_RADIUS_KM and total_cluster_weight + p_weight <= CLUSTER_MAX_WEIGHT:
-                    cluster_users.append({
-                        'user_id': p['_id'],
-                        'weight': p_weight,
-                        'distance_km': round(dist, 2)
-                    })
-                    total_cluster_weight += p_weight
-            
-            if total_cluster_weight >= CLUSTER_MIN_WEIGHT:
-                cluster_status = 'ready'
-            elif total_cluster_weight >= CLUSTER_MIN_WEIGHT * 0.7:
-                cluster_status = 'almost_ready'
-            else:
-                cluster_status = 'pending'
-            
-            WAREHOUSES = [
-                {"name": "North Warehouse (Borivali)", "lat": 19.2300, "lng": 72.8567},
-                {"name": "West Warehouse (Andheri)", "lat": 19.1136, "lng": 72.8697},
-                {"name": "East Warehouse (Thane)", "lat": 19.2183, "lng": 72.9781},
-                {"name": "South Warehouse (Colaba)", "lat": 18.9067, "lng": 72.8147},
-                {"name": "CENTRAL HUB (Ghatkopar)", "lat": 19.0860, "lng": 72.9090}
-            ]
-            nearest_wh = min(WAREHOUSES, key=lambda wh: haversine_km(lat_pickup, lng_pickup, wh['lat'], wh['lng']))
-            dist_to_hub = haversine_km(lat_pickup, lng_pickup, nearest_wh['lat'], nearest_wh['lng'])
-            
-            cluster_doc = {
-                'anchor_user_id': pickup_id,
-                'anchor_location': {'lat': lat_pickup, 'lng': lng_pickup},
-                'destination': nearest_wh['name'],
-                'dist_to_hub': round(dist_to_hub, 2),
-                'users': cluster_users,
-                'total_weight': total_cluster_weight,
-                'user_count': len(cluster_users),
-                'status': cluster_status,
-                'created_at': datetime.utcnow(),
-                'engineer_id': None,
-                'driver_id': None,
-                'doctor_id': None
-            }
-            
-            cluster_result = mongo.db.collection_clusters.insert_one(cluster_doc)
-            cluster_id = str(cluster_result.inserted_id)
-            
-            for u in cluster_users:
-                mongo.db.pickup_requests.update_one(
-                    {'_id': u['user_id']},
-                    {'$set': {'cluster_id': cluster_id, 'status': 'clustered'}}
-                )
+            # Join the best open cluster nearby, or start a new one (services/incremental_clustering.py)
+            cluster_id, cluster_status, destination = assign_pickup(pickup_id, lat_pickup, lng_pickup, total_weight)
             
             from routes.notification_routes import create_notification
             create_notification(
                 recipient_id=str(session['user_id']),
                 title='Request Received',
-                message=f'Your e-waste request has been received and added to a collection route. Drop-off: {nearest_wh["name"]}',
+                message=f'Your e-waste request has been received and added to a collection route. Drop-off: {destination}',
                 notification_type='request_clustered',
                 related_data={'cluster_id': cluster_id, 'status': cluster_status}
             )
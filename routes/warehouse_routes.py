@@ -1,62 +1,92 @@
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, Response, current_app, stream_with_context
 from mongo import mongo
 from bson import ObjectId
 from datetime import datetime
 from datetime import timedelta
-import math
+from services.geo import WAREHOUSES, haversine_km
+from services.hub_locator import nearest_hub, nearest_hubs
+from services.location_hub import location_hub
+from services.route_optimizer import ordered_pickups, get_route_plan
+from services.jobs import submit_job, get_job
+from services.pagination import keyset_page, page_size, serialize
+from services.projections import FieldSet
+from services.hub_inventory import hub_inventory as load_hub_inventory, iter_hub_pickups, InventoryTotals
+import services.route_analysis  # registers the analyze_routes job
+import services.repricing  # registers the reprice_collected job
+from services.cluster_hydration import hydrate_clusters, fetch_by_ids
+from services.kpi_snapshots import get_kpi_snapshot, update_status_many
 
 warehouse_bp = Blueprint("warehouse", __name__)
 
-# ---------------- WAREHOUSE LOCATIONS ----------------
-WAREHOUSES = [
-    {"id": 1, "name": "North Warehouse (Borivali)", "lat": 19.2300, "lng": 72.8567},
-    {"id": 2, "name": "West Warehouse (Andheri)", "lat": 19.1136, "lng": 72.8697},
-    {"id": 3, "name": "East Warehouse (Thane)", "lat": 19.2183, "lng": 72.9781},
-    {"id": 4, "name": "South Warehouse (Colaba)", "lat": 18.9067, "lng": 72.8147},
-    {"id": 5, "name": "CENTRAL HUB (Ghatkopar)", "lat": 19.0860, "lng": 72.9090} # Central Collection Point
-]
-
-# ---------------- DISTANCE FUNCTION ----------------
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
-
-    a = (
-        math.sin(d_lat / 2) ** 2 +
-        math.cos(math.radians(lat1)) *
-        math.cos(math.radians(lat2)) *
-        math.sin(d_lon / 2) ** 2
-    )
-    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+CLUSTER_LIST_FIELDS = ["status", "total_weight", "user_count", "destination", "engineer_id", "driver_id", "created_at"]
 
+# Fields each read path renders (see services/projections.py)
+CLUSTER_CARD_FIELDS = FieldSet(
+    "warehouse.cluster_card",
+    *CLUSTER_LIST_FIELDS, "scheduled_for", "route_summary", "anchor_location",
+    "users.user_id", "users.weight", "users.distance_km"
+)
+WORKFORCE_FIELDS = FieldSet("warehouse.workforce", "name", "available_tomorrow")
+RECYCLER_FIELDS = FieldSet("warehouse.recyclers", "name")
+ANALYTICS_ENGINEER_FIELDS = FieldSet("warehouse.analytics_engineers", "name", "available_tomorrow")
+ANALYTICS_CLUSTER_FIELDS = FieldSet("warehouse.analytics_clusters", "status", "total_weight", "created_at", "users.user_id")
+ASSIGN_STAFF_FIELDS = FieldSet("warehouse.assign_staff", "name", "available_tomorrow")
 
 # ---------------- DASHBOARD ----------------
+def _prepare_clusters(clusters):
+    # attach user details, category/type info and staff names (batched lookups)
+    hydrate_clusters(clusters)
+
+    # Ensure destination is set (precomputed hub grid lookup for all missing clusters)
+    missing = [c for c in clusters if not c.get("destination")]
+    located = [c for c in missing if c.get("anchor_location", {}).get("lat") and c.get("anchor_location", {}).get("lng")]
+    wh_idx, _ = nearest_hubs(
+        [c["anchor_location"]["lat"] for c in located],
+        [c["anchor_location"]["lng"] for c in located]
+    )
+    for cluster, i in zip(located, wh_idx):
+        cluster["destination"] = WAREHOUSES[int(i)]["name"]
+    for cluster in missing:
+        if not cluster.get("destination"):
+            cluster["destination"] = "Drop-off Hub"
+    return clusters
+
+
+def _workforce():
+    """Engineers and drivers with their On Route / Available status"""
+    engineers = WORKFORCE_FIELDS.find(mongo.db.users, {"role": "engineer"})
+    active_engineer_ids = mongo.db.collection_clusters.distinct("engineer_id", {"status": "in_progress"})
+    
+    for eng in engineers:
+        eng['status'] = 'On Route' if str(eng['_id']) in active_engineer_ids else 'Available'
+        eng['available_tomorrow'] = eng.get('available_tomorrow', True)  # Default to available
+        
+    drivers = WORKFORCE_FIELDS.find(mongo.db.users, {"role": "driver"})
+    active_driver_ids = mongo.db.collection_clusters.distinct("driver_id", {"status": "in_progress"})
+    
+    for drv in drivers:
+        drv['status'] = 'On Route' if str(drv['_id']) in active_driver_ids else 'Available'
+    return engineers, drivers
+
+
 @warehouse_bp.route("/dashboard")
 def dashboard():
-    clusters = list(mongo.db.collection_clusters.find().sort("created_at", -1))
+    # First page only; the rest is loaded on demand from /api/clusters
+    clusters, next_cursor = keyset_page(mongo.db.collection_clusters, {}, "created_at", projection=CLUSTER_CARD_FIELDS)
 
     # ---------------- ANALYTICS & INSIGHTS ----------------
-    # 1. KPI Cards Data
-    total_requests = mongo.db.pickup_requests.count_documents({})
-    pending_count = mongo.db.pickup_requests.count_documents({"status": "pending"})
-    collected_count = mongo.db.pickup_requests.count_documents({"status": "collected"})
-    recycled_count = mongo.db.pickup_requests.count_documents({"status": "recycled"})
-    
-    # Calculate Total Weight (handling both 'approx_weight' from form and 'ewaste_weight' from seed)
-    pipeline_weight = [
-        {"$group": {"_id": None, "total": {"$sum": {"$ifNull": ["$approx_weight", "$ewaste_weight"]}}}}
-    ]
-    weight_res = list(mongo.db.pickup_requests.aggregate(pipeline_weight))
-    total_weight = weight_res[0]['total'] if weight_res else 0
+    # 1. KPI Cards Data (served from the incrementally maintained kpi_snapshots view)
+    kpis = get_kpi_snapshot()
+    total_requests = kpis["total_requests"]
+    pending_count = kpis["status_counts"].get("pending", 0)
+    collected_count = kpis["status_counts"].get("collected", 0)
+    recycled_count = kpis["status_counts"].get("recycled", 0)
+    total_weight = kpis["total_weight"]
 
     # 2. Material Composition (Pie Chart)
-    pipeline_type = [
-        {"$group": {"_id": "$ewaste_type", "count": {"$sum": 1}}}
-    ]
-    type_data = list(mongo.db.pickup_requests.aggregate(pipeline_type))
-    chart_labels = [d["_id"] for d in type_data if d["_id"]]
-    chart_values = [d["count"] for d in type_data if d["_id"]]
+    type_data = kpis["types"]
+    chart_labels = [d["ewaste_type"] for d in type_data if d["ewaste_type"]]
+    chart_values = [d["count"] for d in type_data if d["ewaste_type"]]
 
     # 3. Predictive Forecast (Mock AI Model)
     # Simulating a 15% week-over-week growth prediction
@@ -65,77 +95,16 @@ def dashboard():
 
     # 4. Workforce Monitoring
     # Fetch engineers and check if they are currently on a job AND available tomorrow
-    engineers = list(mongo.db.users.find({"role": "engineer"}))
-    active_engineer_ids = mongo.db.collection_clusters.distinct("engineer_id", {"status": "in_progress"})
-    
-    for eng in engineers:
-        eng['status'] = 'On Route' if str(eng['_id']) in active_engineer_ids else 'Available'
-        eng['available_tomorrow'] = eng.get('available_tomorrow', True)  # Default to available
-        
-    drivers = list(mongo.db.users.find({"role": "driver"}))
-    active_driver_ids = mongo.db.collection_clusters.distinct("driver_id", {"status": "in_progress"})
-    
-    for drv in drivers:
-        drv['status'] = 'On Route' if str(drv['_id']) in active_driver_ids else 'Available'
+    engineers, drivers = _workforce()
 
-    recyclers = list(mongo.db.users.find({"role": "recycler"}))
-
-    # 5. Warehouse Inventory (Collected items waiting for recycling)
-    inventory_items = list(mongo.db.pickup_requests.find({"status": "collected"}).sort("updated_at", -1).limit(10))
-
-    # attach user details and category/type info for each cluster
-    for cluster in clusters:
-        users = []
-        categories = set()
-        for u in cluster["users"]:
-            req = mongo.db.pickup_requests.find_one({"_id": u["user_id"]})
-            if req:
-                users.append({
-                    "name": req["user_name"],
-                    "address": req["address"],
-                    "weight": u["weight"],
-                    "distance": u["distance_km"],
-                    "type": req.get("ewaste_type", "Unknown")
-                })
-                # Collect all unique categories in this cluster
-                if req.get("ewaste_type"):
-                    categories.add(req.get("ewaste_type"))
-        
-        cluster["user_details"] = users
-        cluster["categories"] = ", ".join(list(categories)) if categories else "Mixed E-Waste"
-        
-        # Fetch assigned engineer and driver names
-        engineer_name = None
-        driver_name = None
-        if cluster.get("engineer_id"):
-            try:
-                eng_doc = mongo.db.users.find_one({"_id": ObjectId(cluster["engineer_id"])})
-                engineer_name = eng_doc.get("name") if eng_doc else None
-            except Exception:
-                engineer_name = None
-        if cluster.get("driver_id"):
-            try:
-                drv_doc = mongo.db.users.find_one({"_id": ObjectId(cluster["driver_id"])})
-                driver_name = drv_doc.get("name") if drv_doc else None
-            except Exception:
-                driver_name = None
-        
-        cluster["engineer_name"] = engineer_name
-        cluster["driver_name"] = driver_name
-        
-        # Ensure destination is set
-        if not cluster.get("destination"):
-            lat = cluster.get("anchor_location", {}).get("lat")
-            lng = cluster.get("anchor_location", {}).get("lng")
-            if lat and lng:
-                nearest_wh = min(WAREHOUSES, key=lambda wh: haversine_km(lat, lng, wh["lat"], wh["lng"]))
-                cluster["destination"] = nearest_wh["name"]
-            else:
-                cluster["destination"] = "Drop-off Hub"
+    recyclers = RECYCLER_FIELDS.find(mongo.db.users, {"role": "recycler"})
+
+    _prepare_clusters(clusters)
 
     return render_template(
         "warehouse/warehouse_dashboard.html",
         clusters=clusters,
+        next_cursor=next_cursor,
         stats={
             "total_requests": total_requests,
             "pending": pending_count,
@@ -148,51 +117,67 @@ def dashboard():
             "forecast_values": forecast_values,
             "engineers": engineers,
             "drivers": drivers,
-            "recyclers": recyclers,
-            "inventory": inventory_items
+            "recyclers": recyclers
         },
         warehouses=WAREHOUSES
     )
 
 
+@warehouse_bp.route("/api/clusters")
+def clusters_api():
+    """Next page of dashboard clusters: {clusters, html, next_cursor}"""
+    try:
+        clusters, next_cursor = keyset_page(
+            mongo.db.collection_clusters, {}, "created_at",
+            request.args.get("cursor"), page_size(request.args.get("limit")), CLUSTER_CARD_FIELDS
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    _prepare_clusters(clusters)
+    engineers, drivers = _workforce()
+    html = render_template("warehouse/_cluster_cards.html", clusters=clusters, stats={"engineers": engineers, "drivers": drivers})
+    return jsonify({
+        "clusters": [serialize(c, CLUSTER_LIST_FIELDS) for c in clusters],
+        "html": html,
+        "next_cursor": next_cursor
+    })
+
+
 # ---------------- ADVANCED ANALYTICS DASHBOARD ----------------
 @warehouse_bp.route("/advanced-analytics")
 def advanced_analytics():
-    # Advanced metrics
-    total_requests = mongo.db.pickup_requests.count_documents({})
-    pending_count = mongo.db.pickup_requests.count_documents({"status": "pending"})
-    collected_count = mongo.db.pickup_requests.count_documents({"status": "collected"})
-    recycled_count = mongo.db.pickup_requests.count_documents({"status": "recycled"})
+    # Advanced metrics (served from the incrementally maintained kpi_snapshots view)
+    kpis = get_kpi_snapshot()
+    total_requests = kpis["total_requests"]
+    pending_count = kpis["status_counts"].get("pending", 0)
+    collected_count = kpis["status_counts"].get("collected", 0)
+    recycled_count = kpis["status_counts"].get("recycled", 0)
     
     # Calculate completion rate
     completion_rate = (collected_count / total_requests * 100) if total_requests > 0 else 0
     
     # Total weight
-    pipeline_weight = [
-        {"$group": {"_id": None, "total": {"$sum": {"$ifNull": ["$approx_weight", "$ewaste_weight"]}}}}
-    ]
-    weight_res = list(mongo.db.pickup_requests.aggregate(pipeline_weight))
-    total_weight = weight_res[0]['total'] if weight_res else 0
+    total_weight = kpis["total_weight"]
     
     # Material breakdown
-    pipeline_material = [
-        {"$group": {"_id": "$ewaste_type", "count": {"$sum": 1}, "total_weight": {"$sum": {"$ifNull": ["$approx_weight", "$ewaste_weight"]}}}}
+    material_data = [
+        {"_id": d["ewaste_type"], "count": d["count"], "total_weight": d["total_weight"]}
+        for d in kpis["types"]
     ]
-    material_data = list(mongo.db.pickup_requests.aggregate(pipeline_material))
     
     # Engineer performance
-    engineers = list(mongo.db.users.find({"role": "engineer"}))
+    engineers = ANALYTICS_ENGINEER_FIELDS.find(mongo.db.users, {"role": "engineer"})
     for eng in engineers:
         completed = mongo.db.pickup_requests.count_documents({"engineer_id": str(eng["_id"]), "status": "collected"})
         eng["jobs_completed"] = completed
         eng["available"] = eng.get("available_tomorrow", True)
     
     # Cluster efficiency
-    clusters = list(mongo.db.collection_clusters.find().sort("created_at", -1).limit(10))
+    clusters = ANALYTICS_CLUSTER_FIELDS.find(mongo.db.collection_clusters, {}, sort=[("created_at", -1)], limit=10)
     
     # Recycler performance
-    recycled_items = mongo.db.pickup_requests.count_documents({"status": "recycled"})
-    recyclers = list(mongo.db.users.find({"role": "recycler"}))
+    recycled_items = recycled_count
+    recyclers = RECYCLER_FIELDS.find(mongo.db.users, {"role": "recycler"})
     
     # Time-based analytics
     from datetime import datetime, timedelta
@@ -228,221 +213,167 @@ def advanced_analytics():
 # ---------------- ANALYZE ROUTES ENGINE ----------------
 @warehouse_bp.route("/analyze-routes", methods=["POST"])
 def analyze_routes():
-    users = list(mongo.db.pickup_requests.find({
-        "status": "pending",
-        "cluster_id": None
-    }))
-
-    # Sort by weight (handle both field names for compatibility)
-    users.sort(key=lambda u: u.get("approx_weight", u.get("ewaste_weight", 0)), reverse=True)
-
-    used_users = set()
-    created = []
-
-    for anchor in users:
-        if anchor["_id"] in used_users:
-            continue
-        
-        # Find nearest Regional Warehouse (1-4) for drop-off
-        nearest_wh = min(WAREHOUSES[:4], key=lambda wh: haversine_km(
-            anchor["latitude"], anchor["longitude"], wh["lat"], wh["lng"]
-        ))
-        
-        dist_to_wh = haversine_km(
-            anchor["latitude"], anchor["longitude"],
-            nearest_wh["lat"], nearest_wh["lng"]
-        )
-        
-        anchor_weight = anchor.get("approx_weight", anchor.get("ewaste_weight", 0))
-
-        cluster_users = [{
-            "user_id": anchor["_id"],
-            "weight": anchor_weight,
-            "distance_km": 0
-        }]
-        total_weight = anchor["ewaste_weight"]
-        max_distance = 0
-        used_users.add(anchor["_id"])
-
-        for u in users:
-            if u["_id"] in used_users:
-                continue
-
-            dist = haversine_km(
-                anchor["latitude"], anchor["longitude"],
-                u["latitude"], u["longitude"]
-            )
-
-            if dist <= 100:
-                u_weight = u.get("approx_weight", u.get("ewaste_weight", 0))
-                cluster_users.append({
-                    "user_id": u["_id"],
-                    "weight": u_weight,
-                    "distance_km": round(dist, 2)
-                })
-                
-                total_weight += u_weight
-                max_distance = max(max_distance, dist)
-                used_users.add(u["_id"])
-
-            if total_weight >= 100:
-                break
-
-        if total_weight >= 100:
-            status = "ready"
-        elif total_weight >= 85:
-            status = "almost_ready"
-        else:
-            status = "pending"
-
-        cluster = {
-            "anchor_user_id": anchor["_id"],
-            "anchor_location": {
-                "lat": anchor["latitude"],
-                "lng": anchor["longitude"]
-            },
-            "destination": nearest_wh["name"],
-            "dist_to_hub": round(dist_to_wh, 2), # Distance to drop-off point
-            "radius_used_km": round(max_distance, 2),
-            "total_weight": total_weight,
-            "user_count": len(cluster_users),
-            "users": cluster_users,
-            "efficiency_score": round(total_weight / max_distance, 2) if max_distance else total_weight,
-            "status": status,
-            "admin_override": False,
-            "created_at": datetime.utcnow()
-        }
-
-
-        @warehouse_bp.route('/assign/<cluster_id>', methods=['GET'])
-        def assign_cluster_page(cluster_id):
-            # Render a simple assignment page for a cluster
-            cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
-            if not cluster:
-                return redirect(url_for('warehouse.dashboard'))
-
-            # Fetch available engineers/drivers/doctors
-            engineers = list(mongo.db.users.find({'role': 'engineer'}))
-            drivers = list(mongo.db.users.find({'role': 'driver'}))
-            doctors = list(mongo.db.users.find({'role': 'doctor'}))
-
-            # Determine cluster centroid (anchor or centroid of users)
-            lat = None
-            lng = None
-            if cluster.get('anchor_location'):
-                lat = cluster['anchor_location'].get('lat')
-                lng = cluster['anchor_location'].get('lng')
-            else:
-                user_ids = [u['user_id'] for u in cluster.get('users', [])]
-                if user_ids:
-                    pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}))
-                    if pickup_docs:
-                        lat = sum([p.get('latitude', 0) for p in pickup_docs]) / len(pickup_docs)
-                        lng = sum([p.get('longitude', 0) for p in pickup_docs]) / len(pickup_docs)
-
-            # Only show engineers who are available_tomorrow or currently not on route
-            active_engineer_ids = mongo.db.collection_clusters.distinct('engineer_id', {'status': {'$in': ['in_progress', 'assigned', 'scheduled']}})
-            for eng in engineers:
-                eng['on_route'] = str(eng['_id']) in active_engineer_ids
-                eng['available_tomorrow'] = eng.get('available_tomorrow', True)
-                # compute current active assignment count for workload-based recommendation
-                try:
-                    eng_count = mongo.db.collection_clusters.count_documents({'engineer_id': str(eng['_id']), 'status': {'$in': ['assigned', 'in_progress', 'scheduled']}})
-                except Exception:
-                    eng_count = 0
-                eng['active_count'] = eng_count
-
-            for drv in drivers:
-                try:
-                    drv_count = mongo.db.collection_clusters.count_documents({'driver_id': str(drv['_id']), 'status': {'$in': ['assigned', 'in_progress', 'scheduled']}})
-                except Exception:
-                    drv_count = 0
-                drv['active_count'] = drv_count
-
-            # Sort by availability then by active_count (less loaded first)
-            engineers_sorted = sorted(engineers, key=lambda p: (0 if p.get('available_tomorrow', True) else 1, p.get('active_count', 0)))
-            drivers_sorted = sorted(drivers, key=lambda p: (0 if p.get('available_tomorrow', True) else 1, p.get('active_count', 0)))
-
-            # Prepare recommended (top 5)
-            recommended_engineers = engineers_sorted[:5]
-            recommended_drivers = drivers_sorted[:5]
-
-            recommended_engineer_id = str(recommended_engineers[0]['_id']) if recommended_engineers else None
-            recommended_driver_id = str(recommended_drivers[0]['_id']) if recommended_drivers else None
-
-            return render_template(
-                'warehouse/assign_cluster.html',
-                cluster=cluster,
-                engineers=engineers_sorted,
-                drivers=drivers_sorted,
-                doctors=doctors,
-                recommended_engineers=recommended_engineers,
-                recommended_drivers=recommended_drivers,
-                recommended_engineer_id=recommended_engineer_id,
-                recommended_driver_id=recommended_driver_id
-            )
-
-        @warehouse_bp.route('/assign', methods=['POST'])
-        def assign_cluster():
-            cluster_id = request.form.get('cluster_id')
-            eng_id = request.form.get('engineer_id')
-            driver_id = request.form.get('driver_id')
-            doctor_id = request.form.get('doctor_id')
-            est_minutes = int(request.form.get('estimated_duration_minutes') or 60)
-            route_km = float(request.form.get('route_distance_km') or 5.0)
-            scheduled_for = datetime.utcnow()
-
-            update = {
-                'engineer_id': eng_id,
-                'driver_id': driver_id,
-                'doctor_id': doctor_id,
-                'status': 'scheduled',
-                'scheduled_for': scheduled_for,
-                'estimated_duration_minutes': est_minutes,
-                'route_distance_km': route_km
-            }
+    # Clustering runs as a background job (services/route_analysis.py); one at a time
+    job_id = submit_job(current_app._get_current_object(), "analyze_routes", {
+        "mode": request.form.get("mode") or "greedy",
+        "capacity_kg": request.form.get("capacity_kg"),
+        "time_budget_seconds": request.form.get("time_budget_seconds")
+    }, unique=True)
+    return redirect(url_for("warehouse.dashboard", job=job_id))
+
+
+@warehouse_bp.route("/reprice-collected", methods=["POST"])
+def reprice_collected():
+    # Revalue collected pickups at current rates (services/repricing.py); resumes an interrupted run
+    batch_size = request.form.get("batch_size")
+    if batch_size and (not batch_size.isdigit() or int(batch_size) < 1):
+        return jsonify({"error": "batch_size must be a positive integer"}), 400
+    job_id = submit_job(current_app._get_current_object(), "reprice_collected", {
+        "resume": request.form.get("resume", "1") != "0",
+        "batch_size": batch_size
+    }, unique=True)
+    return jsonify({"job_id": job_id}), 202
+
+
+@warehouse_bp.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+# ---------------- CLUSTER ASSIGNMENT PAGE ----------------
+@warehouse_bp.route('/assign/<cluster_id>', methods=['GET'])
+def assign_cluster_page(cluster_id):
+    # Render a simple assignment page for a cluster
+    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
+    if not cluster:
+        return redirect(url_for('warehouse.dashboard'))
 
-            # compute and set destination if not present
-            cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
-            lat = None
-            lng = None
-            if cluster:
-                if cluster.get('anchor_location'):
-                    lat = cluster['anchor_location'].get('lat')
-                    lng = cluster['anchor_location'].get('lng')
-                else:
-                    user_ids = [u['user_id'] for u in cluster.get('users', [])]
-                    if user_ids:
-                        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}))
-                        if pickup_docs:
-                            lat = sum([p.get('latitude', 0) for p in pickup_docs]) / len(pickup_docs)
-                            lng = sum([p.get('longitude', 0) for p in pickup_docs]) / len(pickup_docs)
+    # Fetch available engineers/drivers/doctors
+    engineers = ASSIGN_STAFF_FIELDS.find(mongo.db.users, {'role': 'engineer'})
+    drivers = ASSIGN_STAFF_FIELDS.find(mongo.db.users, {'role': 'driver'})
+    doctors = ASSIGN_STAFF_FIELDS.find(mongo.db.users, {'role': 'doctor'})
+
+    # Determine cluster centroid (anchor or centroid of users)
+    lat = None
+    lng = None
+    if cluster.get('anchor_location'):
+        lat = cluster['anchor_location'].get('lat')
+        lng = cluster['anchor_location'].get('lng')
+    else:
+        user_ids = [u['user_id'] for u in cluster.get('users', [])]
+        if user_ids:
+            pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}, {'latitude': 1, 'longitude': 1}))
+            if pickup_docs:
+                lat = sum([p.get('latitude', 0) for p in pickup_docs]) / len(pickup_docs)
+                lng = sum([p.get('longitude', 0) for p in pickup_docs]) / len(pickup_docs)
+
+    # Only show engineers who are available_tomorrow or currently not on route
+    active_engineer_ids = mongo.db.collection_clusters.distinct('engineer_id', {'status': {'$in': ['in_progress', 'assigned', 'scheduled']}})
+    for eng in engineers:
+        eng['on_route'] = str(eng['_id']) in active_engineer_ids
+        eng['available_tomorrow'] = eng.get('available_tomorrow', True)
+        # compute current active assignment count for workload-based recommendation
+        try:
+            eng_count = mongo.db.collection_clusters.count_documents({'engineer_id': str(eng['_id']), 'status': {'$in': ['assigned', 'in_progress', 'scheduled']}})
+        except Exception:
+            eng_count = 0
+        eng['active_count'] = eng_count
 
-            if lat is not None and lng is not None:
-                nearest_wh = min(WAREHOUSES, key=lambda wh: haversine_km(lat, lng, wh['lat'], wh['lng']))
-                dist_to_wh = round(haversine_km(lat, lng, nearest_wh['lat'], nearest_wh['lng']), 2)
-                update['destination'] = nearest_wh['name']
-                update['dist_to_hub'] = dist_to_wh
+    for drv in drivers:
+        try:
+            drv_count = mongo.db.collection_clusters.count_documents({'driver_id': str(drv['_id']), 'status': {'$in': ['assigned', 'in_progress', 'scheduled']}})
+        except Exception:
+            drv_count = 0
+        drv['active_count'] = drv_count
 
-            mongo.db.collection_clusters.update_one({'_id': ObjectId(cluster_id)}, {'$set': update})
+    # Sort by availability then by active_count (less loaded first)
+    engineers_sorted = sorted(engineers, key=lambda p: (0 if p.get('available_tomorrow', True) else 1, p.get('active_count', 0)))
+    drivers_sorted = sorted(drivers, key=lambda p: (0 if p.get('available_tomorrow', True) else 1, p.get('active_count', 0)))
 
-            # Update pickup_requests linked to this cluster: set status scheduled
-            try:
-                mongo.db.pickup_requests.update_many({'cluster_id': str(cluster_id)}, {'$set': {'status': 'scheduled'}})
-            except Exception:
-                pass
+    # Prepare recommended (top 5)
+    recommended_engineers = engineers_sorted[:5]
+    recommended_drivers = drivers_sorted[:5]
 
-            return redirect(url_for('warehouse.dashboard'))
-        cid = mongo.db.collection_clusters.insert_one(cluster).inserted_id
+    # Prefill distance/ETA from the optimized stop sequence
+    route_plan = get_route_plan(cluster)
+    cluster['route_distance_km'] = route_plan['distance_km']
+    if not cluster.get('estimated_duration_minutes'):
+        cluster['estimated_duration_minutes'] = route_plan['eta_minutes']
 
-        mongo.db.pickup_requests.update_many(
-            {"_id": {"$in": [u["user_id"] for u in cluster_users]}},
-            {"$set": {"status": "clustered", "cluster_id": cid}}
-        )
+    recommended_engineer_id = str(recommended_engineers[0]['_id']) if recommended_engineers else None
+    recommended_driver_id = str(recommended_drivers[0]['_id']) if recommended_drivers else None
 
-        created.append(str(cid))
+    return render_template(
+        'warehouse/assign_cluster.html',
+        cluster=cluster,
+        engineers=engineers_sorted,
+        drivers=drivers_sorted,
+        doctors=doctors,
+        recommended_engineers=recommended_engineers,
+        recommended_drivers=recommended_drivers,
+        recommended_engineer_id=recommended_engineer_id,
+        recommended_driver_id=recommended_driver_id
+    )
 
-    return redirect(url_for("warehouse.dashboard"))
+@warehouse_bp.route('/assign', methods=['POST'])
+def assign_cluster():
+    cluster_id = request.form.get('cluster_id')
+    eng_id = request.form.get('engineer_id')
+    driver_id = request.form.get('driver_id')
+    doctor_id = request.form.get('doctor_id')
+    est_minutes = request.form.get('estimated_duration_minutes')
+    scheduled_for = datetime.utcnow()
+
+    update = {
+        'engineer_id': eng_id,
+        'driver_id': driver_id,
+        'doctor_id': doctor_id,
+        'status': 'scheduled',
+        'scheduled_for': scheduled_for
+    }
+
+    # compute and set destination if not present
+    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
+    lat = None
+    lng = None
+    if cluster:
+        if cluster.get('anchor_location'):
+            lat = cluster['anchor_location'].get('lat')
+            lng = cluster['anchor_location'].get('lng')
+        else:
+            user_ids = [u['user_id'] for u in cluster.get('users', [])]
+            if user_ids:
+                pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}))
+                if pickup_docs:
+                    lat = sum([p.get('latitude', 0) for p in pickup_docs]) / len(pickup_docs)
+                    lng = sum([p.get('longitude', 0) for p in pickup_docs]) / len(pickup_docs)
+
+    if lat is not None and lng is not None:
+        nearest_wh, dist_to_wh = nearest_hub(lat, lng)
+        dist_to_wh = round(dist_to_wh, 2)
+        update['destination'] = nearest_wh['name']
+        update['dist_to_hub'] = dist_to_wh
+
+    # Route distance comes from the optimized stop sequence to the destination hub
+    if cluster:
+        cluster.update(update)
+        route_plan = get_route_plan(cluster)
+        update['route_plan'] = route_plan
+        update['route_distance_km'] = route_plan['distance_km']
+        update['estimated_duration_minutes'] = int(est_minutes) if est_minutes else route_plan['eta_minutes']
+
+    mongo.db.collection_clusters.update_one({'_id': ObjectId(cluster_id)}, {'$set': update})
+
+    # Update pickup_requests linked to this cluster: set status scheduled
+    try:
+        update_status_many({'cluster_id': str(cluster_id)}, 'scheduled')
+    except Exception as e:
+        print(f"Failed to schedule pickups of cluster {cluster_id}: {e}")
+
+    return redirect(url_for('warehouse.dashboard'))
 
 
 # ---------------- ADMIN OVERRIDE ----------------
@@ -503,9 +434,9 @@ def assign_fleet(cluster_id):
 
         # Update linked pickup_requests to assigned
         try:
-            mongo.db.pickup_requests.update_many({'cluster_id': str(cluster_id)}, {'$set': {'status': 'assigned'}})
-        except Exception:
-            pass
+            update_status_many({'cluster_id': str(cluster_id)}, 'assigned')
+        except Exception as e:
+            print(f"Failed to assign pickups of cluster {cluster_id}: {e}")
     
     return redirect(url_for("warehouse.dashboard"))
 
@@ -517,10 +448,10 @@ def update_cluster_status(cluster_id):
     Update cluster status with notifications to all stakeholders.
     Transitions: assigned → out_for_delivery → delivered
     """
-    from routes.notification_routes import create_notification
+    from routes.notification_routes import build_notification, create_notifications
     
     new_status = request.json.get("status")
-    cluster = mongo.db.collection_clusters.find_one({"_id": ObjectId(cluster_id)})
+    cluster = mongo.db.collection_clusters.find_one({"_id": ObjectId(cluster_id)}, {"users": 1, "engineer_id": 1, "driver_id": 1})
     
     if not cluster:
         return {"error": "Cluster not found"}, 404
@@ -540,6 +471,9 @@ def update_cluster_status(cluster_id):
         }
     )
     
+    # Notifications are queued and inserted in batches by the background dispatcher
+    notifications = []
+    
     # Notify all users in the cluster about status change
     if cluster.get("users"):
         status_msg = {
@@ -555,42 +489,30 @@ def update_cluster_status(cluster_id):
             "delivered": "✓"
         }
         
+        # cluster["users"] holds pickup ids; notify the customers who own them (one $in query)
+        owners = fetch_by_ids(mongo.db.pickup_requests, [u["user_id"] for u in cluster["users"]], {"user_id": 1})
         for user_info in cluster["users"]:
-            try:
-                create_notification(
-                    recipient_id=user_info["user_id"],
-                    title=f"{emoji.get(new_status, '●')} Collection {new_status.replace('_', ' ').title()}",
-                    message=message,
-                    type="status_update",
-                    related_data={"cluster_id": str(cluster_id), "status": new_status}
-                )
-            except:
-                pass
+            owner = owners.get(user_info["user_id"])
+            notifications.append(build_notification(
+                recipient_id=str(owner["user_id"]) if owner and owner.get("user_id") else user_info["user_id"],
+                title=f"{emoji.get(new_status, '●')} Collection {new_status.replace('_', ' ').title()}",
+                message=message,
+                notification_type="status_update",
+                related_data={"cluster_id": str(cluster_id), "status": new_status}
+            ))
     
     # Notify engineer and driver
-    if cluster.get("engineer_id"):
-        try:
-            create_notification(
-                recipient_id=cluster["engineer_id"],
+    for staff_field in ("engineer_id", "driver_id"):
+        if cluster.get(staff_field):
+            notifications.append(build_notification(
+                recipient_id=cluster[staff_field],
                 title="Cluster Status Update",
                 message=f"Cluster status changed to {new_status.replace('_', ' ')}",
-                type="status_update",
+                notification_type="status_update",
                 related_data={"cluster_id": str(cluster_id)}
-            )
-        except:
-            pass
+            ))
     
-    if cluster.get("driver_id"):
-        try:
-            create_notification(
-                recipient_id=cluster["driver_id"],
-                title="Cluster Status Update",
-                message=f"Cluster status changed to {new_status.replace('_', ' ')}",
-                type="status_update",
-                related_data={"cluster_id": str(cluster_id)}
-            )
-        except:
-            pass
+    create_notifications(notifications)
     
     return {"success": True, "status": new_status}, 200
 
@@ -602,11 +524,8 @@ def view_route(cluster_id):
     if not cluster:
         return redirect(url_for('warehouse.dashboard'))
     
-    # Get all user pickups in the cluster
-    u_ids = [u['user_id'] for u in cluster.get('users', [])]
-    pickup_docs = []
-    if u_ids:
-        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+    # Cluster pickups in optimized stop order (see services/route_optimizer.py)
+    pickup_docs, route_plan = ordered_pickups(cluster)
     
     waypoints = []
     for pickup in pickup_docs:
@@ -636,8 +555,8 @@ def track_order(pickup_id):
 
 @warehouse_bp.route('/api/public/driver-location/<driver_id>')
 def public_driver_location(driver_id):
-    """Public API for frontend polling of driver location"""
-    location = mongo.db.driver_locations.find_one({'driver_id': driver_id})
+    """Public API for frontend polling of driver location (fallback for the stream below)"""
+    location = location_hub.get_location(driver_id)
     if location:
         return jsonify({
             'lat': location.get('lat'),
@@ -647,72 +566,35 @@ def public_driver_location(driver_id):
     return jsonify({}), 404
 
 
+@warehouse_bp.route('/api/public/driver-location/<driver_id>/stream')
+def public_driver_location_stream(driver_id):
+    """Server-Sent Events stream of a driver's live location"""
+    return Response(
+        location_hub.stream(driver_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 # --------------- HUB INVENTORY ---------------
 @warehouse_bp.route("/hub-inventory/<hub_name>", methods=["GET"])
 def hub_inventory(hub_name):
     """
     Fetch all pickups delivered to a specific warehouse hub
     """
-    # Find all clusters with this destination hub that are delivered
-    clusters = list(mongo.db.collection_clusters.find(
-        {"destination": hub_name, "status": {"$in": ["delivered", "completed"]}}
-    ))
-    
-    hub_pickups = []
-    total_weight = 0
-    total_value = 0
-    category_breakdown = {}
-    
-    for cluster in clusters:
-        # Get all pickups in this cluster
-        pickups = list(mongo.db.pickup_requests.find({
-            "cluster_id": str(cluster["_id"])
-        }))
-        
-        for pickup in pickups:
-            category = pickup.get("ewaste_type", "Unknown")
-            category_breakdown[category] = category_breakdown.get(category, 0) + 1
-            
-            # Calculate estimated value
-            estimated_value = 0
-            if pickup.get("final_weight"):
-                # Check pricing engine for metal/category prices
-                weight = pickup.get("final_weight", 0)
-                metal_type = pickup.get("metal_type", "")
-                
-                if metal_type and mongo.db.metal_prices.find_one({"metal": metal_type}):
-                    price_doc = mongo.db.metal_prices.find_one({"metal": metal_type})
-                    estimated_value = weight * price_doc.get("price_per_kg", 0)
-                else:
-                    # Fallback to category pricing
-                    category_price = mongo.db.category_prices.find_one({"category": category})
-                    if category_price:
-                        estimated_value = weight * category_price.get("price_per_kg", 0)
-            
-            total_weight += pickup.get("final_weight", pickup.get("approx_weight", pickup.get("ewaste_weight", 0)))
-            total_value += estimated_value
-            
-            hub_pickups.append({
-                "_id": str(pickup["_id"]),
-                "user_name": pickup.get("user_name", "Unknown"),
-                "ewaste_type": category,
-                "status": pickup.get("status", "pending"),
-                "final_weight": pickup.get("final_weight"),
-                "approx_weight": pickup.get("approx_weight"),
-                "final_quality": pickup.get("final_quality"),
-                "collected_at": pickup.get("collected_at"),
-                "items": pickup.get("items", []),
-                "metal_type": pickup.get("metal_type"),
-                "estimated_value": round(estimated_value, 2),
-                "address": pickup.get("address"),
-                "area": pickup.get("area")
-            })
-    
-    return {
-        "hub": hub_name,
-        "total_pickups": len(hub_pickups),
-        "total_weight": round(total_weight, 2),
-        "total_estimated_value": round(total_value, 2),
-        "category_breakdown": category_breakdown,
-        "pickups": hub_pickups
-    }, 200
+    return load_hub_inventory(hub_name), 200
+
+
+@warehouse_bp.route("/hub-inventory/<hub_name>/stream", methods=["GET"])
+def hub_inventory_stream(hub_name):
+    """
+    The same inventory as NDJSON: one pickup per line as it is read,
+    then a final {"summary": {...totals}} line
+    """
+    def generate():
+        totals = InventoryTotals(hub_name)
+        for row, weight in iter_hub_pickups(hub_name):
+            yield current_app.json.dumps(totals.add(row, weight)) + "\n"
+        yield current_app.json.dumps({"summary": totals.as_dict()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -0,0 +1,259 @@
+"""
+Compact GPS breadcrumb history per driver.
+
+One `driver_tracks` document holds a driver's trail for one UTC day
+(_id "<driver_id>:<YYYY-MM-DD>", see `day_key()`). Points are fixed-point integers
+(1e-5 degree, about 1 m; epoch seconds) stored as deltas from the previous
+point, starting at `base`:
+
+    {base: {lat, lng, t}, last: {lat, lng, t}, dlat: [...], dlng: [...], dt: [...],
+     packed: Binary, packed_count, count, expires_at}
+
+Appends are a single pipeline update that computes the first delta against the
+stored `last` point on the server, so ticks flushed by different workers keep
+the chain consistent. `compact_track()` (run on trip completion) simplifies the
+day with Douglas-Peucker and moves it into `packed`, a zigzag-varint byte
+string; a typical 8-hour day shrinks from a few thousand 12-byte array entries
+to a few hundred points of 4-6 bytes each. Documents expire through the TTL
+index on `expires_at` (TRACK_RETENTION_DAYS after the day).
+"""
+
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from bson import Binary
+from pymongo import UpdateOne
+from mongo import mongo
+from services.geo import haversine_km
+
+SCALE = 100000
+TRACK_RETENTION_DAYS = 30
+# Write-side thinning: skip ticks that moved less than this, unless the gap is long
+MIN_MOVE_M = 15
+MAX_GAP_SECONDS = 60
+# Douglas-Peucker tolerance used for compaction and playback
+SIMPLIFY_EPSILON_M = 10
+
+_last_recorded = {}
+
+
+def track_id(driver_id, day):
+    return f"{driver_id}:{day}"
+
+
+def day_key(ts=None):
+    """UTC day (YYYY-MM-DD) a timestamp belongs to; naive timestamps are local time"""
+    ts = ts or datetime.now(timezone.utc)
+    return ts.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _fixed_point(location):
+    try:
+        lat = float(location["lat"])
+        lng = float(location["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    ts = location.get("timestamp")
+    if not isinstance(ts, datetime):
+        ts = datetime.now(timezone.utc)
+    return {"lat": round(lat * SCALE), "lng": round(lng * SCALE), "t": int(ts.timestamp())}, ts
+
+
+# ---------------- VARINT PACKING ----------------
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def pack_deltas(dlat, dlng, dt):
+    out = bytearray()
+    for triple in zip(dlat, dlng, dt):
+        for value in triple:
+            z = _zigzag(int(value))
+            while z >= 0x80:
+                out.append((z & 0x7F) | 0x80)
+                z >>= 7
+            out.append(z)
+    return bytes(out)
+
+
+def unpack_deltas(data):
+    values = []
+    shift = 0
+    z = 0
+    for byte in data:
+        z |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((z >> 1) ^ -(z & 1))
+        z = 0
+        shift = 0
+    return values[0::3], values[1::3], values[2::3]
+
+
+# ---------------- RECORDING ----------------
+def _append_update(driver_id, day, point, expires_at):
+    """Pipeline update appending one point, with the delta computed server-side"""
+    return UpdateOne(
+        {"_id": track_id(driver_id, day)},
+        [
+            {"$set": {
+                "driver_id": driver_id,
+                "day": day,
+                "base": {"$ifNull": ["$base", point]},
+                "expires_at": {"$ifNull": ["$expires_at", expires_at]}
+            }},
+            {"$set": {
+                "dlat": {"$concatArrays": [
+                    {"$ifNull": ["$dlat", []]},
+                    [{"$subtract": [point["lat"], {"$ifNull": ["$last.lat", "$base.lat"]}]}]
+                ]},
+                "dlng": {"$concatArrays": [
+                    {"$ifNull": ["$dlng", []]},
+                    [{"$subtract": [point["lng"], {"$ifNull": ["$last.lng", "$base.lng"]}]}]
+                ]},
+                "dt": {"$concatArrays": [
+                    {"$ifNull": ["$dt", []]},
+                    [{"$subtract": [point["t"], {"$ifNull": ["$last.t", "$base.t"]}]}]
+                ]},
+                "count": {"$add": [{"$ifNull": ["$count", 0]}, 1]},
+                "last": point
+            }}
+        ],
+        upsert=True
+    )
+
+
+def _should_record(driver_id, point):
+    previous = _last_recorded.get(driver_id)
+    if previous is None:
+        return True
+    if point["t"] - previous["t"] >= MAX_GAP_SECONDS:
+        return True
+    moved_km = haversine_km(previous["lat"] / SCALE, previous["lng"] / SCALE, point["lat"] / SCALE, point["lng"] / SCALE)
+    return moved_km * 1000 >= MIN_MOVE_M
+
+
+def record_breadcrumbs(locations):
+    """
+    Append the latest location of each driver ({driver_id: location}) to its
+    day track in one bulk_write. Returns the number of points written.
+    """
+    ops = []
+    for driver_id, location in locations.items():
+        fixed = _fixed_point(location)
+        if fixed is None:
+            continue
+        point, ts = fixed
+        if not _should_record(driver_id, point):
+            continue
+        day = day_key(ts)
+        expires_at = datetime.strptime(day, "%Y-%m-%d") + timedelta(days=TRACK_RETENTION_DAYS + 1)
+        ops.append(_append_update(driver_id, day, point, expires_at))
+        _last_recorded[driver_id] = point
+    if ops:
+        mongo.db.driver_tracks.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+# ---------------- DECODING / SIMPLIFICATION ----------------
+def decode_track(doc):
+    """Fixed-point points [(lat, lng, t), ...] of a track document"""
+    if not doc or not doc.get("base"):
+        return []
+    dlat, dlng, dt = unpack_deltas(doc["packed"]) if doc.get("packed") else ([], [], [])
+    dlat = list(dlat) + list(doc.get("dlat", []))
+    dlng = list(dlng) + list(doc.get("dlng", []))
+    dt = list(dt) + list(doc.get("dt", []))
+    if not dlat:
+        return []
+    base = doc["base"]
+    lats = np.cumsum([base["lat"]] + dlat)[1:]
+    lngs = np.cumsum([base["lng"]] + dlng)[1:]
+    ts = np.cumsum([base["t"]] + dt)[1:]
+    return list(zip(lats.tolist(), lngs.tolist(), ts.tolist()))
+
+
+def simplify(points, epsilon_m=SIMPLIFY_EPSILON_M):
+    """Douglas-Peucker on fixed-point (lat, lng, t) points; keeps both endpoints"""
+    if len(points) < 3:
+        return list(points)
+    arr = np.asarray(points, dtype=float)
+    # Local equirectangular projection to metres
+    lat0 = np.radians(arr[:, 0].mean() / SCALE)
+    y = arr[:, 0] / SCALE * 110574.0
+    x = arr[:, 1] / SCALE * 111320.0 * np.cos(lat0)
+
+    keep = np.zeros(len(arr), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(arr) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        seg_len = np.hypot(dx, dy)
+        if seg_len == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(dx * py - dy * px) / seg_len
+        i = int(np.argmax(dist))
+        if dist[i] > epsilon_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return [points[i] for i in np.flatnonzero(keep)]
+
+
+def compact_track(driver_id, day=None, epsilon_m=SIMPLIFY_EPSILON_M):
+    """
+    Simplify a day's track and store it packed. Skipped (returns False) if new
+    points were appended while compacting; the next compaction picks them up.
+    """
+    day = day or day_key()
+    tracks = mongo.db.driver_tracks
+    doc = tracks.find_one({"_id": track_id(driver_id, day)})
+    points = decode_track(doc)
+    if not points:
+        return False
+    kept = simplify(points, epsilon_m)
+    base = doc["base"]
+    prev = (base["lat"], base["lng"], base["t"])
+    dlat, dlng, dt = [], [], []
+    for lat, lng, t in kept:
+        dlat.append(lat - prev[0])
+        dlng.append(lng - prev[1])
+        dt.append(t - prev[2])
+        prev = (lat, lng, t)
+    result = tracks.update_one(
+        {"_id": doc["_id"], "count": doc.get("count")},
+        {"$set": {
+            "packed": Binary(pack_deltas(dlat, dlng, dt)),
+            "packed_count": len(kept),
+            "dlat": [], "dlng": [], "dt": [],
+            "compacted_at": datetime.now()
+        }}
+    )
+    return result.modified_count == 1
+
+
+# ---------------- PLAYBACK ----------------
+def load_trail(driver_id, day=None, epsilon_m=SIMPLIFY_EPSILON_M):
+    """
+    Simplified trail for playback with one read:
+    {driver_id, day, points: [[lat, lng, iso_timestamp]], recorded}
+    """
+    day = day or day_key()
+    doc = mongo.db.driver_tracks.find_one({"_id": track_id(driver_id, day)})
+    points = decode_track(doc)
+    trail = simplify(points, epsilon_m) if epsilon_m else points
+    return {
+        "driver_id": driver_id,
+        "day": day,
+        "recorded": (doc or {}).get("count", 0),
+        "points": [
+            [lat / SCALE, lng / SCALE, datetime.fromtimestamp(t, timezone.utc).isoformat()]
+            for lat, lng, t in trail
+        ]
+    }
@@ -0,0 +1,57 @@
+"""
+Resume points for long batch runs, kept in the `checkpoints` collection.
+
+A run walks its collection in _id order and saves the last _id it finished
+after every batch, so a restarted run continues from there instead of from
+the start. Checkpoint documents:
+    {_id: name, last_id, done, fingerprint, started_at, updated_at, finished_at, ...}
+
+`fingerprint` identifies the inputs the run was computing with (rates,
+options); a saved checkpoint is only resumed when it matches. Every helper
+takes an optional `db` for tools that run outside the app.
+"""
+
+from datetime import datetime
+from mongo import mongo
+
+
+def _checkpoints(db):
+    return (db if db is not None else mongo.db).checkpoints
+
+
+def get_checkpoint(name, db=None):
+    """The checkpoint for `name`, finished or not, or None"""
+    return _checkpoints(db).find_one({"_id": name})
+
+
+def load_checkpoint(name, fingerprint=None, db=None):
+    """The unfinished checkpoint for `name` with a matching fingerprint, or None"""
+    checkpoint = get_checkpoint(name, db)
+    if not checkpoint or checkpoint.get("finished_at"):
+        return None
+    if checkpoint.get("fingerprint") != fingerprint:
+        print(f"Checkpoint {name} was saved with different inputs, starting over")
+        return None
+    return checkpoint
+
+
+def start_checkpoint(name, fingerprint=None, db=None, **fields):
+    """Begin a fresh run, replacing any previous checkpoint for `name`"""
+    now = datetime.utcnow()
+    checkpoint = dict(fields, _id=name, last_id=None, done=0, fingerprint=fingerprint,
+                      started_at=now, updated_at=now, finished_at=None)
+    _checkpoints(db).replace_one({"_id": name}, checkpoint, upsert=True)
+    return checkpoint
+
+
+def save_checkpoint(name, last_id, done, db=None, **fields):
+    """Record progress after a finished batch"""
+    _checkpoints(db).update_one({"_id": name}, {"$set": dict(
+        fields, last_id=last_id, done=done, updated_at=datetime.utcnow()
+    )})
+
+
+def finish_checkpoint(name, db=None, **fields):
+    """Mark the run complete; the next run starts from the beginning"""
+    now = datetime.utcnow()
+    _checkpoints(db).update_one({"_id": name}, {"$set": dict(fields, finished_at=now, updated_at=now)})
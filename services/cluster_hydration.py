@@ -0,0 +1,81 @@
+from bson import ObjectId
+from mongo import mongo
+from services.projections import FieldSet, track
+
+# Upper bound on ids sent in a single $in query (keeps each command well under
+# the 16MB BSON limit while still being one round-trip for normal dashboards)
+IN_QUERY_CHUNK = 10000
+
+PICKUP_FIELDS = FieldSet("hydrate.pickups", "user_name", "address", "ewaste_type")
+STAFF_FIELDS = FieldSet("hydrate.staff", "name")
+
+
+def _chunks(values, size=IN_QUERY_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def fetch_by_ids(collection, ids, projection=None):
+    """Fetch documents by _id with batched $in queries, keyed by _id"""
+    docs = {}
+    for chunk in _chunks(ids):
+        for doc in track(projection, collection.find({"_id": {"$in": chunk}}, projection)):
+            docs[doc["_id"]] = doc
+    return docs
+
+
+def _as_object_id(value):
+    if isinstance(value, ObjectId):
+        return value
+    if value and ObjectId.is_valid(str(value)):
+        return ObjectId(str(value))
+    return None
+
+
+def hydrate_clusters(clusters):
+    """
+    Attach member pickup details, categories and staff names to each cluster.
+
+    Collects every pickup id and every engineer/driver id across all clusters,
+    loads them with one $in query per collection and joins them in memory.
+    """
+    pickup_ids = set()
+    staff_ids = set()
+    for cluster in clusters:
+        for u in cluster.get("users", []):
+            pickup_ids.add(u["user_id"])
+        for field in ("engineer_id", "driver_id"):
+            oid = _as_object_id(cluster.get(field))
+            if oid:
+                staff_ids.add(oid)
+
+    pickups = fetch_by_ids(mongo.db.pickup_requests, pickup_ids, PICKUP_FIELDS)
+    staff = fetch_by_ids(mongo.db.users, staff_ids, STAFF_FIELDS)
+
+    for cluster in clusters:
+        users = []
+        categories = set()
+        for u in cluster.get("users", []):
+            req = pickups.get(u["user_id"])
+            if req:
+                users.append({
+                    "name": req.get("user_name"),
+                    "address": req.get("address"),
+                    "weight": u.get("weight"),
+                    "distance": u.get("distance_km"),
+                    "type": req.get("ewaste_type", "Unknown")
+                })
+                # Collect all unique categories in this cluster
+                if req.get("ewaste_type"):
+                    categories.add(req.get("ewaste_type"))
+
+        cluster["user_details"] = users
+        cluster["categories"] = ", ".join(list(categories)) if categories else "Mixed E-Waste"
+
+        eng_doc = staff.get(_as_object_id(cluster.get("engineer_id")))
+        drv_doc = staff.get(_as_object_id(cluster.get("driver_id")))
+        cluster["engineer_name"] = eng_doc.get("name") if eng_doc else None
+        cluster["driver_name"] = drv_doc.get("name") if drv_doc else None
+
+    return clusters
@@ -0,0 +1,257 @@
+"""
+Clustering engines for the analyze-routes run.
+
+Both engines implement the same greedy rule: pickups are taken in descending
+weight order; each unused pickup becomes an anchor and absorbs the heaviest
+unused pickups within `radius_km` until the cluster reaches
+`weight_threshold`. They differ only in how neighbours are found:
+
+- "bruteforce" scans every pickup per anchor (O(N^2)), kept as the reference.
+- "kdtree" indexes pickups as 3D unit vectors (lat/lng in radians projected
+  onto the sphere, so chord length is monotonic in great-circle distance) and
+  answers "heaviest unused pickup within the radius" with a pruned tree search.
+
+Select with the CLUSTERING_ENGINE environment variable (default "kdtree").
+"""
+
+import math
+import os
+from services.geo import EARTH_RADIUS_KM, haversine_km
+
+CLUSTER_RADIUS_KM = 100
+CLUSTER_WEIGHT_THRESHOLD = 100
+ALMOST_READY_WEIGHT = 85
+
+_INF = float("inf")
+
+
+def pickup_weight(pickup):
+    # Handle both field names for compatibility
+    return pickup.get("approx_weight", pickup.get("ewaste_weight", 0)) or 0
+
+
+def cluster_status(total_weight, weight_threshold=CLUSTER_WEIGHT_THRESHOLD, almost_ready_weight=ALMOST_READY_WEIGHT):
+    if total_weight >= weight_threshold:
+        return "ready"
+    elif total_weight >= almost_ready_weight:
+        return "almost_ready"
+    return "pending"
+
+
+def _ordered(pickups):
+    """Pickups with coordinates, heaviest first"""
+    located = [p for p in pickups if p.get("latitude") is not None and p.get("longitude") is not None]
+    located.sort(key=pickup_weight, reverse=True)
+    return located
+
+
+def _new_plan(anchor):
+    return {
+        "anchor": anchor,
+        "members": [(anchor, 0.0)],
+        "total_weight": pickup_weight(anchor),
+        "max_distance": 0.0
+    }
+
+
+def _add_member(plan, pickup, dist):
+    plan["members"].append((pickup, dist))
+    plan["total_weight"] += pickup_weight(pickup)
+    plan["max_distance"] = max(plan["max_distance"], dist)
+
+
+# ---------------- BRUTE FORCE ----------------
+class BruteForceEngine:
+    name = "bruteforce"
+
+    def plan(self, pickups, radius_km=CLUSTER_RADIUS_KM, weight_threshold=CLUSTER_WEIGHT_THRESHOLD):
+        ordered = _ordered(pickups)
+        used = set()
+        plans = []
+
+        for i, anchor in enumerate(ordered):
+            if i in used:
+                continue
+            used.add(i)
+            plan = _new_plan(anchor)
+
+            for j, u in enumerate(ordered):
+                if plan["total_weight"] >= weight_threshold:
+                    break
+                if j in used:
+                    continue
+                dist = haversine_km(anchor["latitude"], anchor["longitude"], u["latitude"], u["longitude"])
+                if dist <= radius_km:
+                    _add_member(plan, u, dist)
+                    used.add(j)
+
+            plans.append(plan)
+        return plans
+
+
+# ---------------- KD-TREE ----------------
+def _unit_vector(lat, lng):
+    phi = math.radians(lat)
+    lam = math.radians(lng)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+class RankedKDTree:
+    """
+    Static 3D KD-tree (one point per node) where every point has a rank and
+    can be removed. Each node tracks the smallest rank still present in its
+    subtree, so "lowest-rank point within distance r" prunes on both space and
+    rank and typically touches O(log N) nodes.
+    """
+
+    def __init__(self, points):
+        n = len(points)
+        self.xyz = [None] * n
+        self.rank = [0] * n
+        self.left = [-1] * n
+        self.right = [-1] * n
+        self.parent = [-1] * n
+        self.lo = [None] * n
+        self.hi = [None] * n
+        self.min_rank = [_INF] * n
+        self.active = [True] * n
+        self.node_of_rank = [0] * n
+        self._next = 0
+        items = [(xyz, r) for r, xyz in enumerate(points)]
+        self.root = self._build(items, -1) if items else -1
+
+    def _build(self, items, parent):
+        xs = [p[0][0] for p in items]
+        ys = [p[0][1] for p in items]
+        zs = [p[0][2] for p in items]
+        lo = (min(xs), min(ys), min(zs))
+        hi = (max(xs), max(ys), max(zs))
+        axis = max(range(3), key=lambda a: hi[a] - lo[a])
+        items.sort(key=lambda p: p[0][axis])
+        mid = len(items) // 2
+
+        node = self._next
+        self._next += 1
+        xyz, r = items[mid]
+        self.xyz[node] = xyz
+        self.rank[node] = r
+        self.parent[node] = parent
+        self.lo[node] = lo
+        self.hi[node] = hi
+        self.node_of_rank[r] = node
+
+        if mid > 0:
+            self.left[node] = self._build(items[:mid], node)
+        if mid + 1 < len(items):
+            self.right[node] = self._build(items[mid + 1:], node)
+        self._refresh(node)
+        return node
+
+    def _refresh(self, node):
+        best = self.rank[node] if self.active[node] else _INF
+        for child in (self.left[node], self.right[node]):
+            if child != -1 and self.min_rank[child] < best:
+                best = self.min_rank[child]
+        changed = best != self.min_rank[node]
+        self.min_rank[node] = best
+        return changed
+
+    def remove(self, rank):
+        node = self.node_of_rank[rank]
+        self.active[node] = False
+        while node != -1 and self._refresh(node):
+            node = self.parent[node]
+
+    def lowest_rank_within(self, q, chord):
+        """Rank of the lowest-ranked active point within chord distance of q, or None"""
+        r2 = chord * chord
+        best = _INF
+        stack = [self.root] if self.root != -1 else []
+        while stack:
+            node = stack.pop()
+            if self.min_rank[node] >= best:
+                continue
+            lo = self.lo[node]
+            hi = self.hi[node]
+            d2 = 0.0
+            for a in range(3):
+                if q[a] < lo[a]:
+                    d2 += (lo[a] - q[a]) ** 2
+                elif q[a] > hi[a]:
+                    d2 += (q[a] - hi[a]) ** 2
+            if d2 > r2:
+                continue
+
+            if self.active[node] and self.rank[node] < best:
+                p = self.xyz[node]
+                if (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2 <= r2:
+                    best = self.rank[node]
+
+            left, right = self.left[node], self.right[node]
+            l_rank = self.min_rank[left] if left != -1 else _INF
+            r_rank = self.min_rank[right] if right != -1 else _INF
+            # Visit the child holding the lower rank first (pushed last)
+            if l_rank <= r_rank:
+                if r_rank < best:
+                    stack.append(right)
+                if l_rank < best:
+                    stack.append(left)
+            else:
+                if l_rank < best:
+                    stack.append(left)
+                if r_rank < best:
+                    stack.append(right)
+        return None if best == _INF else best
+
+
+class KDTreeEngine:
+    name = "kdtree"
+
+    def plan(self, pickups, radius_km=CLUSTER_RADIUS_KM, weight_threshold=CLUSTER_WEIGHT_THRESHOLD):
+        ordered = _ordered(pickups)
+        if not ordered:
+            return []
+        tree = RankedKDTree([_unit_vector(p["latitude"], p["longitude"]) for p in ordered])
+        # Chord length on the unit sphere for the great-circle radius
+        chord = 2 * math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2)
+        plans = []
+
+        while True:
+            i = tree.min_rank[tree.root]
+            if i == _INF:
+                break
+            anchor = ordered[i]
+            tree.remove(i)
+            plan = _new_plan(anchor)
+            q = _unit_vector(anchor["latitude"], anchor["longitude"])
+
+            while plan["total_weight"] < weight_threshold:
+                j = tree.lowest_rank_within(q, chord)
+                if j is None:
+                    break
+                u = ordered[j]
+                tree.remove(j)
+                dist = haversine_km(anchor["latitude"], anchor["longitude"], u["latitude"], u["longitude"])
+                _add_member(plan, u, dist)
+
+            plans.append(plan)
+        return plans
+
+
+ENGINES = {
+    BruteForceEngine.name: BruteForceEngine,
+    KDTreeEngine.name: KDTreeEngine
+}
+
+
+def get_engine(name=None):
+    name = name or os.getenv("CLUSTERING_ENGINE", KDTreeEngine.name)
+    if name not in ENGINES:
+        raise ValueError(f"Unknown clustering engine: {name}")
+    return ENGINES[name]()
+
+
+def plan_clusters(pickups, radius_km=CLUSTER_RADIUS_KM, weight_threshold=CLUSTER_WEIGHT_THRESHOLD, engine=None):
+    """Module-level entry point so a plan can run in a worker process"""
+    return get_engine(engine).plan(pickups, radius_km, weight_threshold)
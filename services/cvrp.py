@@ -0,0 +1,275 @@
+"""
+Capacitated vehicle routing for analyze-routes (mode "cvrp").
+
+Every pending pickup is assigned to its nearest regional warehouse (depot).
+Each depot's pickups are routed with the Clarke-Wright savings heuristic:
+start with one depot -> pickup -> depot tour per pickup and merge tour ends in
+descending savings order while the merged load fits the vehicle capacity.
+Local search (relocating stops between tours, 2-opt within a tour) then runs
+until no move helps or the time budget is spent. Finished tours are handed to
+the available drivers longest-first onto the least-loaded driver, so drivers
+get balanced work even when there are more tours than drivers.
+
+The solver works on plain tuples so it can run on the job compute pool
+(`run_cvrp`, called by the analyze_routes job); the result is written back as
+collection_clusters from the job thread.
+"""
+
+import time
+from datetime import datetime
+import numpy as np
+from bson import ObjectId
+from mongo import mongo
+from services.geo import REGIONAL_WAREHOUSES, haversine_matrix, nearest_warehouses
+from services.clustering import cluster_status
+from services.incremental_clustering import insert_planned_clusters
+from services.jobs import compute_pool
+from services.spatial_index import geo_fields
+
+DEFAULT_VEHICLE_CAPACITY_KG = 500
+# Pickup weights (and cluster total_weight / cluster_status) are in grams
+GRAMS_PER_KG = 1000
+DEFAULT_TIME_BUDGET_SECONDS = 10
+AVG_SPEED_KMH = 25
+SERVICE_MINUTES_PER_STOP = 10
+# Larger depot groups are split into angular sectors so distance matrices stay small
+MAX_STOPS_PER_SOLVE = 2000
+
+
+# ---------------- SOLVER ----------------
+def _tour_length(dist, tour):
+    """Length of depot(0) -> tour -> depot(0)"""
+    if not tour:
+        return 0.0
+    path = [0] + tour + [0]
+    return float(sum(dist[a, b] for a, b in zip(path[:-1], path[1:])))
+
+
+def clarke_wright(dist, demand, capacity):
+    """
+    Savings construction. `dist` includes the depot at index 0; `demand[i]` is
+    the load of node i (demand[0] = 0). Returns a list of tours (node lists).
+    """
+    n = len(dist)
+    tours = {i: [i] for i in range(1, n)}
+    tour_of = {i: i for i in range(1, n)}
+    load = {i: demand[i] for i in range(1, n)}
+
+    savings = dist[0][:, None] + dist[0][None, :] - dist
+    iu, ju = np.triu_indices(n, k=1)
+    mask = iu > 0
+    iu, ju = iu[mask], ju[mask]
+    order = np.argsort(-savings[iu, ju], kind="stable")
+
+    for k in order:
+        i, j = int(iu[k]), int(ju[k])
+        ti, tj = tour_of[i], tour_of[j]
+        if ti == tj or load[ti] + load[tj] > capacity:
+            continue
+        a, b = tours[ti], tours[tj]
+        # Only tour ends can be joined
+        if a[-1] == i and b[0] == j:
+            merged = a + b
+        elif a[0] == i and b[-1] == j:
+            merged = b + a
+        elif a[-1] == i and b[-1] == j:
+            merged = a + b[::-1]
+        elif a[0] == i and b[0] == j:
+            merged = a[::-1] + b
+        else:
+            continue
+        tours[ti] = merged
+        load[ti] += load[tj]
+        del tours[tj], load[tj]
+        for node in b:
+            tour_of[node] = ti
+    return list(tours.values())
+
+
+def _two_opt_tour(dist, tour):
+    path = [0] + tour + [0]
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 2):
+            for j in range(i + 1, len(path) - 1):
+                delta = (dist[path[i - 1], path[j]] + dist[path[i], path[j + 1]]
+                         - dist[path[i - 1], path[i]] - dist[path[j], path[j + 1]])
+                if delta < -1e-9:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    improved = True
+    return path[1:-1]
+
+
+def _relocate(dist, demand, capacity, tours, deadline):
+    """Move single stops between tours while it shortens the total; returns True if anything moved"""
+    loads = [sum(demand[n] for n in t) for t in tours]
+    moved = False
+    for a in range(len(tours)):
+        for node in list(tours[a]):
+            if time.monotonic() > deadline:
+                return moved
+            src = tours[a]
+            idx = src.index(node)
+            prev = src[idx - 1] if idx > 0 else 0
+            nxt = src[idx + 1] if idx + 1 < len(src) else 0
+            gain = dist[prev, node] + dist[node, nxt] - dist[prev, nxt]
+            best = None
+            for b in range(len(tours)):
+                if b == a or loads[b] + demand[node] > capacity:
+                    continue
+                dst = [0] + tours[b] + [0]
+                costs = dist[dst[:-1], node] + dist[node, dst[1:]] - dist[dst[:-1], dst[1:]]
+                k = int(np.argmin(costs))
+                if costs[k] < gain - 1e-9 and (best is None or costs[k] < best[0]):
+                    best = (costs[k], b, k)
+            if best:
+                _, b, k = best
+                src.remove(node)
+                tours[b].insert(k, node)
+                loads[a] -= demand[node]
+                loads[b] += demand[node]
+                moved = True
+    return moved
+
+
+def solve_depot(coords, demand, capacity, time_budget):
+    """
+    CVRP for one depot. coords[0] is the depot, coords[1:] the stops.
+    Returns tours as lists of stop indexes (1-based, matching coords).
+    """
+    deadline = time.monotonic() + time_budget
+    lats = [c[0] for c in coords]
+    lngs = [c[1] for c in coords]
+    dist = haversine_matrix(lats, lngs, lats, lngs)
+
+    tours = clarke_wright(dist, demand, capacity)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        tours = [_two_opt_tour(dist, t) for t in tours]
+        improved = _relocate(dist, demand, capacity, tours, deadline)
+        tours = [t for t in tours if t]
+    return [(t, _tour_length(dist, t)) for t in tours]
+
+
+def _balance(routes, vehicles):
+    """Hand routes to vehicles longest-first onto the least-loaded vehicle"""
+    if not vehicles:
+        return
+    workload = {v: 0.0 for v in vehicles}
+    for route in sorted(routes, key=lambda r: r["duration_minutes"], reverse=True):
+        vehicle = min(vehicles, key=lambda v: workload[v])
+        route["vehicle"] = vehicle
+        workload[vehicle] += route["duration_minutes"]
+
+
+def solve_cvrp(stops, depots, vehicles, capacity, time_budget=DEFAULT_TIME_BUDGET_SECONDS):
+    """
+    stops: [(pickup_id, lat, lng, weight)], depots: [(name, lat, lng)],
+    vehicles: [driver_id]; weights and capacity share one unit. Returns routes as
+    {depot, stops: [pickup_id], load, distance_km, duration_minutes, vehicle}.
+    """
+    if not stops or not depots:
+        return []
+    depot_idx, _ = nearest_warehouses(
+        [s[1] for s in stops],
+        [s[2] for s in stops],
+        [{"lat": d[1], "lng": d[2]} for d in depots]
+    )
+    by_depot = {}
+    for stop, d in zip(stops, depot_idx):
+        by_depot.setdefault(int(d), []).append(stop)
+
+    groups = []
+    for d, members in by_depot.items():
+        _, dlat, dlng = depots[d]
+        if len(members) > MAX_STOPS_PER_SOLVE:
+            # Sweep decomposition: sectors of consecutive bearings around the depot
+            members.sort(key=lambda s: np.arctan2(s[1] - dlat, s[2] - dlng))
+        for start in range(0, len(members), MAX_STOPS_PER_SOLVE):
+            groups.append((d, members[start:start + MAX_STOPS_PER_SOLVE]))
+    groups.sort(key=lambda g: -len(g[1]))
+
+    started = time.monotonic()
+    routes = []
+    for n_done, (d, members) in enumerate(groups):
+        # Share the remaining budget across the groups still to solve
+        remaining = time_budget - (time.monotonic() - started)
+        budget = max(remaining / (len(groups) - n_done), 0.1)
+        name, dlat, dlng = depots[d]
+        coords = [(dlat, dlng)] + [(s[1], s[2]) for s in members]
+        demand = [0.0] + [float(s[3]) for s in members]
+        for tour, length in solve_depot(coords, demand, capacity, budget):
+            routes.append({
+                "depot": name,
+                "stops": [members[i - 1][0] for i in tour],
+                "load": sum(demand[i] for i in tour),
+                "distance_km": round(length, 2),
+                "duration_minutes": int(round(length / AVG_SPEED_KMH * 60 + SERVICE_MINUTES_PER_STOP * len(tour))),
+                "vehicle": None
+            })
+    _balance(routes, vehicles)
+    return routes
+
+
+# ---------------- PERSISTENCE ----------------
+def load_problem():
+    """Read pending unclustered pickups (weights in grams) and available drivers into solver input"""
+    pickups = mongo.db.pickup_requests.find(
+        {"status": "pending", "cluster_id": None, "latitude": {"$ne": None}, "longitude": {"$ne": None}},
+        {"latitude": 1, "longitude": 1, "approx_weight": 1, "ewaste_weight": 1}
+    )
+    stops = []
+    for p in pickups:
+        weight = p.get("approx_weight", p.get("ewaste_weight", 0)) or 0
+        try:
+            stops.append((str(p["_id"]), float(p["latitude"]), float(p["longitude"]), float(weight)))
+        except (TypeError, ValueError):
+            continue
+    drivers = mongo.db.users.find({"role": "driver", "available_tomorrow": {"$ne": False}}, {"_id": 1})
+    vehicles = [str(d["_id"]) for d in drivers]
+    depots = [(wh["name"], wh["lat"], wh["lng"]) for wh in REGIONAL_WAREHOUSES]
+    return stops, depots, vehicles
+
+
+def _refresh_cluster(cluster):
+    cluster["status"] = cluster_status(cluster["total_weight"])
+
+
+def save_routes(routes, stop_info):
+    """Claim each route's pickups and insert a cluster listing the ones it won; returns the new cluster ids"""
+    now = datetime.utcnow()
+    cluster_docs = []
+    for route in routes:
+        user_ids = [ObjectId(pid) for pid in route["stops"]]
+        anchor_lat, anchor_lng = stop_info[route["stops"][0]][:2]
+        cluster_docs.append(dict(geo_fields(anchor_lat, anchor_lng), **{
+            "anchor_user_id": user_ids[0],
+            "anchor_location": {"lat": anchor_lat, "lng": anchor_lng},
+            "destination": route["depot"],
+            "total_weight": route["load"],
+            "user_count": len(user_ids),
+            "users": [{"user_id": uid, "weight": stop_info[str(uid)][2]} for uid in user_ids],
+            "status": cluster_status(route["load"]),
+            "solver": "cvrp",
+            "suggested_driver_id": route["vehicle"],
+            "route_distance_km": route["distance_km"],
+            "estimated_duration_minutes": route["duration_minutes"],
+            "admin_override": False,
+            "created_at": now
+        }))
+    # Only the stops each route actually claims are listed on its cluster
+    return insert_planned_clusters(cluster_docs, _refresh_cluster)
+
+
+def run_cvrp(capacity_kg, time_budget, report):
+    """Solve for the current backlog on the compute pool and save the routes as clusters"""
+    report("loading")
+    stops, depots, vehicles = load_problem()
+    stop_info = {s[0]: s[1:] for s in stops}
+    report("solving", 0, len(stops))
+    # Stop weights are grams, so route loads stay in the unit cluster_status expects
+    capacity = capacity_kg * GRAMS_PER_KG
+    routes = compute_pool().submit(solve_cvrp, stops, depots, vehicles, capacity, time_budget).result()
+    report("saving", len(stops), len(stops))
+    return save_routes(routes, stop_info), len(stops)
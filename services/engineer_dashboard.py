@@ -0,0 +1,56 @@
+"""
+Engineer dashboard data in one round-trip.
+
+`engineer_jobs()` serves the dashboard from a single aggregation on
+collection_clusters: the engineer's clusters $lookup their member pickups by
+`users.user_id` and their driver/doctor by the stored id strings (converted to
+ObjectIds server-side; malformed ids simply find nobody), and a final $project
+keeps only the fields the dashboard renders. The previous per-cluster loop
+issued 1 + 3 queries per cluster (pickups $in, driver, doctor);
+benchmarks/bench_engineer_dashboard.py compares the two.
+"""
+
+from mongo import mongo
+
+CLUSTER_FIELDS = [
+    "destination", "status", "user_count", "users.user_id", "scheduled_for",
+    "estimated_duration_minutes", "route_distance_km"
+]
+PICKUP_FIELDS = ["_id", "user_name", "ewaste_type", "address", "area", "approx_weight", "ewaste_weight", "items"]
+STAFF_FIELDS = ["_id", "name"]
+
+
+def _object_id(field):
+    return {"$convert": {"input": f"${field}", "to": "objectId", "onError": None, "onNull": None}}
+
+
+def engineer_jobs_pipeline(engineer_id):
+    projection = {field: 1 for field in CLUSTER_FIELDS}
+    projection.update({f"pickups.{field}": 1 for field in PICKUP_FIELDS})
+    projection.update({f"{role}.{field}": 1 for role in ("driver", "doctor") for field in STAFF_FIELDS})
+    return [
+        {"$match": {"engineer_id": engineer_id}},
+        {"$lookup": {"from": "pickup_requests", "localField": "users.user_id", "foreignField": "_id", "as": "pickups"}},
+        {"$addFields": {"driver_oid": _object_id("driver_id"), "doctor_oid": _object_id("doctor_id")}},
+        {"$lookup": {"from": "users", "localField": "driver_oid", "foreignField": "_id", "as": "driver"}},
+        {"$lookup": {"from": "users", "localField": "doctor_oid", "foreignField": "_id", "as": "doctor"}},
+        {"$project": projection}
+    ]
+
+
+def engineer_jobs(engineer_id, db=None):
+    """[{cluster, pickups, driver, doctor}] for every cluster assigned to the engineer"""
+    db = db if db is not None else mongo.db
+    jobs = []
+    for cluster in db.collection_clusters.aggregate(engineer_jobs_pipeline(engineer_id)):
+        pickups = cluster.pop("pickups", [])
+        driver = cluster.pop("driver", [])
+        doctor = cluster.pop("doctor", [])
+        cluster["_id_str"] = str(cluster["_id"])
+        jobs.append({
+            "cluster": cluster,
+            "pickups": pickups,
+            "driver": driver[0] if driver else None,
+            "doctor": doctor[0] if doctor else None
+        })
+    return jobs
@@ -0,0 +1,161 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+# ---------------- WAREHOUSE LOCATIONS ----------------
+WAREHOUSES = [
+    {"id": 1, "name": "North Warehouse (Borivali)", "lat": 19.2300, "lng": 72.8567},
+    {"id": 2, "name": "West Warehouse (Andheri)", "lat": 19.1136, "lng": 72.8697},
+    {"id": 3, "name": "East Warehouse (Thane)", "lat": 19.2183, "lng": 72.9781},
+    {"id": 4, "name": "South Warehouse (Colaba)", "lat": 18.9067, "lng": 72.8147},
+    {"id": 5, "name": "CENTRAL HUB (Ghatkopar)", "lat": 19.0860, "lng": 72.9090} # Central Collection Point
+]
+# Drop-off points for analyze-routes clusters (excludes the central hub)
+REGIONAL_WAREHOUSES = WAREHOUSES[:4]
+
+# ---------------- GEOHASH ----------------
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_NEIGHBOUR_STEPS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Precision stored on documents; prefixes of it are used for coarser cells
+GEOHASH_PRECISION = 7
+
+
+def _cell_bits(precision):
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2  # (lng bits, lat bits)
+
+
+def cell_size_deg(precision):
+    """(lat_span, lng_span) in degrees of a geohash cell"""
+    lng_bits, lat_bits = _cell_bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch = ch << 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch = ch << 1
+                lat_hi = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[ch])
+            bit = 0
+            ch = 0
+    return "".join(chars)
+
+
+def precision_for_radius(radius_km, lat):
+    """
+    Finest geohash precision whose cells are at least `radius_km` on each side
+    at latitude `lat`, so a 3x3 block of cells covers the search circle.
+    """
+    km_per_deg = math.pi * EARTH_RADIUS_KM / 180
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lng_span = cell_size_deg(precision)
+        height_km = lat_span * km_per_deg
+        width_km = lng_span * km_per_deg * math.cos(math.radians(lat))
+        if min(height_km, width_km) >= radius_km:
+            return precision
+    return 1
+
+
+def geohash_cells_around(lat, lng, radius_km):
+    """Geohash prefixes of the 3x3 cell block covering `radius_km` around a point"""
+    precision = precision_for_radius(radius_km, lat)
+    lat_span, lng_span = cell_size_deg(precision)
+    cells = set()
+    for d_lat, d_lng in _NEIGHBOUR_STEPS:
+        n_lat = lat + d_lat * lat_span
+        if n_lat > 90 or n_lat < -90:
+            continue
+        n_lng = (lng + d_lng * lng_span + 180) % 360 - 180
+        cells.add(geohash_encode(n_lat, n_lng, precision))
+    return sorted(cells)
+
+
+# ---------------- GEOJSON ----------------
+def to_geojson_point(lat, lng):
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+# ---------------- DISTANCE ----------------
+def haversine_km(lat1, lon1, lat2, lon2):
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+
+    a = (
+        math.sin(d_lat / 2) ** 2 +
+        math.cos(math.radians(lat1)) *
+        math.cos(math.radians(lat2)) *
+        math.sin(d_lon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+# ---------------- VECTORIZED DISTANCE ----------------
+def haversine_np(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in km between broadcastable arrays of coordinates
+    (degrees). Returns a NumPy array shaped like the broadcast inputs.
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=float))
+    lng1 = np.radians(np.asarray(lng1, dtype=float))
+    lat2 = np.radians(np.asarray(lat2, dtype=float))
+    lng2 = np.radians(np.asarray(lng2, dtype=float))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2 +
+        np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_one_to_many(lat, lng, lats, lngs):
+    """Distances (km) from one point to each of `lats`/`lngs`"""
+    return haversine_np(lat, lng, lats, lngs)
+
+
+def haversine_matrix(lats1, lngs1, lats2, lngs2):
+    """(len(lats1), len(lats2)) matrix of distances in km"""
+    lats1 = np.asarray(lats1, dtype=float)[:, None]
+    lngs1 = np.asarray(lngs1, dtype=float)[:, None]
+    return haversine_np(lats1, lngs1, np.asarray(lats2, dtype=float)[None, :], np.asarray(lngs2, dtype=float)[None, :])
+
+
+def nearest_warehouses(lats, lngs, warehouses=WAREHOUSES):
+    """
+    Nearest warehouse for many points in one array operation.
+    Returns (indices into `warehouses`, distances in km) as NumPy arrays.
+    """
+    if len(lats) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    dist = haversine_matrix(lats, lngs, [wh["lat"] for wh in warehouses], [wh["lng"] for wh in warehouses])
+    idx = dist.argmin(axis=1)
+    return idx, dist[np.arange(len(idx)), idx]
+
+
+def nearest_warehouse(lat, lng, warehouses=WAREHOUSES):
+    """(warehouse, distance_km) closest to a single point"""
+    idx, dist = nearest_warehouses([lat], [lng], warehouses)
+    return warehouses[int(idx[0])], float(dist[0])
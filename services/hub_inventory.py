@@ -0,0 +1,100 @@
+"""
+Hub inventory: every pickup delivered to a warehouse hub, with its value.
+
+One aggregation on collection_clusters (matched on destination + delivered
+status, indexed by destination_status) joins each cluster's pickups by
+cluster_id and unwinds them, so the whole hub streams back through a single
+cursor. Values come from the cached price tables (services/price_cache.py):
+the pickup's metal rate when its metal has a price, else its category rate,
+times final_weight.
+"""
+
+from mongo import mongo
+from services.price_cache import price_tables
+
+DELIVERED_STATUSES = ["delivered", "completed"]
+INVENTORY_BATCH_SIZE = 1000
+
+PICKUP_FIELDS = [
+    "user_name", "ewaste_type", "status", "final_weight", "approx_weight", "ewaste_weight",
+    "final_quality", "collected_at", "items", "metal_type", "address", "area"
+]
+
+
+def hub_inventory_pipeline(hub_name):
+    return [
+        {"$match": {"destination": hub_name, "status": {"$in": DELIVERED_STATUSES}}},
+        {"$project": {"cluster_id": {"$toString": "$_id"}}},
+        {"$lookup": {"from": "pickup_requests", "localField": "cluster_id", "foreignField": "cluster_id", "as": "pickup"}},
+        {"$unwind": "$pickup"},
+        {"$replaceRoot": {"newRoot": "$pickup"}},
+        {"$project": {field: 1 for field in PICKUP_FIELDS}}
+    ]
+
+
+def estimated_value(pickup, prices):
+    weight = pickup.get("final_weight")
+    if not weight:
+        return 0
+    metal_type = pickup.get("metal_type")
+    if metal_type and metal_type in prices.metal:
+        return weight * prices.metal[metal_type]
+    return weight * prices.category.get(pickup.get("ewaste_type", "Unknown"), 0)
+
+
+def iter_hub_pickups(hub_name):
+    """Yield (inventory row, counted weight) for each of the hub's pickups"""
+    prices = price_tables()
+    cursor = mongo.db.collection_clusters.aggregate(hub_inventory_pipeline(hub_name), batchSize=INVENTORY_BATCH_SIZE)
+    for pickup in cursor:
+        weight = pickup.get("final_weight", pickup.get("approx_weight", pickup.get("ewaste_weight", 0)))
+        row = {
+            "_id": str(pickup["_id"]),
+            "user_name": pickup.get("user_name", "Unknown"),
+            "ewaste_type": pickup.get("ewaste_type", "Unknown"),
+            "status": pickup.get("status", "pending"),
+            "final_weight": pickup.get("final_weight"),
+            "approx_weight": pickup.get("approx_weight"),
+            "final_quality": pickup.get("final_quality"),
+            "collected_at": pickup.get("collected_at"),
+            "items": pickup.get("items", []),
+            "metal_type": pickup.get("metal_type"),
+            "estimated_value": round(estimated_value(pickup, prices), 2),
+            "address": pickup.get("address"),
+            "area": pickup.get("area")
+        }
+        yield row, weight or 0
+
+
+class InventoryTotals:
+    """Running totals over inventory rows"""
+
+    def __init__(self, hub_name):
+        self.hub_name = hub_name
+        self.count = 0
+        self.weight = 0
+        self.value = 0
+        self.categories = {}
+
+    def add(self, row, weight):
+        self.count += 1
+        self.weight += weight
+        self.value += row["estimated_value"]
+        self.categories[row["ewaste_type"]] = self.categories.get(row["ewaste_type"], 0) + 1
+        return row
+
+    def as_dict(self):
+        return {
+            "hub": self.hub_name,
+            "total_pickups": self.count,
+            "total_weight": round(self.weight, 2),
+            "total_estimated_value": round(self.value, 2),
+            "category_breakdown": self.categories
+        }
+
+
+def hub_inventory(hub_name):
+    """Totals plus every pickup row for the hub"""
+    totals = InventoryTotals(hub_name)
+    pickups = [totals.add(row, weight) for row, weight in iter_hub_pickups(hub_name)]
+    return dict(totals.as_dict(), pickups=pickups)
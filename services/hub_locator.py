@@ -0,0 +1,118 @@
+"""
+Precomputed nearest-hub lookup.
+
+A fine lat/lng grid over the Mumbai bounding box stores, per cell, the hub
+that is nearest to every point in the cell. Cells that straddle a Voronoi
+boundary are flagged and resolved exactly against the hubs, as are points
+outside the box. Nearest-hub and distance-to-hub are then O(1) per point.
+
+Locators are cached per warehouse list and rebuilt automatically when the
+list (names or coordinates) changes.
+"""
+
+import math
+import threading
+import numpy as np
+from services.geo import WAREHOUSES, EARTH_RADIUS_KM, haversine_km, haversine_np, nearest_warehouses
+
+# (lat_min, lng_min, lat_max, lng_max)
+MUMBAI_BBOX = (18.80, 72.70, 19.45, 73.20)
+GRID_STEP_DEG = 0.005  # ~0.55 km cells
+
+
+def _fingerprint(warehouses):
+    return tuple((wh["name"], float(wh["lat"]), float(wh["lng"])) for wh in warehouses)
+
+
+class HubLocator:
+    def __init__(self, warehouses, bbox=MUMBAI_BBOX, step=GRID_STEP_DEG):
+        self.warehouses = list(warehouses)
+        self.fingerprint = _fingerprint(self.warehouses)
+        self.lat_min, self.lng_min, self.lat_max, self.lng_max = bbox
+        self.step = step
+        self.rows = int(math.ceil((self.lat_max - self.lat_min) / step))
+        self.cols = int(math.ceil((self.lng_max - self.lng_min) / step))
+        self.hub_lats = np.array([wh["lat"] for wh in self.warehouses], dtype=float)
+        self.hub_lngs = np.array([wh["lng"] for wh in self.warehouses], dtype=float)
+        self._build()
+
+    def _build(self):
+        center_lats = self.lat_min + (np.arange(self.rows) + 0.5) * self.step
+        center_lngs = self.lng_min + (np.arange(self.cols) + 0.5) * self.step
+        grid_lats, grid_lngs = np.meshgrid(center_lats, center_lngs, indexing="ij")
+
+        # (rows, cols, hubs) distances from each cell centre
+        dist = haversine_np(grid_lats[..., None], grid_lngs[..., None], self.hub_lats, self.hub_lngs)
+        nearest = dist.argmin(axis=2)
+        best = np.take_along_axis(dist, nearest[..., None], axis=2)[..., 0]
+
+        # Any point in the cell is within half a diagonal of the centre, so a hub
+        # can only win somewhere in the cell if it is within one diagonal of the best
+        km_per_deg = math.pi * EARTH_RADIUS_KM / 180
+        half_diag = 0.5 * self.step * km_per_deg * np.sqrt(1 + np.cos(np.radians(grid_lats)) ** 2)
+        contenders = (dist - best[..., None] <= 2 * half_diag[..., None]).sum(axis=2)
+
+        self.nearest = nearest.astype(np.int16)
+        self.ambiguous = contenders > 1
+
+    def _cell(self, lat, lng):
+        row = int((lat - self.lat_min) // self.step)
+        col = int((lng - self.lng_min) // self.step)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
+        return None
+
+    def nearest_hub(self, lat, lng):
+        """(warehouse, distance_km) nearest to a point"""
+        cell = self._cell(lat, lng)
+        if cell is not None and not self.ambiguous[cell]:
+            wh = self.warehouses[int(self.nearest[cell])]
+        else:
+            wh = min(self.warehouses, key=lambda w: haversine_km(lat, lng, w["lat"], w["lng"]))
+        return wh, haversine_km(lat, lng, wh["lat"], wh["lng"])
+
+    def nearest_hubs(self, lats, lngs):
+        """Vectorized nearest_hub: (indices into warehouses, distances in km)"""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        if lats.size == 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+
+        rows = np.floor((lats - self.lat_min) / self.step).astype(int)
+        cols = np.floor((lngs - self.lng_min) / self.step).astype(int)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        r = np.where(inside, rows, 0)
+        c = np.where(inside, cols, 0)
+        idx = self.nearest[r, c].astype(int)
+        exact = ~inside | self.ambiguous[r, c]
+
+        if exact.any():
+            idx[exact], _ = nearest_warehouses(lats[exact], lngs[exact], self.warehouses)
+        return idx, haversine_np(lats, lngs, self.hub_lats[idx], self.hub_lngs[idx])
+
+
+_locators = {}
+_lock = threading.Lock()
+
+
+def get_hub_locator(warehouses=WAREHOUSES):
+    """Cached locator for this warehouse list; rebuilt when the list changes"""
+    key = _fingerprint(warehouses)
+    locator = _locators.get(key)
+    if locator is None:
+        with _lock:
+            locator = _locators.get(key)
+            if locator is None:
+                if len(_locators) >= 8:
+                    _locators.clear()
+                locator = HubLocator(warehouses)
+                _locators[key] = locator
+    return locator
+
+
+def nearest_hub(lat, lng, warehouses=WAREHOUSES):
+    return get_hub_locator(warehouses).nearest_hub(lat, lng)
+
+
+def nearest_hubs(lats, lngs, warehouses=WAREHOUSES):
+    return get_hub_locator(warehouses).nearest_hubs(lats, lngs)
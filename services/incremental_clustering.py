@@ -0,0 +1,316 @@
+"""
+Incremental clustering for pickups created through the user form.
+
+Open clusters (status pending/almost_ready, no engineer yet) carry their
+anchor as indexed `location`/`geohash` fields, so a new pickup looks up the
+open clusters within CLUSTER_RADIUS_KM with one geo query. It joins the
+open cluster it fills best (highest resulting weight under CLUSTER_MAX_WEIGHT,
+nearest on ties). The join is one conditional pipeline update that appends
+the member, bumps the totals and recomputes the status together, so two
+concurrent joins can neither overfill a cluster nor leave a stale status.
+A new cluster is created only when no open cluster has room.
+
+Pickups are bound to clusters with conditional claims: `cluster_id` is set
+only while it is still absent, and a cluster lists only the members it won,
+so concurrent requests (or an analyze-routes job, via
+`insert_planned_clusters`) running in other gunicorn workers can never
+double-book a pickup. A join that loses every race for room is
+retried with jittered exponential back-off before a new cluster is made.
+"""
+
+import random
+import time
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne, UpdateMany, ReturnDocument
+from mongo import mongo
+from services.geo import haversine_one_to_many
+from services.hub_locator import nearest_hub
+from services.kpi_snapshots import record_status_change
+from services.spatial_index import geo_fields, find_nearby, find_nearby_pickups
+
+CLUSTER_RADIUS_KM = 15
+# Weights are in grams, like pickup approx_weight and cluster total_weight
+CLUSTER_MIN_WEIGHT = 50000   # 50 kg: ready for collection
+CLUSTER_MAX_WEIGHT = 150000  # 150 kg: no more members join
+ALMOST_READY_RATIO = 0.7
+OPEN_STATUSES = ["pending", "almost_ready"]
+CLAIM_ATTEMPTS = 4
+CLAIM_BACKOFF_SECONDS = 0.02
+
+OPEN_CLUSTER_FIELDS = {"anchor_location": 1, "total_weight": 1, "destination": 1}
+# Unclustered pickups a new anchor can absorb
+NEARBY_PICKUP_QUERY = {"status": {"$in": ["pending", "clustered"]}, "cluster_id": {"$exists": False}}
+
+
+def cluster_status(total_weight):
+    if total_weight >= CLUSTER_MIN_WEIGHT:
+        return "ready"
+    elif total_weight >= CLUSTER_MIN_WEIGHT * ALMOST_READY_RATIO:
+        return "almost_ready"
+    return "pending"
+
+
+def _status_expression():
+    # Server-side equivalent of cluster_status() on the updated total_weight
+    return {"$switch": {
+        "branches": [
+            {"case": {"$gte": ["$total_weight", CLUSTER_MIN_WEIGHT]}, "then": "ready"},
+            {"case": {"$gte": ["$total_weight", CLUSTER_MIN_WEIGHT * ALMOST_READY_RATIO]}, "then": "almost_ready"}
+        ],
+        "default": "pending"
+    }}
+
+
+def open_cluster_query(weight):
+    return {
+        "status": {"$in": OPEN_STATUSES},
+        "engineer_id": None,
+        "total_weight": {"$lte": CLUSTER_MAX_WEIGHT - weight}
+    }
+
+
+def find_open_clusters(lat, lng, weight):
+    """Open clusters within the radius that still have room for `weight`, best fit first"""
+    clusters = find_nearby(
+        mongo.db.collection_clusters, lat, lng, CLUSTER_RADIUS_KM,
+        open_cluster_query(weight), OPEN_CLUSTER_FIELDS
+    )
+    clusters = [c for c in clusters if c.get("anchor_location", {}).get("lat") is not None]
+    if not clusters:
+        return []
+    distances = haversine_one_to_many(
+        lat, lng,
+        [c["anchor_location"]["lat"] for c in clusters],
+        [c["anchor_location"]["lng"] for c in clusters]
+    )
+    ranked = [
+        (c, float(d)) for c, d in zip(clusters, distances)
+        if d <= CLUSTER_RADIUS_KM
+    ]
+    ranked.sort(key=lambda cd: (-(cd[0].get("total_weight") or 0), cd[1]))
+    return ranked
+
+
+def join_cluster(cluster_id, pickup_id, weight, distance_km):
+    """
+    Atomically append the pickup to an open cluster if it still has room.
+    Returns the cluster's new status, or None if the cluster filled up,
+    closed, or was assigned in the meantime.
+    """
+    member = {"user_id": pickup_id, "weight": weight, "distance_km": round(distance_km, 2)}
+    query = open_cluster_query(weight)
+    query["_id"] = cluster_id
+    query["users.user_id"] = {"$ne": pickup_id}
+    result = mongo.db.collection_clusters.update_one(query, [
+        {"$set": {
+            "users": {"$concatArrays": [{"$ifNull": ["$users", []]}, {"$literal": [member]}]},
+            "total_weight": {"$add": [{"$ifNull": ["$total_weight", 0]}, weight]},
+            "user_count": {"$add": [{"$ifNull": ["$user_count", 0]}, 1]},
+            "updated_at": datetime.utcnow()
+        }},
+        {"$set": {"status": _status_expression()}}
+    ])
+    if not result.modified_count:
+        return None
+    cluster = mongo.db.collection_clusters.find_one({"_id": cluster_id}, {"status": 1})
+    return cluster["status"] if cluster else None
+
+
+def leave_cluster(cluster_id, pickup_id, weight):
+    """Undo join_cluster for a pickup that could not be claimed"""
+    mongo.db.collection_clusters.update_one(
+        {"_id": cluster_id, "users.user_id": pickup_id},
+        {"$pull": {"users": {"user_id": pickup_id}}, "$inc": {"total_weight": -weight, "user_count": -1}}
+    )
+    mongo.db.collection_clusters.update_one({"_id": cluster_id}, [{"$set": {"status": _status_expression()}}])
+
+
+def claim_pickup(pickup_id, cluster_id):
+    """
+    Bind a pickup to a cluster only if it has none yet. Returns the pickup as
+    it was before the claim (for its old status), or None if it was taken.
+    """
+    return mongo.db.pickup_requests.find_one_and_update(
+        {"_id": pickup_id, "cluster_id": None},
+        {"$set": {"cluster_id": cluster_id, "status": "clustered"}},
+        projection={"status": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+
+
+def release_claims(cluster_id):
+    """Return the pickups claimed for a cluster that was never created to the pool"""
+    mongo.db.pickup_requests.update_many(
+        {"cluster_id": cluster_id},
+        {"$set": {"status": "pending"}, "$unset": {"cluster_id": ""}}
+    )
+
+
+def insert_planned_clusters(cluster_docs, refresh):
+    """
+    Claim-then-insert for clusters planned in bulk (analyze-routes jobs).
+    Every planned cluster gets a pre-allocated _id and claims its members in
+    one unordered bulk_write; its `users`, `total_weight` and `user_count` are
+    then cut down to the members it actually won and `refresh(doc)` recomputes
+    anything derived from them (status, ...). Clusters that won nobody are
+    dropped. Returns the inserted cluster ids (strings).
+    """
+    if not cluster_docs:
+        return []
+    for doc in cluster_docs:
+        doc["_id"] = ObjectId()
+    cluster_ids = [str(doc["_id"]) for doc in cluster_docs]
+    mongo.db.pickup_requests.bulk_write([
+        UpdateMany(
+            {"_id": {"$in": [u["user_id"] for u in doc["users"]]}, "cluster_id": None},
+            {"$set": {"status": "clustered", "cluster_id": cid}}
+        )
+        for doc, cid in zip(cluster_docs, cluster_ids)
+    ], ordered=False)
+
+    won = {}
+    for pickup in mongo.db.pickup_requests.find({"cluster_id": {"$in": cluster_ids}}, {"cluster_id": 1}):
+        won.setdefault(pickup["cluster_id"], set()).add(pickup["_id"])
+
+    claimed = []
+    for doc, cid in zip(cluster_docs, cluster_ids):
+        members = won.get(cid, set())
+        if len(members) != len(doc["users"]):
+            doc["users"] = [u for u in doc["users"] if u["user_id"] in members]
+            doc["total_weight"] = sum(u["weight"] for u in doc["users"])
+            doc["user_count"] = len(doc["users"])
+            if doc["users"] and doc.get("anchor_user_id") not in members:
+                doc["anchor_user_id"] = doc["users"][0]["user_id"]
+        if doc["users"]:
+            refresh(doc)
+            claimed.append(doc)
+
+    try:
+        if claimed:
+            mongo.db.collection_clusters.insert_many(claimed, ordered=False)
+    except Exception:
+        for cid in cluster_ids:
+            release_claims(cid)
+        raise
+    record_status_change("pending", "clustered", sum(doc["user_count"] for doc in claimed))
+    return [str(doc["_id"]) for doc in claimed]
+
+
+def current_assignment(pickup_id):
+    """(cluster_id, status, destination) of the cluster that claimed a pickup first"""
+    pickup = mongo.db.pickup_requests.find_one({"_id": pickup_id}, {"cluster_id": 1})
+    cluster_id = (pickup or {}).get("cluster_id")
+    cluster = None
+    if cluster_id and ObjectId.is_valid(str(cluster_id)):
+        cluster = mongo.db.collection_clusters.find_one({"_id": ObjectId(str(cluster_id))}, {"status": 1, "destination": 1})
+    return cluster_id, (cluster or {}).get("status"), (cluster or {}).get("destination")
+
+
+def create_cluster(pickup_id, lat, lng, weight):
+    """
+    New cluster anchored at the pickup, claiming unclustered neighbours up to
+    the max weight. Members are claimed before the cluster is inserted (under
+    a pre-allocated _id), so only pickups this request actually won join it.
+    """
+    oid = ObjectId()
+    cluster_id = str(oid)
+    anchor = claim_pickup(pickup_id, cluster_id)
+    if anchor is None:
+        return current_assignment(pickup_id)
+
+    cluster_users = [{"user_id": pickup_id, "weight": weight, "distance_km": 0}]
+    total_cluster_weight = weight
+    moved = [anchor.get("status")]
+
+    nearby = find_nearby_pickups(lat, lng, CLUSTER_RADIUS_KM, NEARBY_PICKUP_QUERY,
+                                 {"latitude": 1, "longitude": 1, "approx_weight": 1, "ewaste_weight": 1})
+    candidates = [p for p in nearby if p["_id"] != pickup_id and p.get("latitude") and p.get("longitude")]
+    distances = haversine_one_to_many(
+        lat, lng,
+        [p["latitude"] for p in candidates],
+        [p["longitude"] for p in candidates]
+    )
+    for p, dist in zip(candidates, distances):
+        dist = float(dist)
+        p_weight = p.get("approx_weight", p.get("ewaste_weight", 0))
+        if dist > CLUSTER_RADIUS_KM or total_cluster_weight + p_weight > CLUSTER_MAX_WEIGHT:
+            continue
+        claimed = claim_pickup(p["_id"], cluster_id)
+        if claimed is None:
+            continue  # taken by a concurrent request
+        cluster_users.append({"user_id": p["_id"], "weight": p_weight, "distance_km": round(dist, 2)})
+        total_cluster_weight += p_weight
+        moved.append(claimed.get("status"))
+
+    status = cluster_status(total_cluster_weight)
+    nearest_wh, dist_to_hub = nearest_hub(lat, lng)
+    cluster_doc = {
+        "_id": oid,
+        "anchor_user_id": pickup_id,
+        "anchor_location": {"lat": lat, "lng": lng},
+        "destination": nearest_wh["name"],
+        "dist_to_hub": round(dist_to_hub, 2),
+        "users": cluster_users,
+        "total_weight": total_cluster_weight,
+        "user_count": len(cluster_users),
+        "status": status,
+        "created_at": datetime.utcnow(),
+        "engineer_id": None,
+        "driver_id": None,
+        "doctor_id": None
+    }
+    cluster_doc.update(geo_fields(lat, lng))
+    try:
+        mongo.db.collection_clusters.insert_one(cluster_doc)
+    except Exception:
+        release_claims(cluster_id)
+        raise
+
+    record_status_change("pending", "clustered", moved.count("pending"))
+    return cluster_id, status, nearest_wh["name"]
+
+
+def assign_pickup(pickup_id, lat, lng, weight):
+    """
+    Place a new pending pickup into the best open cluster nearby, or a new
+    cluster when none has room. Returns (cluster_id, status, destination).
+    """
+    for attempt in range(CLAIM_ATTEMPTS):
+        contended = False
+        for cluster, dist in find_open_clusters(lat, lng, weight):
+            status = join_cluster(cluster["_id"], pickup_id, weight, dist)
+            if status is None:
+                contended = True  # lost a race for the remaining room; try the next one
+                continue
+            cluster_id = str(cluster["_id"])
+            claimed = claim_pickup(pickup_id, cluster_id)
+            if claimed is None:
+                # Claimed elsewhere (e.g. an analyze-routes job) after we joined
+                leave_cluster(cluster["_id"], pickup_id, weight)
+                return current_assignment(pickup_id)
+            record_status_change(claimed.get("status"), "clustered")
+            return cluster_id, status, cluster.get("destination")
+        if not contended:
+            break
+        time.sleep(CLAIM_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random()))
+    return create_cluster(pickup_id, lat, lng, weight)
+
+
+def backfill_cluster_geo_fields():
+    """Add location/geohash to clusters that only have anchor_location"""
+    updated = 0
+    cursor = mongo.db.collection_clusters.find(
+        {"location": {"$exists": False}, "anchor_location.lat": {"$ne": None}},
+        {"anchor_location": 1}
+    )
+    ops = []
+    for doc in cursor:
+        try:
+            fields = geo_fields(float(doc["anchor_location"]["lat"]), float(doc["anchor_location"]["lng"]))
+        except (TypeError, ValueError, KeyError):
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+    if ops:
+        updated = mongo.db.collection_clusters.bulk_write(ops, ordered=False).modified_count
+    return updated
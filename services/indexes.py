@@ -0,0 +1,161 @@
+"""
+Declarative index manifest for the hot collections.
+
+`ensure_indexes()` applies the manifest idempotently (at create_app() startup
+unless ENSURE_INDEXES=0, or via `flask --app app ensure-indexes`).
+`verify_indexes()` runs explain() on the representative route queries in
+VERIFIED_QUERIES and flags any that fall back to a COLLSCAN
+(`flask --app app verify-indexes`). The nearby lookups are built with the same
+helpers create_request uses (services/spatial_index.py), both the $nearSphere
+query and its geohash-prefix fallback.
+
+invoice_number_unique only covers invoices with string _ids (the
+"<transaction_id>:<role>" ids payouts write). Legacy invoices have ObjectId
+_ids and numbers derived from an epoch second, which can collide; they are
+left out rather than failing the index build on existing data.
+"""
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+from mongo import mongo
+from services.incremental_clustering import (
+    CLUSTER_RADIUS_KM, NEARBY_PICKUP_QUERY, open_cluster_query
+)
+from services.spatial_index import near_query, grid_query
+
+INDEX_MANIFEST = {
+    "pickup_requests": [
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created_at"),
+        IndexModel([("cluster_id", ASCENDING)], name="cluster_id_1"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_created_at_id"),
+        IndexModel([("status", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="status_updated_at_id"),
+        IndexModel([("status", ASCENDING), ("_id", ASCENDING)], name="status_id"),
+        IndexModel([("engineer_id", ASCENDING), ("status", ASCENDING)], name="engineer_id_status"),
+        IndexModel([("created_at", DESCENDING)], name="created_at_-1"),
+        IndexModel([("location", GEOSPHERE)], name="location_2dsphere"),
+        IndexModel([("geohash", ASCENDING)], name="geohash_1"),
+    ],
+    "notifications": [
+        IndexModel([("recipient_id", ASCENDING), ("read", ASCENDING), ("created_at", DESCENDING)], name="recipient_read_created_at"),
+        IndexModel([("recipient_id", ASCENDING), ("created_at", DESCENDING)], name="recipient_created_at"),
+    ],
+    "collection_clusters": [
+        IndexModel([("engineer_id", ASCENDING), ("status", ASCENDING)], name="engineer_id_status"),
+        IndexModel([("driver_id", ASCENDING), ("status", ASCENDING)], name="driver_id_status"),
+        IndexModel([("status", ASCENDING)], name="status_1"),
+        IndexModel([("destination", ASCENDING), ("status", ASCENDING)], name="destination_status"),
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+        IndexModel([("location", GEOSPHERE)], name="location_2dsphere"),
+        IndexModel([("geohash", ASCENDING)], name="geohash_1"),
+    ],
+    "driver_locations": [
+        IndexModel([("driver_id", ASCENDING)], name="driver_id_1"),
+    ],
+    "driver_tracks": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "active_routes": [
+        IndexModel([("driver_id", ASCENDING), ("status", ASCENDING), ("timestamp", DESCENDING)], name="driver_status_timestamp"),
+    ],
+    "jobs": [
+        IndexModel([("type", ASCENDING), ("status", ASCENDING), ("updated_at", DESCENDING)], name="type_status_updated_at"),
+        # At most one active unique job per type (services/jobs.py)
+        IndexModel([("unique_key", ASCENDING)], name="unique_key_active", unique=True,
+                   partialFilterExpression={"unique_key": {"$exists": True}}),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_1"),
+        IndexModel([("role", ASCENDING)], name="role_1"),
+    ],
+    "invoices": [
+        IndexModel([("invoice_number", ASCENDING)], name="invoice_number_unique", unique=True,
+                   partialFilterExpression={"_id": {"$type": "string"}}),
+        IndexModel([("recipient_id", ASCENDING), ("created_at", DESCENDING)], name="recipient_created_at"),
+    ],
+}
+
+# Point the geo probes are explained at (Mumbai)
+PROBE_LAT, PROBE_LNG = 19.076, 72.8777
+
+# (label, collection, filter, sort) for the queries the routes run most
+VERIFIED_QUERIES = [
+    ("auth.login", "users", {"email": "probe@example.com"}, None),
+    ("warehouse.staff_by_role", "users", {"role": "engineer"}, None),
+    ("user.dashboard", "pickup_requests", {"user_id": "probe"}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("recycler.dashboard", "pickup_requests", {"status": "collected"}, [("updated_at", DESCENDING), ("_id", DESCENDING)]),
+    ("repricing.collected", "pickup_requests", {"status": "collected", "_id": {"$gt": ObjectId("000000000000000000000000")}}, [("_id", ASCENDING)]),
+    ("hub_inventory.pickups", "pickup_requests", {"cluster_id": "probe"}, None),
+    ("create_request.nearby", "pickup_requests",
+     near_query(PROBE_LAT, PROBE_LNG, CLUSTER_RADIUS_KM, NEARBY_PICKUP_QUERY), None),
+    ("create_request.nearby_grid", "pickup_requests",
+     grid_query(PROBE_LAT, PROBE_LNG, CLUSTER_RADIUS_KM, NEARBY_PICKUP_QUERY), None),
+    ("engineer.jobs_completed", "pickup_requests", {"engineer_id": "probe", "status": "collected"}, None),
+    ("notifications.my", "notifications", {"recipient_id": "probe"}, [("created_at", DESCENDING)]),
+    ("notifications.unread_count", "notifications", {"recipient_id": "probe", "read": False}, None),
+    ("warehouse.dashboard", "collection_clusters", {}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("engineer.dashboard", "collection_clusters", {"engineer_id": "probe"}, None),
+    ("driver.dashboard", "collection_clusters", {"driver_id": "probe"}, None),
+    ("warehouse.active_staff", "collection_clusters", {"status": "in_progress"}, None),
+    ("create_request.open_clusters", "collection_clusters",
+     near_query(PROBE_LAT, PROBE_LNG, CLUSTER_RADIUS_KM, open_cluster_query(0)), None),
+    ("create_request.open_clusters_grid", "collection_clusters",
+     grid_query(PROBE_LAT, PROBE_LNG, CLUSTER_RADIUS_KM, open_cluster_query(0)), None),
+    ("hub_inventory.clusters", "collection_clusters", {"destination": "probe", "status": {"$in": ["delivered", "completed"]}}, None),
+    ("driver.location", "driver_locations", {"driver_id": "probe"}, None),
+    ("engineer.track_driver", "active_routes", {"driver_id": "probe", "status": "active"}, [("timestamp", DESCENDING)]),
+    ("payment.invoices", "invoices", {"recipient_id": "probe"}, [("created_at", DESCENDING)]),
+]
+
+
+def ensure_indexes(db=None):
+    """
+    Create every index in the manifest. Existing identical indexes are left
+    alone; conflicts (same name or keys with different options) are reported
+    instead of aborting startup. Returns {collection: [created or failed names]}.
+    """
+    db = db if db is not None else mongo.db
+    report = {}
+    for collection, models in INDEX_MANIFEST.items():
+        results = []
+        for model in models:
+            try:
+                results.extend(db[collection].create_indexes([model]))
+            except OperationFailure as e:
+                results.append(f"FAILED {model.document['name']}: {e}")
+        report[collection] = results
+    return report
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def verify_indexes(db=None):
+    """
+    explain() each query in VERIFIED_QUERIES. Returns a list of
+    {label, collection, stages, collscan} dicts; collscan=True means the
+    winning plan scans the whole collection.
+    """
+    db = db if db is not None else mongo.db
+    results = []
+    for label, collection, query, sort in VERIFIED_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        planner = cursor.explain().get("queryPlanner", {})
+        stages = list(_plan_stages(planner.get("winningPlan", {})))
+        results.append({
+            "label": label,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return results
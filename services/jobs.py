@@ -0,0 +1,164 @@
+"""
+Background jobs with state persisted in the `jobs` collection.
+
+`submit_job(app, job_type, params)` records a queued job and runs its handler
+(registered in JOB_HANDLERS) on a background thread, so the request that
+submitted it can return immediately. Handlers report progress through the
+`report(stage, done=None, total=None)` callback they receive and return a
+result dict. CPU-heavy steps inside a handler run on `compute_pool()`, a
+process pool, so they neither hold the web worker's GIL nor block requests.
+Its workers are spawned, not forked, so they never inherit the web process's
+threads (dispatcher, location hub, price watcher, job runner) or MongoClient.
+
+`submit_job(..., unique=True)` is atomic across workers: the job carries
+`unique_key` (its type) while active, and a partial unique index on that
+field (services/indexes.py) lets only one such job exist at a time.
+
+Job documents:
+    {_id, type, status: queued|running|succeeded|failed, params,
+     progress: {stage, done, total}, result, error,
+     created_at, started_at, finished_at, updated_at, duration_seconds,
+     unique_key (only while a unique job is active)}
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from mongo import mongo
+
+ACTIVE_STATUSES = ["queued", "running"]
+# Active jobs not updated for this long are assumed lost with their process
+JOB_STALE_SECONDS = 900
+
+JOB_HANDLERS = {}
+
+_runner = None
+_pool = None
+_pid = None
+
+
+def register_job(job_type):
+    """Decorator registering `handler(params, report) -> result dict` for a job type"""
+    def decorator(handler):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return decorator
+
+
+def _executors():
+    # (Re)create after fork: gunicorn workers do not inherit the parent's threads
+    global _runner, _pool, _pid
+    if _pid != os.getpid():
+        _runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-runner")
+        _pool = ProcessPoolExecutor(
+            max_workers=max(1, (os.cpu_count() or 2) - 1),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        _pid = os.getpid()
+    return _runner, _pool
+
+
+def compute_pool():
+    """Process pool for CPU-bound work inside job handlers"""
+    return _executors()[1]
+
+
+def _set(job_id, fields):
+    fields["updated_at"] = datetime.utcnow()
+    mongo.db.jobs.update_one({"_id": job_id}, {"$set": fields})
+
+
+def _finish(job_id, fields):
+    # Releases the unique_key so the next unique job of this type can start
+    fields["updated_at"] = fields["finished_at"] = datetime.utcnow()
+    mongo.db.jobs.update_one({"_id": job_id}, {"$set": fields, "$unset": {"unique_key": ""}})
+
+
+def _run(app, job_id, job_type, params):
+    started = time.monotonic()
+    with app.app_context():
+        _set(job_id, {"status": "running", "started_at": datetime.utcnow()})
+
+        def report(stage, done=None, total=None):
+            _set(job_id, {"progress": {"stage": stage, "done": done, "total": total}})
+
+        try:
+            result = JOB_HANDLERS[job_type](params, report)
+            _finish(job_id, {
+                "status": "succeeded",
+                "result": result,
+                "duration_seconds": round(time.monotonic() - started, 3)
+            })
+        except Exception as e:
+            print(f"Job {job_id} ({job_type}) failed: {e}")
+            _finish(job_id, {
+                "status": "failed",
+                "error": str(e),
+                "duration_seconds": round(time.monotonic() - started, 3)
+            })
+
+
+def _release_stale(job_type, now):
+    # A unique job whose process died keeps its key; fail it so a new one can start
+    mongo.db.jobs.update_one(
+        {"unique_key": job_type, "updated_at": {"$lt": now - timedelta(seconds=JOB_STALE_SECONDS)}},
+        {"$set": {"status": "failed", "error": "Lost (no progress)", "finished_at": now, "updated_at": now},
+         "$unset": {"unique_key": ""}}
+    )
+
+
+def submit_job(app, job_type, params=None, unique=False):
+    """
+    Queue a job and return its id (string). With unique=True an already
+    queued or running job of the same type is returned instead of a new one.
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    now = datetime.utcnow()
+    if unique:
+        active = mongo.db.jobs.find_one({
+            "type": job_type,
+            "status": {"$in": ACTIVE_STATUSES},
+            "updated_at": {"$gte": now - timedelta(seconds=JOB_STALE_SECONDS)}
+        }, {"_id": 1})
+        if active:
+            return str(active["_id"])
+        _release_stale(job_type, now)
+
+    job = {
+        "type": job_type,
+        "status": "queued",
+        "params": params or {},
+        "progress": {"stage": "queued", "done": None, "total": None},
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+    if unique:
+        job["unique_key"] = job_type
+    try:
+        job_id = mongo.db.jobs.insert_one(job).inserted_id
+    except DuplicateKeyError:
+        # Another worker queued the same unique job first
+        active = mongo.db.jobs.find_one({"unique_key": job_type}, {"_id": 1})
+        if active:
+            return str(active["_id"])
+        raise
+    runner, _ = _executors()
+    runner.submit(_run, app, job_id, job_type, params or {})
+    return str(job_id)
+
+
+def get_job(job_id):
+    """The job document with its _id as a string, or None"""
+    if not ObjectId.is_valid(str(job_id)):
+        return None
+    job = mongo.db.jobs.find_one({"_id": ObjectId(str(job_id))})
+    if job:
+        job["_id"] = str(job["_id"])
+    return job
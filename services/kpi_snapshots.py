@@ -0,0 +1,158 @@
+"""
+Materialized KPI view over pickup_requests.
+
+The `kpi_snapshots` collection holds one totals document (request count,
+per-status counts, total weight) plus one small document per e-waste type.
+It is kept current incrementally by the write paths that create pickups or
+change their status, so dashboards read a handful of tiny documents instead
+of scanning pickup_requests. `rebuild_kpi_snapshot()` recomputes everything
+from scratch for recovery (`flask --app app rebuild-kpis`) and after data
+migrations that rewrite weights.
+"""
+
+from datetime import datetime
+from mongo import mongo
+
+TOTALS_ID = "pickup_totals"
+TYPE_KIND = "ewaste_type"
+
+
+def _pickup_weight(doc):
+    # Mirrors {"$ifNull": ["$approx_weight", "$ewaste_weight"]}; $sum skips non-numbers
+    weight = doc.get("approx_weight")
+    if weight is None:
+        weight = doc.get("ewaste_weight")
+    return weight if isinstance(weight, (int, float)) and not isinstance(weight, bool) else 0
+
+
+def _type_id(ewaste_type):
+    return {"kind": TYPE_KIND, "value": ewaste_type}
+
+
+def record_pickup_created(doc):
+    """Count a newly inserted pickup in the snapshot"""
+    weight = _pickup_weight(doc)
+    inc = {"total_requests": 1, "total_weight": weight}
+    if doc.get("status"):
+        inc[f"status_counts.{doc['status']}"] = 1
+
+    snapshots = mongo.db.kpi_snapshots
+    result = snapshots.update_one(
+        {"_id": TOTALS_ID},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+    )
+    if not result.matched_count:
+        # Not built yet; the first read rebuilds from pickup_requests
+        return
+    snapshots.update_one(
+        {"_id": _type_id(doc.get("ewaste_type"))},
+        {
+            "$inc": {"count": 1, "total_weight": weight},
+            "$set": {"kind": TYPE_KIND, "ewaste_type": doc.get("ewaste_type")}
+        },
+        upsert=True
+    )
+
+
+def record_status_change(old_status, new_status, count=1):
+    """Move `count` pickups from one status bucket to another"""
+    if old_status == new_status or count <= 0:
+        return
+    inc = {}
+    if old_status:
+        inc[f"status_counts.{old_status}"] = -count
+    if new_status:
+        inc[f"status_counts.{new_status}"] = count
+    if not inc:
+        return
+    mongo.db.kpi_snapshots.update_one(
+        {"_id": TOTALS_ID},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+
+def update_status_many(match, new_status):
+    """
+    Set `new_status` on every pickup matching `match`, one update_many per
+    current status, and move each write's modified_count between the status
+    buckets. The counters follow what was actually written, so a failed or
+    partial write never skews them. Returns the number of pickups modified.
+    """
+    pickups = mongo.db.pickup_requests
+    # distinct() skips pickups without a status; None covers them
+    old_statuses = set(pickups.distinct("status", match)) | {None}
+    old_statuses.discard(new_status)
+    modified = 0
+    for old_status in old_statuses:
+        result = pickups.update_many({"$and": [match, {"status": old_status}]}, {"$set": {"status": new_status}})
+        record_status_change(old_status, new_status, result.modified_count)
+        modified += result.modified_count
+    return modified
+
+
+def rebuild_kpi_snapshot(db=None):
+    """Recompute the whole snapshot from pickup_requests; `db` is for tools run outside the app"""
+    db = db if db is not None else mongo.db
+    pickups = db.pickup_requests
+    status_rows = list(pickups.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]))
+    type_rows = list(pickups.aggregate([
+        {"$group": {
+            "_id": "$ewaste_type",
+            "count": {"$sum": 1},
+            "total_weight": {"$sum": {"$ifNull": ["$approx_weight", "$ewaste_weight"]}}
+        }}
+    ]))
+
+    now = datetime.utcnow()
+    totals = {
+        "_id": TOTALS_ID,
+        "total_requests": sum(r["count"] for r in status_rows),
+        "status_counts": {r["_id"]: r["count"] for r in status_rows if r["_id"]},
+        "total_weight": sum(r["total_weight"] for r in type_rows),
+        "updated_at": now,
+        "rebuilt_at": now
+    }
+
+    snapshots = db.kpi_snapshots
+    snapshots.delete_many({"kind": TYPE_KIND})
+    snapshots.replace_one({"_id": TOTALS_ID}, totals, upsert=True)
+    if type_rows:
+        snapshots.insert_many([
+            {
+                "_id": _type_id(r["_id"]),
+                "kind": TYPE_KIND,
+                "ewaste_type": r["_id"],
+                "count": r["count"],
+                "total_weight": r["total_weight"]
+            }
+            for r in type_rows
+        ])
+    return totals
+
+
+def get_kpi_snapshot():
+    """
+    Return the current KPIs as
+    {total_requests, status_counts, total_weight, types: [{ewaste_type, count, total_weight}]}.
+    Builds the snapshot on first use.
+    """
+    docs = list(mongo.db.kpi_snapshots.find())
+    totals = next((d for d in docs if d["_id"] == TOTALS_ID), None)
+    if totals is None:
+        rebuild_kpi_snapshot()
+        docs = list(mongo.db.kpi_snapshots.find())
+        totals = next(d for d in docs if d["_id"] == TOTALS_ID)
+
+    types = [
+        {"ewaste_type": d.get("ewaste_type"), "count": d.get("count", 0), "total_weight": d.get("total_weight", 0)}
+        for d in docs
+        if d.get("kind") == TYPE_KIND and d.get("count", 0) > 0
+    ]
+    return {
+        "total_requests": totals.get("total_requests", 0),
+        "status_counts": totals.get("status_counts", {}),
+        "total_weight": totals.get("total_weight", 0),
+        "types": types
+    }
@@ -0,0 +1,183 @@
+"""
+In-memory pub/sub for live driver locations.
+
+Drivers publish GPS ticks to the hub; subscribers (Server-Sent Events streams)
+receive them directly from memory. The latest position per driver is written
+to `driver_locations` by a background flusher on a throttled schedule
+(LOCATION_FLUSH_SECONDS, default 5), so many ticks and many viewers cost one
+upsert per driver per interval instead of one write per tick and one read
+per poll. Each flush also appends the positions to the drivers' breadcrumb
+tracks (services/breadcrumbs.py).
+
+The hub is per process. A stream served by a worker that is not receiving the
+driver's ticks falls back to reading the flushed position from Mongo once per
+heartbeat.
+
+Each open stream occupies a worker thread, so the app is served with gthread
+workers (gunicorn.conf.py). Streams also end after LOCATION_STREAM_MAX_SECONDS
+(default 300) with an SSE `retry` hint, and the browser's EventSource
+reconnects on its own, so no viewer holds a worker indefinitely.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pymongo import UpdateOne
+from mongo import mongo
+from services.breadcrumbs import record_breadcrumbs
+
+SUBSCRIBER_QUEUE_SIZE = 20
+HEARTBEAT_SECONDS = 15
+STREAM_MAX_SECONDS = 300
+STREAM_RETRY_MS = 2000
+
+
+def _serialize(location):
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in location.items() if k != "_id"}
+
+
+class LocationHub:
+    def __init__(self, flush_seconds=5, stream_max_seconds=STREAM_MAX_SECONDS):
+        self.flush_seconds = flush_seconds
+        self.stream_max_seconds = stream_max_seconds
+        self.latest = {}
+        self.received_at = {}
+        self.subscribers = {}
+        self.dirty = set()
+        self.app = None
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_seconds = float(app.config.get("LOCATION_FLUSH_SECONDS", self.flush_seconds))
+        app.config.setdefault("LOCATION_STREAM_MAX_SECONDS", float(os.getenv("LOCATION_STREAM_MAX_SECONDS", self.stream_max_seconds)))
+        self.stream_max_seconds = float(app.config["LOCATION_STREAM_MAX_SECONDS"])
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._flusher = threading.Thread(target=self._run, name="location-flusher", daemon=True)
+                self._flusher.start()
+
+    # ---------------- PUBLISH / SUBSCRIBE ----------------
+    def publish(self, driver_id, location):
+        """Record a GPS tick and fan it out to this driver's subscribers"""
+        self._ensure_flusher()
+        with self._lock:
+            self.latest[driver_id] = location
+            self.received_at[driver_id] = time.monotonic()
+            self.dirty.add(driver_id)
+            targets = list(self.subscribers.get(driver_id, ()))
+        for q in targets:
+            try:
+                q.put_nowait(location)
+            except queue.Full:
+                # Slow consumer: drop its oldest tick, keep the newest
+                try:
+                    q.get_nowait()
+                    q.put_nowait(location)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def subscribe(self, driver_id):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self.subscribers.setdefault(driver_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, driver_id, q):
+        with self._lock:
+            subs = self.subscribers.get(driver_id)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    del self.subscribers[driver_id]
+
+    def _is_live_here(self, driver_id):
+        received = self.received_at.get(driver_id)
+        return received is not None and time.monotonic() - received < HEARTBEAT_SECONDS * 2
+
+    def get_location(self, driver_id):
+        """Latest known location: memory first, then the last flushed document"""
+        location = self.latest.get(driver_id)
+        if location is not None:
+            return location
+        return mongo.db.driver_locations.find_one({"driver_id": driver_id}, {"_id": 0})
+
+    def stream(self, driver_id):
+        """Server-Sent Events generator for one driver; ends after stream_max_seconds"""
+        q = self.subscribe(driver_id)
+        deadline = time.monotonic() + self.stream_max_seconds
+        try:
+            # The client reconnects this long after the stream ends
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            current = self.get_location(driver_id)
+            if current:
+                yield f"data: {json.dumps(_serialize(current))}\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    location = q.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+                    yield f"data: {json.dumps(_serialize(location))}\n\n"
+                except queue.Empty:
+                    if not self._is_live_here(driver_id):
+                        # Ticks may be arriving on another worker; read its last flush
+                        flushed = mongo.db.driver_locations.find_one({"driver_id": driver_id}, {"_id": 0})
+                        if flushed and flushed != current:
+                            current = flushed
+                            yield f"data: {json.dumps(_serialize(flushed))}\n\n"
+                            continue
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(driver_id, q)
+
+    # ---------------- COALESCED PERSISTENCE ----------------
+    def flush(self):
+        """Upsert the latest position of every driver that moved since the last flush"""
+        with self._lock:
+            pending = {d: self.latest[d] for d in self.dirty}
+            self.dirty.clear()
+        if not pending:
+            return 0
+        ops = [
+            UpdateOne({"driver_id": driver_id}, {"$set": dict(location, driver_id=driver_id)}, upsert=True)
+            for driver_id, location in pending.items()
+        ]
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    mongo.db.driver_locations.bulk_write(ops, ordered=False)
+            else:
+                mongo.db.driver_locations.bulk_write(ops, ordered=False)
+        except Exception as e:
+            print(f"Error flushing driver locations: {e}")
+            with self._lock:
+                self.dirty.update(pending)
+            return 0
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    record_breadcrumbs(pending)
+            else:
+                record_breadcrumbs(pending)
+        except Exception as e:
+            print(f"Error recording breadcrumbs: {e}")
+        return len(ops)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+
+location_hub = LocationHub()
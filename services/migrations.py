@@ -0,0 +1,245 @@
+"""
+Batched, resumable data migrations.
+
+A migration is a function registered with
+@register_migration(name, collection, query, fields): it receives one
+document (projected to `fields`) and returns the fields to $set on it, or
+None to leave it alone. `run_migration(name, apply=...)` runs it:
+
+- the matching _id space is split into `workers` ranges (boundaries taken from
+  a $sample of _ids), migrated by parallel threads;
+- each range streams through an _id-ordered cursor with `batch_size`, and each
+  batch's updates are flushed in one unordered bulk_write;
+- after every flush the range's last _id is checkpointed
+  (services/checkpoints.py), so an interrupted run resumes every range where
+  it stopped (pass resume=False to start over);
+- a migration only touches documents that existed when it was first applied:
+  the first applied run records an _id cutoff on its run checkpoint, and
+  every later run (resumed or restarted) keeps it, so documents the app
+  writes afterwards are never migrated;
+- with apply=False nothing is written: the run counts the documents that
+  would change and keeps a random sample of before/after diffs;
+- migrations registered with rebuild_kpis=True rebuild the kpi_snapshots view
+  (services/kpi_snapshots.py) after an applied run that modified documents.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, NamedTuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from mongo import mongo
+from services.checkpoints import get_checkpoint, load_checkpoint, start_checkpoint, save_checkpoint, finish_checkpoint
+from services.kpi_snapshots import rebuild_kpi_snapshot
+
+MIGRATION_BATCH_SIZE = 1000
+DIFF_SAMPLE_SIZE = 20
+# _ids sampled per worker when choosing range boundaries
+SPLIT_SAMPLES_PER_WORKER = 32
+
+MIGRATIONS = {}
+
+
+class Migration(NamedTuple):
+    name: str
+    collection: str
+    query: dict
+    fields: list
+    transform: Callable
+    rebuild_kpis: bool = False
+
+
+def register_migration(name, collection, query=None, fields=None, rebuild_kpis=False):
+    """Decorator registering `transform(doc) -> fields to $set, or None`"""
+    def decorator(transform):
+        MIGRATIONS[name] = Migration(name, collection, query or {}, fields, transform, rebuild_kpis)
+        return transform
+    return decorator
+
+
+class MigrationStats:
+    """Counters and a reservoir sample of diffs, shared by the range threads"""
+
+    def __init__(self, sample_size=DIFF_SAMPLE_SIZE):
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self.sample_size = sample_size
+        self.scanned = 0
+        self.changed = 0
+        self.modified = 0
+        self.sample = []
+
+    def add_batch(self, scanned, diffs, modified=0):
+        with self._lock:
+            self.scanned += scanned
+            self.modified += modified
+            for diff in diffs:
+                self.changed += 1
+                # Reservoir sampling: every change is equally likely to be shown
+                if len(self.sample) < self.sample_size:
+                    self.sample.append(diff)
+                else:
+                    slot = self._rng.randrange(self.changed)
+                    if slot < self.sample_size:
+                        self.sample[slot] = diff
+
+    def as_dict(self):
+        return {
+            "scanned": self.scanned,
+            "changed": self.changed,
+            "modified": self.modified,
+            "sample": self.sample
+        }
+
+
+def id_ranges(collection, query, workers):
+    """Split the matching _ids into up to `workers` [lower, upper) ranges; None is unbounded"""
+    if workers <= 1:
+        return [(None, None)]
+    sampled = sorted({doc["_id"] for doc in collection.aggregate([
+        {"$match": query},
+        {"$sample": {"size": workers * SPLIT_SAMPLES_PER_WORKER}},
+        {"$project": {"_id": 1}}
+    ])})
+    step = len(sampled) / workers
+    bounds = sorted({sampled[int(step * i)] for i in range(1, workers)}) if sampled else []
+    edges = [None] + bounds + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _range_query(query, lower, upper, after=None):
+    bounds = {}
+    if after is not None:
+        bounds["$gt"] = after
+    elif lower is not None:
+        bounds["$gte"] = lower
+    if upper is not None:
+        bounds["$lt"] = upper
+    return {"$and": [query, {"_id": bounds}]} if bounds else query
+
+
+def _migrate_range(migration, query, db, checkpoint_name, lower, upper, apply, batch_size, stats, resume):
+    collection = db[migration.collection]
+    fingerprint = [lower, upper]
+    after, done = None, 0
+    if apply:
+        checkpoint = load_checkpoint(checkpoint_name, fingerprint, db=db) if resume else None
+        if checkpoint and checkpoint.get("complete"):
+            return
+        if checkpoint:
+            after, done = checkpoint["last_id"], checkpoint["done"]
+        else:
+            start_checkpoint(checkpoint_name, fingerprint, db=db)
+
+    projection = {field: 1 for field in migration.fields} if migration.fields else None
+    cursor = collection.find(_range_query(query, lower, upper, after), projection).sort("_id", 1).batch_size(batch_size)
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            break
+        ops, diffs = [], []
+        for doc in batch:
+            fields = migration.transform(doc)
+            if fields:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+                diffs.append({"_id": doc["_id"], "before": {f: doc.get(f) for f in fields}, "after": fields})
+        modified = 0
+        if apply:
+            if ops:
+                modified = collection.bulk_write(ops, ordered=False).modified_count
+            after, done = batch[-1]["_id"], done + len(batch)
+            save_checkpoint(checkpoint_name, after, done, db=db)
+        stats.add_batch(len(batch), diffs, modified)
+
+    if apply:
+        # Left unfinished until the whole run is, so a resume skips this range
+        save_checkpoint(checkpoint_name, after, done, db=db, complete=True)
+
+
+def run_migration(name, apply=False, batch_size=MIGRATION_BATCH_SIZE, workers=1, resume=True,
+                  sample_size=DIFF_SAMPLE_SIZE, db=None):
+    """
+    Run (apply=True) or dry-run a registered migration. Returns
+    {migration, applied, ranges, scanned, changed, modified, sample, seconds, docs_per_second,
+    kpis_rebuilt}.
+    """
+    if name not in MIGRATIONS:
+        raise ValueError(f"Unknown migration: {name}")
+    migration = MIGRATIONS[name]
+    db = db if db is not None else mongo.db
+    run_name = f"migration:{name}"
+
+    # Kept from the first applied run, so later writes are never migrated
+    # (runs checkpointed before the cutoff existed fall back to their start time)
+    previous = get_checkpoint(run_name, db=db)
+    if previous:
+        cutoff = previous.get("id_cutoff") or ObjectId.from_datetime(previous["started_at"])
+    else:
+        # ObjectId timestamps have one-second resolution: round up to include this second
+        cutoff = ObjectId.from_datetime(datetime.utcnow() + timedelta(seconds=1))
+    query = {"$and": [migration.query, {"_id": {"$lt": cutoff}}]}
+
+    # A resumed run keeps the ranges its range checkpoints refer to
+    run = load_checkpoint(run_name, workers, db=db) if apply and resume else None
+    if run:
+        ranges = [tuple(r) for r in run["ranges"]]
+    else:
+        ranges = id_ranges(db[migration.collection], query, workers)
+        if apply:
+            start_checkpoint(run_name, workers, db=db, ranges=[list(r) for r in ranges], id_cutoff=cutoff)
+
+    stats = MigrationStats(sample_size)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix=f"migrate-{name}") as executor:
+        futures = [
+            executor.submit(_migrate_range, migration, query, db, f"{run_name}:{i}", lower, upper,
+                            apply, batch_size, stats, bool(run))
+            for i, (lower, upper) in enumerate(ranges)
+        ]
+        for future in futures:
+            future.result()
+    seconds = round(time.monotonic() - started, 3)
+    if apply:
+        finish_checkpoint(run_name, db=db)
+    # The snapshot totals were computed from the old values
+    kpis_rebuilt = bool(apply and migration.rebuild_kpis and stats.modified)
+    if kpis_rebuilt:
+        rebuild_kpi_snapshot(db=db)
+
+    return dict(
+        stats.as_dict(),
+        migration=name,
+        applied=apply,
+        ranges=len(ranges),
+        seconds=seconds,
+        docs_per_second=round(stats.scanned / seconds, 1) if seconds else None,
+        kpis_rebuilt=kpis_rebuilt
+    )
+
+
+# ---------------- MIGRATIONS ----------------
+WEIGHT_FIELDS = ["approx_weight", "ewaste_weight", "final_weight"]
+
+
+@register_migration("weights_to_grams", "pickup_requests", {"weight_unit": {"$ne": "g"}}, WEIGHT_FIELDS,
+                    rebuild_kpis=True)
+def weights_to_grams(doc):
+    """Weights below 1000 are taken to be kilograms; migrated pickups are stamped weight_unit=g"""
+    fields = {}
+    for field in WEIGHT_FIELDS:
+        try:
+            num = float(doc.get(field))
+        except (TypeError, ValueError):
+            continue
+
+        # Heuristic: kg → grams
+        if 0 < num < 1000:
+            fields[field] = num * 1000
+    if fields:
+        # Stamped so a re-run never multiplies the same weights twice
+        fields["weight_unit"] = "g"
+    return fields or None
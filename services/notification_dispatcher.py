@@ -0,0 +1,137 @@
+"""
+Asynchronous notification fan-out.
+
+Route handlers enqueue notification documents into a bounded in-process
+queue; a background worker drains it and publishes them in batches through
+a pluggable backend. The default backend writes to the `notifications`
+collection with one insert_many per batch; the "local" backend is an
+in-memory stand-in broker for development and tests.
+
+Select the backend with app.config["NOTIFICATION_BACKEND"] ("mongo" or "local"),
+which defaults to the NOTIFICATION_BACKEND environment variable.
+"""
+
+import atexit
+import os
+import queue
+import threading
+from collections import defaultdict, deque
+from bson import ObjectId
+from mongo import mongo
+
+
+# ---------------- BACKENDS ----------------
+class MongoNotificationBackend:
+    name = "mongo"
+
+    def publish(self, docs):
+        mongo.db.notifications.insert_many(docs, ordered=False)
+
+
+class LocalBrokerBackend:
+    """In-memory stand-in broker: keeps the latest notifications per recipient"""
+    name = "local"
+
+    def __init__(self, per_recipient=100):
+        self.messages = defaultdict(lambda: deque(maxlen=per_recipient))
+        self._lock = threading.Lock()
+
+    def publish(self, docs):
+        with self._lock:
+            for doc in docs:
+                recipient = doc.get("recipient_id") or doc.get("engineer_id")
+                self.messages[str(recipient)].append(doc)
+
+    def messages_for(self, recipient_id):
+        with self._lock:
+            return list(self.messages.get(str(recipient_id), []))
+
+
+BACKENDS = {
+    MongoNotificationBackend.name: MongoNotificationBackend,
+    LocalBrokerBackend.name: LocalBrokerBackend
+}
+
+
+# ---------------- DISPATCHER ----------------
+class NotificationDispatcher:
+    def __init__(self, backend=None, maxsize=10000, batch_size=500, poll_seconds=0.5):
+        self.backend = backend or MongoNotificationBackend()
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.app = None
+        self._worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault("NOTIFICATION_BACKEND", os.getenv("NOTIFICATION_BACKEND", MongoNotificationBackend.name))
+        self.backend = BACKENDS[app.config["NOTIFICATION_BACKEND"]]()
+        atexit.register(self.flush)
+
+    def _ensure_worker(self):
+        # (Re)start after fork: gunicorn workers do not inherit the parent's thread
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._worker.start()
+
+    def enqueue(self, doc):
+        """Queue one notification; returns its _id as a string"""
+        return self.enqueue_many([doc])[0]
+
+    def enqueue_many(self, docs):
+        """Queue notifications for background publishing; returns their _ids as strings"""
+        ids = []
+        overflow = []
+        self._ensure_worker()
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            ids.append(str(doc["_id"]))
+            try:
+                self.queue.put_nowait(doc)
+            except queue.Full:
+                overflow.append(doc)
+        if overflow:
+            # Backpressure: publish inline rather than drop notifications
+            self._publish(overflow)
+        return ids
+
+    def _publish(self, docs):
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    self.backend.publish(docs)
+            else:
+                self.backend.publish(docs)
+        except Exception as e:
+            print(f"Error publishing {len(docs)} notifications: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._publish(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self):
+        """Block until everything queued so far has been published"""
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            self.queue.join()
+
+
+dispatcher = NotificationDispatcher()
@@ -0,0 +1,91 @@
+"""
+Keyset (cursor) pagination for dashboard lists.
+
+Pages are ordered by (field desc, _id desc) and continue from an opaque
+cursor holding the last row's sort key, so every page is one bounded index
+range scan (`limit + 1` documents) no matter how deep the client scrolls.
+Documents missing the sort field sort after all others, as MongoDB does for
+descending sorts, and are paged by _id alone.
+"""
+
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from services.projections import track
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Parse a ?limit= value into 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(doc, field):
+    value = doc.get(field) if field != "_id" else None
+    if isinstance(value, datetime):
+        payload = {"t": "dt", "v": value.isoformat()}
+    else:
+        payload = {"t": "raw", "v": value}
+    payload["id"] = str(doc["_id"])
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """(value, _id) from a cursor; raises ValueError on malformed input"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = payload.get("v")
+        if payload.get("t") == "dt" and value is not None:
+            value = datetime.fromisoformat(value)
+        return value, ObjectId(payload["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def _after(field, value, oid):
+    if field == "_id":
+        return {"_id": {"$lt": oid}}
+    if value is None:
+        return {field: None, "_id": {"$lt": oid}}
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "_id": {"$lt": oid}},
+        {field: None}
+    ]}
+
+
+def keyset_page(collection, query=None, field="created_at", cursor=None, limit=DEFAULT_PAGE_SIZE, projection=None):
+    """
+    One page of `collection` matching `query`, newest first. A projection
+    must include `field`. Returns (docs, next_cursor); next_cursor is None on
+    the last page.
+    """
+    query = dict(query or {})
+    if cursor:
+        value, oid = decode_cursor(cursor)
+        query = {"$and": [query, _after(field, value, oid)]} if query else _after(field, value, oid)
+    sort = [("_id", -1)] if field == "_id" else [(field, -1), ("_id", -1)]
+    docs = track(projection, list(collection.find(query, projection).sort(sort).limit(limit + 1)))
+    next_cursor = encode_cursor(docs[limit - 1], field) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def serialize(doc, fields):
+    """JSON-safe subset of a document (ObjectId -> str, datetime -> ISO)"""
+    out = {"_id": str(doc["_id"])}
+    for field in fields:
+        value = doc.get(field)
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        out[field] = value
+    return out
@@ -1,7 +1,10 @@
 import os
+import hashlib
 from datetime import datetime
 from bson import ObjectId
 from mongo import mongo
+from pymongo.errors import BulkWriteError, ConfigurationError, DuplicateKeyError, OperationFailure
+from services.kpi_snapshots import record_status_change
 
 # Try importing razorpay, handle if not installed
 try:
@@ -65,10 +68,53 @@ class PaymentService:
         """
         Distribute funds: 50% User, 10% Driver, 15% Engineer, 25% Warehouse
         Generate invoices for each.
+
+        Idempotent per transaction_id: the whole split is applied in one
+        multi-document transaction, or through the payout journal when the
+        deployment has no transaction support. Retried or concurrent verify
+        callbacks for the same payment never pay twice.
+
+        Returns True only when this payment is recorded against this pickup
+        (now or by an earlier callback); a missing transaction_id, one
+        already journaled for a different pickup, or a second payment for a
+        pickup that is already paid returns False and credits nothing.
         """
+        transaction_id = str(transaction_id or '').strip()
+        if not transaction_id:
+            return False
         pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
         if not pickup:
             return False
+        if not self._journal_matches(transaction_id, pickup['_id'], allow_missing=True):
+            print(f"Payment {transaction_id} is already journaled for another pickup")
+            return False
+
+        payout = self._build_payout(pickup, total_amount, transaction_id)
+
+        try:
+            applied = self._payout_in_transaction(payout)
+        except (OperationFailure, ConfigurationError) as e:
+            if not _transactions_unsupported(e):
+                raise
+            applied = self._payout_with_journal(payout)
+
+        if applied:
+            record_status_change(pickup.get('status'), 'recycled')
+            return True
+        # Nothing applied now: fine only if this payment already completed for this pickup
+        return self._journal_matches(transaction_id, pickup['_id'], completed=True)
+
+    def _journal_matches(self, transaction_id, pickup_id, allow_missing=False, completed=False):
+        entry = mongo.db.payout_journal.find_one({'_id': transaction_id}, {'pickup_id': 1, 'status': 1})
+        if entry is None:
+            return allow_missing
+        if completed and entry.get('status') != 'completed':
+            return False
+        return entry.get('pickup_id') == pickup_id
+
+    def _build_payout(self, pickup, total_amount, transaction_id):
+        """Compute shares and invoice documents for one payment (no writes)"""
+        pickup_id = pickup['_id']
 
         # 1. Identify Stakeholders
         user_id = pickup.get('user_id')
@@ -77,7 +123,7 @@ class PaymentService:
         # Find driver via cluster
         driver_id = None
         if pickup.get('cluster_id'):
-            cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(pickup['cluster_id'])})
+            cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(pickup['cluster_id'])}, {'driver_id': 1})
             if cluster:
                 driver_id = cluster.get('driver_id')
 
@@ -95,12 +141,14 @@ class PaymentService:
 
         # 3. Generate Invoices
         timestamp = datetime.utcnow()
+        shares = []
         invoices = []
 
         # Helper to create invoice doc
         def create_invoice(recipient_id, role, amount, pct):
             return {
-                'invoice_number': f"INV-{int(timestamp.timestamp())}-{role[:3].upper()}",
+                '_id': f"{transaction_id}:{role}",
+                'invoice_number': invoice_number(transaction_id, role, timestamp),
                 'recipient_id': str(recipient_id) if recipient_id else 'WAREHOUSE_ADMIN',
                 'recipient_role': role,
                 'amount': amount,
@@ -113,33 +161,147 @@ class PaymentService:
                 'description': f"Payout for E-Waste Collection: {pickup.get('ewaste_type', 'Item')}"
             }
 
-        # User Invoice
-        if user_id:
-            invoices.append(create_invoice(user_id, 'user', share_user, 0.50))
-            # Update user wallet (optional)
-            mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$inc': {'wallet_balance': share_user}})
-
-        # Driver Invoice
-        if driver_id:
-            invoices.append(create_invoice(driver_id, 'driver', share_driver, 0.10))
-            mongo.db.users.update_one({'_id': ObjectId(driver_id)}, {'$inc': {'wallet_balance': share_driver}})
-
-        # Engineer Invoice
-        if engineer_id:
-            invoices.append(create_invoice(engineer_id, 'engineer', share_engineer, 0.15))
-            mongo.db.users.update_one({'_id': ObjectId(engineer_id)}, {'$inc': {'wallet_balance': share_engineer}})
+        for recipient_id, role, amount, pct in (
+            (user_id, 'user', share_user, 0.50),
+            (driver_id, 'driver', share_driver, 0.10),
+            (engineer_id, 'engineer', share_engineer, 0.15)
+        ):
+            if recipient_id:
+                invoices.append(create_invoice(recipient_id, role, amount, pct))
+                # Wallet credit only for real user accounts (demo users may use emails as ids)
+                if ObjectId.is_valid(str(recipient_id)):
+                    shares.append({'user_id': ObjectId(str(recipient_id)), 'role': role, 'amount': amount})
 
         # Warehouse Invoice
         invoices.append(create_invoice(None, 'warehouse', share_warehouse, warehouse_base))
 
-        # 4. Save to MongoDB
-        if invoices:
-            mongo.db.invoices.insert_many(invoices)
+        return {
+            '_id': transaction_id,
+            'pickup_id': pickup_id,
+            'amount': total_amount,
+            'shares': shares,
+            'invoices': invoices,
+            'status': 'pending',
+            'created_at': timestamp
+        }
 
-        # 5. Update Pickup Status
-        mongo.db.pickup_requests.update_one(
-            {'_id': ObjectId(pickup_id)},
-            {'$set': {'status': 'recycled', 'payment_status': 'paid', 'paid_amount': total_amount}}
+    # ---------------- TRANSACTIONAL PATH ----------------
+    def _payout_in_transaction(self, payout):
+        """Apply the whole split atomically. Returns False if already paid."""
+        def apply(session):
+            # Claim the pickup first; if another payment already paid it, abort so nothing is credited
+            claimed = mongo.db.pickup_requests.update_one(
+                {'_id': payout['pickup_id'], 'payment_status': {'$ne': 'paid'}},
+                {'$set': {'status': 'recycled', 'payment_status': 'paid', 'paid_amount': payout['amount'],
+                          'paid_transaction_id': payout['_id']}},
+                session=session
+            )
+            if claimed.matched_count == 0:
+                raise PickupAlreadyPaid(payout['pickup_id'])
+            journal = dict(payout, status='completed', completed_at=datetime.utcnow())
+            mongo.db.payout_journal.insert_one(journal, session=session)
+            for share in payout['shares']:
+                mongo.db.users.update_one(
+                    {'_id': share['user_id']},
+                    {'$inc': {'wallet_balance': share['amount']}},
+                    session=session
+                )
+            mongo.db.invoices.insert_many(payout['invoices'], session=session)
+
+        try:
+            with mongo.db.client.start_session() as session:
+                session.with_transaction(apply)
+            return True
+        except PickupAlreadyPaid:
+            print(f"Pickup {payout['pickup_id']} is already paid, ignoring payment {payout['_id']}")
+            return False
+        except DuplicateKeyError:
+            # Another callback already journaled this transaction_id
+            existing = mongo.db.payout_journal.find_one({'_id': payout['_id']})
+            if existing and existing.get('status') != 'completed':
+                return self._apply_journal(existing)
+            return False
+
+    # ---------------- JOURNAL (OUTBOX) PATH ----------------
+    def _payout_with_journal(self, payout):
+        """
+        Without transactions: persist the payout plan first, then apply each
+        step idempotently. Any callback (or a retry after a crash) that finds
+        a pending journal entry finishes it with the stored plan.
+        """
+        try:
+            mongo.db.payout_journal.insert_one(payout)
+            entry = payout
+        except DuplicateKeyError:
+            entry = mongo.db.payout_journal.find_one({'_id': payout['_id']})
+            if not entry or entry.get('status') == 'completed':
+                return False
+        return self._apply_journal(entry)
+
+    def _apply_journal(self, entry):
+        transaction_id = entry['_id']
+
+        # Claim the pickup for this payment before crediting anyone; a resumed entry already holds it
+        claimed = mongo.db.pickup_requests.update_one(
+            {'_id': entry['pickup_id'], '$or': [
+                {'payment_status': {'$ne': 'paid'}},
+                {'paid_transaction_id': transaction_id}
+            ]},
+            {'$set': {'payment_status': 'paid', 'paid_transaction_id': transaction_id}}
         )
+        if claimed.matched_count == 0:
+            print(f"Pickup {entry['pickup_id']} is already paid, ignoring payment {transaction_id}")
+            mongo.db.payout_journal.update_one(
+                {'_id': transaction_id},
+                {'$set': {'status': 'rejected', 'rejected_at': datetime.utcnow()}}
+            )
+            return False
+
+        # Wallet credits: the $ne guard and the marker push happen in one atomic update
+        for share in entry['shares']:
+            mongo.db.users.update_one(
+                {'_id': share['user_id'], 'applied_payouts': {'$ne': transaction_id}},
+                {
+                    '$inc': {'wallet_balance': share['amount']},
+                    '$push': {'applied_payouts': {'$each': [transaction_id], '$slice': -APPLIED_PAYOUTS_KEPT}}
+                }
+            )
+
+        # Invoices have deterministic _ids, so re-inserting is a no-op
+        try:
+            mongo.db.invoices.insert_many(entry['invoices'], ordered=False)
+        except BulkWriteError as e:
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+
+        result = mongo.db.pickup_requests.update_one(
+            {'_id': entry['pickup_id'], 'status': {'$ne': 'recycled'}},
+            {'$set': {'status': 'recycled', 'paid_amount': entry['amount']}}
+        )
+
+        mongo.db.payout_journal.update_one(
+            {'_id': transaction_id},
+            {'$set': {'status': 'completed', 'completed_at': datetime.utcnow()}}
+        )
+        return result.modified_count > 0
+
+
+class PickupAlreadyPaid(Exception):
+    """Raised inside a payout transaction to roll it back"""
+
+
+# Number of recent journal payouts remembered per wallet for idempotency
+APPLIED_PAYOUTS_KEPT = 200
+
+
+def invoice_number(transaction_id, role, timestamp):
+    """Collision-free, retry-stable invoice number derived from the payment id"""
+    digest = hashlib.sha1(str(transaction_id).encode()).hexdigest()[:10].upper()
+    return f"INV-{timestamp:%Y%m%d}-{digest}-{role[:3].upper()}"
+
 
-        return True
\ No newline at end of file
+def _transactions_unsupported(error):
+    # Standalone servers reject sessions with IllegalOperation (code 20)
+    if isinstance(error, ConfigurationError):
+        return True
+    return getattr(error, 'code', None) == 20 or 'Transaction numbers' in str(error)
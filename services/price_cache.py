@@ -0,0 +1,120 @@
+"""
+In-process cache of the metal_prices / category_prices tables.
+
+`price_tables()` returns an immutable, versioned PriceTables snapshot
+({metal: INR per kg}, {category: INR per kg}) loaded with one query per
+collection and reused for PRICE_CACHE_TTL_SECONDS. Anything that writes price
+documents should call `invalidate_prices()` so the next read reloads.
+
+A change-stream watcher (started per process on first use) also invalidates
+on any write to either collection, so every worker picks up new rates
+immediately. Change streams need a replica set (Atlas always is one); where
+they are unavailable the watcher logs once and the TTL alone bounds staleness.
+
+Both document shapes the tables have carried are understood:
+    category_prices: {category, price_per_kg} or {category, base_price_per_kg}
+    metal_prices:    {metal, price_per_kg} rows, or a snapshot document with
+                     <metal>_inr_per_kg / <metal>_inr_per_gram keys (newest wins)
+"""
+
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import NamedTuple
+from mongo import mongo
+
+PRICE_CACHE_TTL_SECONDS = 300
+PRICE_COLLECTIONS = ["metal_prices", "category_prices"]
+
+
+class PriceTables(NamedTuple):
+    metal: MappingProxyType
+    category: MappingProxyType
+    version: int
+    loaded_at: float
+
+
+_lock = threading.Lock()
+_tables = None
+_expires_at = 0.0
+_version = 0
+_watcher = None
+_watcher_pid = None
+_watch_unavailable = False
+
+
+def _snapshot_rates(doc):
+    rates = {}
+    for key, value in doc.items():
+        if not isinstance(value, (int, float)):
+            continue
+        if key.endswith("_inr_per_kg"):
+            rates[key[:-len("_inr_per_kg")]] = float(value)
+        elif key.endswith("_inr_per_gram"):
+            rates[key[:-len("_inr_per_gram")]] = float(value) * 1000
+    return rates
+
+
+def _load():
+    metal = {}
+    # Oldest first, so the newest snapshot and explicit rows win
+    for doc in mongo.db.metal_prices.find({"metal": {"$exists": False}}).sort("timestamp", 1):
+        metal.update(_snapshot_rates(doc))
+    for doc in mongo.db.metal_prices.find({"metal": {"$exists": True}}, {"metal": 1, "price_per_kg": 1}):
+        metal[doc["metal"]] = doc.get("price_per_kg", 0)
+    category = {
+        doc["category"]: doc.get("price_per_kg", doc.get("base_price_per_kg", 0))
+        for doc in mongo.db.category_prices.find(
+            {"category": {"$exists": True}}, {"category": 1, "price_per_kg": 1, "base_price_per_kg": 1}
+        )
+    }
+    return metal, category
+
+
+def price_tables():
+    """Current price snapshot, reloaded from Mongo when expired or invalidated"""
+    global _tables, _expires_at, _version
+    if _tables is not None and time.monotonic() < _expires_at:
+        return _tables
+    watch_prices()
+    with _lock:
+        if _tables is None or time.monotonic() >= _expires_at:
+            metal, category = _load()
+            _version += 1
+            _tables = PriceTables(MappingProxyType(metal), MappingProxyType(category), _version, time.time())
+            _expires_at = time.monotonic() + PRICE_CACHE_TTL_SECONDS
+    return _tables
+
+
+def invalidate_prices():
+    """Drop the cached snapshot; the next price_tables() call reloads it"""
+    global _expires_at
+    with _lock:
+        _expires_at = 0.0
+
+
+# ---------------- CHANGE STREAM ----------------
+def _watch():
+    global _watch_unavailable
+    pipeline = [{"$match": {"ns.coll": {"$in": PRICE_COLLECTIONS}}}]
+    try:
+        with mongo.db.watch(pipeline) as stream:
+            for _ in stream:
+                invalidate_prices()
+    except Exception as e:
+        _watch_unavailable = True
+        print(f"Price change stream unavailable, using {PRICE_CACHE_TTL_SECONDS}s TTL: {e}")
+
+
+def watch_prices():
+    """Start the per-process change-stream watcher (idempotent, fork-safe)"""
+    global _watcher, _watcher_pid
+    if _watch_unavailable:
+        return
+    with _lock:
+        if _watcher is not None and _watcher.is_alive() and _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+        _watcher = threading.Thread(target=_watch, name="price-watcher", daemon=True)
+        _watcher.start()
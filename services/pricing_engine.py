@@ -0,0 +1,174 @@
+"""
+Table-driven pricing for e-waste items.
+
+value = base rate (INR/kg) x weight (kg) x condition factor x age factor,
+where the age factor depreciates 10% per year down to a floor of 20%.
+
+Base rates come from the category_prices collection (via the versioned
+snapshot in services/price_cache.py), falling back to DEFAULT_BASE_PRICES for
+categories without a row, so an empty collection prices exactly as the old
+hard-coded table did. A PricingSnapshot is built once per price-table
+version and shared read-only by every request until the tables change; if
+the tables cannot be loaded the last snapshot (or the built-in table) is
+used, and the load is not retried for PRICE_TABLES_RETRY_SECONDS, so pricing
+never blocks on an unreachable database. `snapshot.fingerprint` hashes the rates themselves, so it is the same in
+every worker process and only changes when a rate does.
+
+`pricing_engine.price_many(items)` prices a whole pickup in one call; items use
+the stored pickup shape ({type or category, weight in grams, condition,
+age_years}).
+"""
+
+import hashlib
+import json
+import threading
+import time
+from types import MappingProxyType
+from typing import NamedTuple
+from services.price_cache import price_tables
+
+# INR per kg for categories without a category_prices row
+DEFAULT_BASE_PRICES = MappingProxyType({
+    "Laptop": 300,
+    "Desktop PC": 250,
+    "Mobile Devices": 500,
+    "Printer": 100,
+    "Office PCs": 250,
+    "Server Racks": 400,
+    "UPS Batteries": 150,
+    "Washing Machine": 50,
+    "Fridge": 60,
+    "AC": 70
+})
+DEFAULT_BASE_RATE = 100
+
+CONDITION_FACTORS = MappingProxyType({
+    "working": 1.5,
+    "repairable": 1.0,
+    "scrap": 0.5
+})
+DEFAULT_CONDITION_FACTOR = 0.5
+
+DEPRECIATION_PER_YEAR = 0.10
+MAX_DEPRECIATION = 0.80
+CURRENCY = "INR"
+
+# Backoff between price-table loads after one fails
+PRICE_TABLES_RETRY_SECONDS = 30
+
+
+class PricingSnapshot(NamedTuple):
+    version: int
+    base_prices: MappingProxyType
+    metal_prices: MappingProxyType
+    fingerprint: str
+
+
+def rates_fingerprint(base_prices):
+    """Content hash of every rate the formula uses"""
+    rates = {
+        "base": dict(base_prices),
+        "condition": dict(CONDITION_FACTORS),
+        "default": [DEFAULT_BASE_RATE, DEFAULT_CONDITION_FACTOR],
+        "depreciation": [DEPRECIATION_PER_YEAR, MAX_DEPRECIATION]
+    }
+    return hashlib.sha256(json.dumps(rates, sort_keys=True).encode()).hexdigest()
+
+
+def _make_snapshot(version, base_prices, metal_prices):
+    base_prices = MappingProxyType(base_prices)
+    return PricingSnapshot(version, base_prices, metal_prices, rates_fingerprint(base_prices))
+
+
+class PricingEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._builtin = _make_snapshot(0, dict(DEFAULT_BASE_PRICES), MappingProxyType({}))
+        self._retry_at = 0.0
+        self._unavailable = False
+
+    def snapshot(self):
+        """Pricing tables for the current price-table version"""
+        if self._unavailable and time.monotonic() < self._retry_at:
+            return self._snapshot or self._builtin
+        try:
+            tables = price_tables()
+        except Exception as e:
+            # Keep pricing with the last good (or built-in) tables and back off
+            with self._lock:
+                if not self._unavailable:
+                    print(f"Price tables unavailable, retrying every {PRICE_TABLES_RETRY_SECONDS}s: {e}")
+                self._unavailable = True
+                self._retry_at = time.monotonic() + PRICE_TABLES_RETRY_SECONDS
+            return self._snapshot or self._builtin
+        if self._unavailable:
+            self._unavailable = False
+            print("Price tables available again")
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != tables.version:
+            with self._lock:
+                if self._snapshot is None or self._snapshot.version != tables.version:
+                    self._snapshot = _make_snapshot(
+                        tables.version,
+                        {**DEFAULT_BASE_PRICES, **tables.category},
+                        tables.metal
+                    )
+                snapshot = self._snapshot
+        return snapshot
+
+    @staticmethod
+    def _price(snapshot, category, weight, condition, age_years):
+        base_rate = snapshot.base_prices.get(category, DEFAULT_BASE_RATE)
+        condition_factor = CONDITION_FACTORS.get(condition, DEFAULT_CONDITION_FACTOR)
+        age_factor = 1 - min(age_years * DEPRECIATION_PER_YEAR, MAX_DEPRECIATION)
+        return {
+            "base_rate": base_rate,
+            "condition_factor": condition_factor,
+            "age_factor": round(age_factor, 2),
+            "estimated_value": round(base_rate * weight * condition_factor * age_factor, 2),
+            "currency": CURRENCY
+        }
+
+    def price(self, category, weight, condition, age_years):
+        """Price one item; weight in kg"""
+        return self._price(self.snapshot(), category, weight, condition, age_years)
+
+    def price_many(self, items, snapshot=None):
+        """
+        Price every item against one snapshot. Returns
+        {items: [per-item pricing], total_value, currency, price_version}.
+        """
+        snapshot = snapshot or self.snapshot()
+        priced = []
+        for item in items:
+            weight_g = float(item.get("weight") or 0)
+            priced.append(self._price(
+                snapshot,
+                item.get("category", item.get("type")),
+                weight_g / 1000 if weight_g > 0 else 0,
+                item.get("condition"),
+                int(item.get("age_years") or 0)
+            ))
+        return {
+            "items": priced,
+            "total_value": round(sum(p["estimated_value"] for p in priced), 2),
+            "currency": CURRENCY,
+            "price_version": snapshot.version
+        }
+
+
+pricing_engine = PricingEngine()
+
+
+def calculate_final_price(category, weight, condition, age_years):
+    """
+    Calculates the estimated value of e-waste.
+
+    Args:
+        category (str): E-Waste type (Laptop, PC, etc.)
+        weight (float): Weight in kg (converted from grams if needed)
+        condition (str): working, repairable, scrap
+        age_years (int): Age of the device
+    """
+    return pricing_engine.price(category, weight, condition, age_years)
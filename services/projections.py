@@ -0,0 +1,121 @@
+"""
+Declared field sets for the hot read paths.
+
+Each route declares the fields it reads once, as a FieldSet:
+
+    CLUSTER_CARD_FIELDS = FieldSet("warehouse.cluster_card", "status", "total_weight", ...)
+
+A FieldSet is the projection itself (a dict of field -> 1), so it can be passed
+anywhere pymongo takes one; `fields.find(...)` / `fields.find_one(...)` apply it
+and return documents ready for the template.
+
+Audit mode (PROJECTION_AUDIT=1) wraps every document loaded through a FieldSet
+and records which top-level fields are read. After each request it logs, per
+FieldSet, the projected fields nothing read (drop them from the declaration)
+and the fields that were read but never projected (add them, or the page is
+silently rendering blanks). Audit mode costs a little per field access and is
+meant for development only.
+"""
+
+import os
+from flask import g, request, has_request_context, current_app
+
+
+class FieldSet(dict):
+    """Named inclusion projection for one read path"""
+
+    def __init__(self, name, *fields):
+        super().__init__((field, 1) for field in fields)
+        self.name = name
+        self.top_level = {field.split(".")[0] for field in fields} | {"_id"}
+
+    def find(self, collection, query, sort=None, limit=None):
+        cursor = collection.find(query, self)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return self.track(list(cursor))
+
+    def find_one(self, collection, query):
+        doc = collection.find_one(query, self)
+        return self.track([doc])[0] if doc else None
+
+    def track(self, docs):
+        """Wrap `docs` for the read audit (returns them unchanged when it is off)"""
+        audit = _audit()
+        if audit is None:
+            return docs
+        usage = audit.setdefault(self.name, {"fields": self, "fetched": set(), "read": set(), "written": set()})
+        tracked = []
+        for doc in docs:
+            usage["fetched"].update(doc.keys())
+            tracked.append(TrackedDoc(doc, usage))
+        return tracked
+
+
+def track(projection, docs):
+    """FieldSet.track for any projection; plain dicts and None pass through"""
+    if isinstance(projection, FieldSet):
+        return projection.track(docs)
+    return docs
+
+
+# ---------------- AUDIT ----------------
+class TrackedDoc(dict):
+    """Document that records top-level reads and writes into its FieldSet's usage"""
+
+    __slots__ = ("_usage",)
+
+    def __init__(self, doc, usage):
+        super().__init__(doc)
+        self._usage = usage
+
+    def __getitem__(self, key):
+        self._usage["read"].add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._usage["read"].add(key)
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        self._usage["read"].add(key)
+        return super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        # Fields computed in Python (e.g. hydrated names) are not projection misses
+        self._usage["written"].add(key)
+        super().__setitem__(key, value)
+
+
+def _audit():
+    if not has_request_context() or not current_app.config.get("PROJECTION_AUDIT"):
+        return None
+    if "projection_audit" not in g:
+        g.projection_audit = {}
+    return g.projection_audit
+
+
+def audit_report(audit):
+    """{name: {"unused": [...], "unprojected": [...]}} for FieldSets with findings"""
+    report = {}
+    for name, usage in audit.items():
+        unused = usage["fetched"] - usage["read"] - {"_id"}
+        unprojected = usage["read"] - usage["fields"].top_level - usage["written"]
+        if unused or unprojected:
+            report[name] = {"unused": sorted(unused), "unprojected": sorted(unprojected)}
+    return report
+
+
+def init_app(app):
+    app.config.setdefault("PROJECTION_AUDIT", os.getenv("PROJECTION_AUDIT", "0") == "1")
+
+    @app.after_request
+    def log_projection_audit(response):
+        audit = g.pop("projection_audit", None)
+        if audit:
+            for name, findings in audit_report(audit).items():
+                print(f"[projection-audit] {request.endpoint} {name}: "
+                      f"unused={findings['unused']} unprojected={findings['unprojected']}")
+        return response
@@ -0,0 +1,137 @@
+"""
+Revalue collected pickups at the current rates ("reprice_collected" job).
+
+Collected pickups stream from one _id-ordered cursor in batches of
+REPRICE_BATCH_SIZE. Each batch is flattened into line items (the pickup's
+items, or a single ewaste_type x final_weight line when it has none) and
+valued with the pricing engine's formula as NumPy array arithmetic:
+
+    base rate x weight (kg) x condition factor x (1 - min(age x 10%, 80%))
+
+Line values are summed per pickup with bincount and written back in one
+unordered bulk_write per batch ({estimated_value, valued_at}). The whole run
+prices against one snapshot of the rates. After every batch the last _id is
+checkpointed (services/checkpoints.py), so an interrupted run resumes where it
+stopped unless the rates changed in between, in which case it starts over.
+"""
+
+import time
+from datetime import datetime
+from itertools import islice
+import numpy as np
+from pymongo import UpdateOne
+from mongo import mongo
+from services.jobs import register_job
+from services.checkpoints import load_checkpoint, start_checkpoint, save_checkpoint, finish_checkpoint
+from services.pricing_engine import (
+    pricing_engine, CONDITION_FACTORS, DEFAULT_CONDITION_FACTOR, DEFAULT_BASE_RATE,
+    DEPRECIATION_PER_YEAR, MAX_DEPRECIATION
+)
+
+REPRICE_JOB = "reprice_collected"
+REPRICE_STATUS = "collected"
+REPRICE_BATCH_SIZE = 5000
+REPRICE_FIELDS = {"ewaste_type": 1, "final_weight": 1, "approx_weight": 1, "items": 1, "condition": 1, "age_years": 1}
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _lookup(keys, table, default):
+    # One dict lookup per distinct key, broadcast back over the batch
+    unique, inverse = np.unique(np.asarray(keys, dtype=str), return_inverse=True)
+    return np.array([table.get(key, default) for key in unique], dtype=float)[inverse]
+
+
+def line_items(pickups):
+    """Parallel lists (pickup index, category, weight g, condition, age) over every line"""
+    owners, categories, weights, conditions, ages = [], [], [], [], []
+    for i, pickup in enumerate(pickups):
+        items = pickup.get("items")
+        if not isinstance(items, list) or not items:
+            items = [{
+                "type": pickup.get("ewaste_type"),
+                # final_weight is stored as null until collection is weighed
+                "weight": pickup.get("final_weight") or pickup.get("approx_weight")
+            }]
+        for item in items:
+            owners.append(i)
+            categories.append(item.get("category", item.get("type")))
+            weights.append(_number(item.get("weight")))
+            conditions.append(item.get("condition", pickup.get("condition")))
+            ages.append(_number(item.get("age_years", pickup.get("age_years"))))
+    return owners, categories, weights, conditions, ages
+
+
+def value_batch(pickups, base_prices):
+    """Estimated value per pickup, rounded like PricingEngine.price_many"""
+    owners, categories, weights, conditions, ages = line_items(pickups)
+    weight_kg = np.maximum(np.asarray(weights, dtype=float), 0) / 1000
+    age_factor = 1 - np.minimum(np.trunc(np.asarray(ages, dtype=float)) * DEPRECIATION_PER_YEAR, MAX_DEPRECIATION)
+    values = (
+        _lookup(categories, base_prices, DEFAULT_BASE_RATE)
+        * weight_kg
+        * _lookup(conditions, CONDITION_FACTORS, DEFAULT_CONDITION_FACTOR)
+        * age_factor
+    )
+    # Python's round, not np.round (which scales by 100 first and can land a cent off)
+    rounded = np.array([round(value, 2) for value in values.tolist()], dtype=float)
+    totals = np.bincount(np.asarray(owners, dtype=np.intp), weights=rounded, minlength=len(pickups))
+    return [round(total, 2) for total in totals.tolist()]
+
+
+@register_job(REPRICE_JOB)
+def reprice_collected_job(params, report):
+    batch_size = int(params.get("batch_size") or REPRICE_BATCH_SIZE)
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    snapshot = pricing_engine.snapshot()
+    base_prices = dict(snapshot.base_prices)
+    # The rates' content hash, so a resume never mixes two rate sets
+    fingerprint = snapshot.fingerprint
+
+    checkpoint = load_checkpoint(REPRICE_JOB, fingerprint) if params.get("resume", True) else None
+    if checkpoint is None:
+        checkpoint = start_checkpoint(REPRICE_JOB, fingerprint, valued_at=datetime.utcnow())
+    resumed_from = done = checkpoint["done"]
+
+    query = {"status": REPRICE_STATUS}
+    if checkpoint["last_id"] is not None:
+        query["_id"] = {"$gt": checkpoint["last_id"]}
+    total = done + mongo.db.pickup_requests.count_documents(query)
+    report("repricing", done, total)
+
+    started = time.monotonic()
+    modified = 0
+    rate = None
+    cursor = mongo.db.pickup_requests.find(query, REPRICE_FIELDS).sort("_id", 1).batch_size(batch_size)
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            break
+        values = value_batch(batch, base_prices)
+        result = mongo.db.pickup_requests.bulk_write([
+            UpdateOne({"_id": pickup["_id"]}, {"$set": {"estimated_value": value, "valued_at": checkpoint["valued_at"]}})
+            for pickup, value in zip(batch, values)
+        ], ordered=False)
+        modified += result.modified_count
+        done += len(batch)
+        rate = round((done - resumed_from) / max(time.monotonic() - started, 1e-9), 1)
+        save_checkpoint(REPRICE_JOB, batch[-1]["_id"], done, pickups_per_second=rate)
+        report("repricing", done, total)
+
+    seconds = round(time.monotonic() - started, 3)
+    finish_checkpoint(REPRICE_JOB, pickups_per_second=rate)
+    print(f"Repriced {done - resumed_from} collected pickups in {seconds}s ({rate or 0} pickups/s)")
+    return {
+        "processed": done - resumed_from,
+        "modified": modified,
+        "resumed_from": resumed_from,
+        "total": total,
+        "seconds": seconds,
+        "pickups_per_second": rate
+    }
@@ -0,0 +1,99 @@
+"""
+The analyze-routes run as a background job ("analyze_routes").
+
+mode "greedy" (default) applies the radius/weight clustering engine
+(services/clustering.py); mode "cvrp" runs the capacitated routing solver
+(services/cvrp.py). Both only read pending, unclustered pickups and return
+{"mode", "pickups", "cluster_ids"}.
+"""
+
+from datetime import datetime
+from flask import current_app
+from mongo import mongo
+from services.geo import REGIONAL_WAREHOUSES
+from services.hub_locator import nearest_hubs
+from services.spatial_index import geo_fields
+from services.incremental_clustering import insert_planned_clusters
+from services.clustering import plan_clusters, cluster_status, pickup_weight, CLUSTER_RADIUS_KM, CLUSTER_WEIGHT_THRESHOLD
+from services.cvrp import run_cvrp, DEFAULT_VEHICLE_CAPACITY_KG, DEFAULT_TIME_BUDGET_SECONDS
+from services.jobs import register_job, compute_pool
+
+PLAN_FIELDS = {"latitude": 1, "longitude": 1, "approx_weight": 1, "ewaste_weight": 1}
+
+
+def _refresh_cluster(cluster):
+    # Recompute what depends on the members after pickups lost to concurrent claims are dropped
+    max_distance = max(u["distance_km"] for u in cluster["users"])
+    cluster["radius_used_km"] = round(max_distance, 2)
+    cluster["efficiency_score"] = round(cluster["total_weight"] / max_distance, 2) if max_distance else cluster["total_weight"]
+    cluster["status"] = cluster_status(cluster["total_weight"])
+
+
+def run_greedy(report):
+    report("loading")
+    users = list(mongo.db.pickup_requests.find({
+        "status": "pending",
+        "cluster_id": None
+    }, PLAN_FIELDS))
+
+    # Greedy weight-ordered radius clustering, off the web worker's GIL
+    report("clustering", 0, len(users))
+    plans = compute_pool().submit(plan_clusters, users, CLUSTER_RADIUS_KM, CLUSTER_WEIGHT_THRESHOLD).result()
+
+    # Nearest Regional Warehouse (1-4) for every anchor via the precomputed hub grid
+    wh_idx, wh_dist = nearest_hubs(
+        [p["anchor"]["latitude"] for p in plans],
+        [p["anchor"]["longitude"] for p in plans],
+        REGIONAL_WAREHOUSES
+    )
+
+    cluster_docs = []
+
+    for plan, i, dist_to_wh in zip(plans, wh_idx, wh_dist):
+        anchor = plan["anchor"]
+        nearest_wh = REGIONAL_WAREHOUSES[int(i)]
+
+        cluster_users = [{
+            "user_id": u["_id"],
+            "weight": pickup_weight(u),
+            "distance_km": round(dist, 2)
+        } for u, dist in plan["members"]]
+        total_weight = plan["total_weight"]
+        max_distance = plan["max_distance"]
+
+        cluster = {
+            "anchor_user_id": anchor["_id"],
+            "anchor_location": {
+                "lat": anchor["latitude"],
+                "lng": anchor["longitude"]
+            },
+            "destination": nearest_wh["name"],
+            "dist_to_hub": round(float(dist_to_wh), 2), # Distance to drop-off point
+            "radius_used_km": round(max_distance, 2),
+            "total_weight": total_weight,
+            "user_count": len(cluster_users),
+            "users": cluster_users,
+            "efficiency_score": round(total_weight / max_distance, 2) if max_distance else total_weight,
+            "status": cluster_status(total_weight),
+            "admin_override": False,
+            "created_at": datetime.utcnow()
+        }
+        cluster.update(geo_fields(anchor["latitude"], anchor["longitude"]))
+        cluster_docs.append(cluster)
+
+    # Claim every plan's members in one bulk write, then insert the clusters with what they won
+    report("saving", len(users), len(users))
+    created = insert_planned_clusters(cluster_docs, _refresh_cluster)
+    return created, len(users)
+
+
+@register_job("analyze_routes")
+def analyze_routes_job(params, report):
+    mode = params.get("mode") or "greedy"
+    if mode == "cvrp":
+        capacity = float(params.get("capacity_kg") or current_app.config.get("CVRP_VEHICLE_CAPACITY_KG", DEFAULT_VEHICLE_CAPACITY_KG))
+        time_budget = float(params.get("time_budget_seconds") or current_app.config.get("CVRP_TIME_BUDGET_SECONDS", DEFAULT_TIME_BUDGET_SECONDS))
+        created, pickups = run_cvrp(capacity, time_budget, report)
+    else:
+        created, pickups = run_greedy(report)
+    return {"mode": mode, "pickups": pickups, "cluster_ids": created}
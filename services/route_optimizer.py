@@ -0,0 +1,193 @@
+"""
+Stop sequencing for cluster routes.
+
+Orders a cluster's pickups as an open path that ends at its destination hub:
+nearest-neighbour construction (grown backwards from the hub), then 2-opt
+segment reversals and Or-opt segment moves until no move shortens the path.
+Distances come from one vectorized haversine matrix.
+
+The result is stored on the cluster as
+`route_plan: {order, distance_km, eta_minutes, membership_key, computed_at}`
+and reused until the cluster's members or destination change.
+"""
+
+import hashlib
+from datetime import datetime
+import numpy as np
+from mongo import mongo
+from services.geo import WAREHOUSES, haversine_matrix
+from services.cluster_hydration import fetch_by_ids
+
+# Straight-line distance understates city driving; used for distance and ETA
+ROAD_FACTOR = 1.3
+AVG_SPEED_KMH = 25
+SERVICE_MINUTES_PER_STOP = 10
+OR_OPT_MAX_SEGMENT = 3
+PLAN_FIELDS = {"latitude": 1, "longitude": 1}
+
+
+# ---------------- SEQUENCING ----------------
+def _path_length(dist, path):
+    return float(dist[path[:-1], path[1:]].sum()) if len(path) > 1 else 0.0
+
+
+def _nearest_neighbour(dist, n, end):
+    """Grow the path backwards from `end` (or from stop 0 when open-ended)"""
+    unvisited = np.ones(len(dist), dtype=bool)
+    unvisited[n:] = False
+    current = end if end is not None else 0
+    unvisited[current] = False
+    path = [current]
+    while unvisited.any():
+        candidates = np.where(unvisited, dist[current], np.inf)
+        current = int(np.argmin(candidates))
+        unvisited[current] = False
+        path.append(current)
+    path.reverse()
+    return path
+
+
+def _two_opt(dist, path, fixed_end):
+    """Reverse path[i..j] while that shortens the path; the last node stays put if fixed"""
+    path = np.array(path)
+    last = len(path) - 1 if fixed_end else len(path)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(0, last - 1):
+            j = np.arange(i + 1, last)
+            before = dist[path[i - 1], path[i]] if i > 0 else 0.0
+            after = np.where(j + 1 < len(path), dist[path[j], path[np.minimum(j + 1, len(path) - 1)]], 0.0)
+            new_before = dist[path[i - 1], path[j]] if i > 0 else np.zeros(len(j))
+            new_after = np.where(j + 1 < len(path), dist[path[i], path[np.minimum(j + 1, len(path) - 1)]], 0.0)
+            delta = new_before + new_after - before - after
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-9:
+                path[i:j[k] + 1] = path[i:j[k] + 1][::-1]
+                improved = True
+    return path.tolist()
+
+
+def _or_opt(dist, path, fixed_end):
+    """Move segments of 1..OR_OPT_MAX_SEGMENT stops (optionally reversed) to a better position"""
+    def d(a, b):
+        return dist[a, b] if a is not None and b is not None else 0.0
+
+    improved = True
+    while improved:
+        improved = False
+        movable = len(path) - 1 if fixed_end else len(path)
+        for size in range(1, OR_OPT_MAX_SEGMENT + 1):
+            for i in range(0, movable - size + 1):
+                segment = path[i:i + size]
+                prev = path[i - 1] if i > 0 else None
+                nxt = path[i + size] if i + size < len(path) else None
+                removal_gain = d(prev, segment[0]) + d(segment[-1], nxt) - d(prev, nxt)
+                rest = path[:i] + path[i + size:]
+                limit = len(rest) - 1 if fixed_end else len(rest)
+                for pos in range(0, limit + 1):
+                    if pos == i:
+                        continue
+                    a = rest[pos - 1] if pos > 0 else None
+                    b = rest[pos] if pos < len(rest) else None
+                    for seg in (segment, segment[::-1]):
+                        cost = d(a, seg[0]) + d(seg[-1], b) - d(a, b)
+                        if cost < removal_gain - 1e-9:
+                            path = rest[:pos] + seg + rest[pos:]
+                            improved = True
+                            break
+                    if improved:
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+    return path
+
+
+def sequence_stops(lats, lngs, end=None):
+    """
+    Order stops (lats, lngs) as a short open path, finishing at `end`
+    ((lat, lng), e.g. the destination hub) when given.
+    Returns (order as indexes into the stops, straight-line length in km).
+    """
+    n = len(lats)
+    if n == 0:
+        return [], 0.0
+    all_lats = list(lats) + ([end[0]] if end else [])
+    all_lngs = list(lngs) + ([end[1]] if end else [])
+    dist = haversine_matrix(all_lats, all_lngs, all_lats, all_lngs)
+    end_index = n if end else None
+
+    path = _nearest_neighbour(dist, len(all_lats), end_index)
+    if len(path) > 2:
+        path = _two_opt(dist, path, fixed_end=end is not None)
+        path = _or_opt(dist, path, fixed_end=end is not None)
+    order = [i for i in path if i != end_index]
+    return order, _path_length(dist, np.array(path))
+
+
+# ---------------- CLUSTER PLANS ----------------
+def membership_key(user_ids, destination):
+    raw = "|".join(sorted(str(u) for u in user_ids)) + "#" + str(destination or "")
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _hub_by_name(name):
+    return next((wh for wh in WAREHOUSES if wh["name"] == name), None)
+
+
+def get_route_plan(cluster, pickups=None):
+    """
+    The cluster's stored route plan, recomputed (and saved) when its members or
+    destination changed. `pickups` may pass already-loaded member documents
+    keyed by _id to avoid a second read.
+    """
+    user_ids = [u["user_id"] for u in cluster.get("users", [])]
+    key = membership_key(user_ids, cluster.get("destination"))
+    plan = cluster.get("route_plan")
+    if plan and plan.get("membership_key") == key:
+        return plan
+
+    if pickups is None:
+        pickups = fetch_by_ids(mongo.db.pickup_requests, user_ids, PLAN_FIELDS)
+    stops = []
+    for uid in user_ids:
+        doc = pickups.get(uid)
+        try:
+            stops.append((uid, float(doc["latitude"]), float(doc["longitude"])))
+        except (TypeError, KeyError, ValueError):
+            continue
+
+    hub = _hub_by_name(cluster.get("destination"))
+    order, straight_km = sequence_stops(
+        [s[1] for s in stops],
+        [s[2] for s in stops],
+        (hub["lat"], hub["lng"]) if hub else None
+    )
+    distance_km = round(straight_km * ROAD_FACTOR, 2)
+    plan = {
+        "order": [str(stops[i][0]) for i in order],
+        "distance_km": distance_km,
+        "eta_minutes": int(round(distance_km / AVG_SPEED_KMH * 60 + SERVICE_MINUTES_PER_STOP * len(order))),
+        "membership_key": key,
+        "computed_at": datetime.utcnow()
+    }
+    if cluster.get("_id") is not None:
+        mongo.db.collection_clusters.update_one({"_id": cluster["_id"]}, {"$set": {"route_plan": plan}})
+    cluster["route_plan"] = plan
+    return plan
+
+
+def ordered_pickups(cluster, projection=None):
+    """Member pickup documents in planned stop order, plus the plan"""
+    user_ids = [u["user_id"] for u in cluster.get("users", [])]
+    pickups = fetch_by_ids(mongo.db.pickup_requests, user_ids, projection)
+    plan = get_route_plan(cluster, pickups)
+    by_id = {str(k): v for k, v in pickups.items()}
+    ordered = [by_id[uid] for uid in plan["order"] if uid in by_id]
+    planned = set(plan["order"])
+    # Members without coordinates go last, in their cluster["users"] order
+    ordered += [by_id[str(uid)] for uid in dict.fromkeys(user_ids)
+                if str(uid) in by_id and str(uid) not in planned]
+    return ordered, plan
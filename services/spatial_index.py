@@ -0,0 +1,75 @@
+import re
+from pymongo.errors import OperationFailure
+from mongo import mongo
+from services.geo import geohash_encode, geohash_cells_around, to_geojson_point
+
+
+def geo_fields(lat, lng):
+    """Indexed location fields stored alongside latitude/longitude on a document"""
+    if lat is None or lng is None:
+        return {}
+    return {
+        "location": to_geojson_point(lat, lng),
+        "geohash": geohash_encode(lat, lng)
+    }
+
+
+def near_query(lat, lng, radius_km, query=None):
+    """`query` restricted to `radius_km` of (lat, lng) with $nearSphere on `location`"""
+    near = dict(query or {})
+    near["location"] = {
+        "$nearSphere": {
+            "$geometry": to_geojson_point(lat, lng),
+            "$maxDistance": radius_km * 1000
+        }
+    }
+    return near
+
+
+def grid_query(lat, lng, radius_km, query=None):
+    """`query` restricted to the geohash cells covering `radius_km` of (lat, lng)"""
+    grid = dict(query or {})
+    cells = geohash_cells_around(lat, lng, radius_km)
+    grid["geohash"] = {"$in": [re.compile("^" + cell) for cell in cells]}
+    return grid
+
+
+def find_nearby(collection, lat, lng, radius_km, query=None, projection=None):
+    """
+    Documents of `collection` matching `query` whose `location` lies within
+    `radius_km` of (lat, lng).
+
+    Uses the 2dsphere index on `location` ($nearSphere, nearest first; see
+    services/indexes.py). When the geo index is unavailable it falls back to
+    the geohash grid: the 3x3 block of cells covering the radius is computed
+    in-process and matched by prefix on the ordinary `geohash` index. Fallback
+    results are a superset of the circle, so callers still apply an exact
+    distance check.
+    """
+    try:
+        return list(collection.find(near_query(lat, lng, radius_km, query), projection))
+    except OperationFailure as e:
+        print(f"2dsphere lookup unavailable, using geohash grid: {e}")
+    return list(collection.find(grid_query(lat, lng, radius_km, query), projection))
+
+
+def find_nearby_pickups(lat, lng, radius_km, query=None, projection=None):
+    """Pickups matching `query` within `radius_km` of (lat, lng); see find_nearby"""
+    return find_nearby(mongo.db.pickup_requests, lat, lng, radius_km, query, projection)
+
+
+def backfill_geo_fields(batch_size=500):
+    """Add location/geohash to pickups that only have latitude/longitude"""
+    updated = 0
+    cursor = mongo.db.pickup_requests.find(
+        {"location": {"$exists": False}, "latitude": {"$ne": None}, "longitude": {"$ne": None}},
+        {"latitude": 1, "longitude": 1}
+    ).batch_size(batch_size)
+    for doc in cursor:
+        try:
+            fields = geo_fields(float(doc["latitude"]), float(doc["longitude"]))
+        except (TypeError, ValueError, KeyError):
+            continue
+        mongo.db.pickup_requests.update_one({"_id": doc["_id"]}, {"$set": fields})
+        updated += 1
+    return updated
@@ -1,55 +1,79 @@
-async function calculatePrice() {
-    const category = document.getElementById('category').value;
-    const weight = document.getElementById('weight').value;
-    const condition = document.getElementById('condition').value;
-    const age = document.getElementById('age').value;
-
-    try {
-        const response = await fetch('/engineer/calculate-price', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                category: category,
-                weight: weight,
-                condition: condition,
-                age_years: age
-            })
-        });
+// Batched pricing for the engineer inspection page.
+// A BatchPricer reads every line item, waits until edits settle and sends one
+// POST to /engineer/calculate-price/batch. Only one request is in flight at a
+// time; edits made meanwhile are coalesced into a single follow-up request.
+// Results are remembered per request body with their ETag, so re-pricing an
+// unchanged set of items is a conditional request answered with 304.
+class BatchPricer {
+    constructor(readItems, onPriced, options = {}) {
+        this.readItems = readItems;
+        this.onPriced = onPriced;
+        this.url = options.url || '/engineer/calculate-price/batch';
+        this.delay = options.delay ?? 300;
+        this.cache = new Map();
+        this.timer = null;
+        this.running = null;
+        this.pending = false;
+        this.lastBody = null;
+        this.latest = null;
+    }
 
-        const data = await response.json();
-        document.getElementById('calculated-price').innerText = data.estimated_value;
-        return data.estimated_value;
-    } catch (error) {
-        console.error('Error calculating price:', error);
-        return 0;
+    // Call on every edit; prices once the edits stop for `delay` ms
+    schedule() {
+        clearTimeout(this.timer);
+        this.timer = setTimeout(() => this.flush(), this.delay);
     }
-}
 
-async function submitInspection() {
-    const pickupId = document.getElementById('pickup-id').value;
-    const price = await calculatePrice(); // Ensure we have latest price
+    // Price immediately (skipping the debounce) and resolve with the result
+    async current() {
+        clearTimeout(this.timer);
+        while (this.running) await this.running;
+        await this.flush();
+        return this.latest;
+    }
 
-    if (!confirm(`Confirm collection at ₹${price}?`)) return;
+    flush() {
+        if (this.running) {
+            this.pending = true;
+            return this.running;
+        }
+        const body = JSON.stringify({ items: this.readItems() });
+        if (body === this.lastBody) return Promise.resolve(this.latest);
 
-    try {
-        const response = await fetch(`/engineer/submit/${pickupId}`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                total_price: price,
-                decision: 'approved'
-            })
+        this.running = this.request(body).finally(() => {
+            this.running = null;
+            if (this.pending) {
+                this.pending = false;
+                this.flush();
+            }
         });
+        return this.running;
+    }
+
+    async request(body) {
+        const cached = this.cache.get(body);
+        const headers = { 'Content-Type': 'application/json' };
+        if (cached) headers['If-None-Match'] = cached.etag;
 
-        const result = await response.json();
-        if (result.success) {
-            alert('Pickup collected successfully!');
-            window.location.href = '/engineer/dashboard';
+        try {
+            const response = await fetch(this.url, { method: 'POST', headers, body });
+            let pricing;
+            if (response.status === 304 && cached) {
+                pricing = cached.pricing;
+            } else if (response.ok) {
+                pricing = await response.json();
+                const etag = response.headers.get('ETag');
+                if (etag) this.cache.set(body, { etag, pricing });
+            } else {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            this.lastBody = body;
+            this.latest = pricing;
+            this.onPriced(pricing);
+        } catch (error) {
+            console.error('Error calculating price:', error);
         }
-    } catch (error) {
-        alert('Error submitting inspection');
     }
 }
 
-// Auto-calculate on load
-document.addEventListener('DOMContentLoaded', calculatePrice);
\ No newline at end of file
+window.BatchPricer = BatchPricer;
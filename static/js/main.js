@@ -0,0 +1,30 @@
+// "Load more" for keyset-paginated lists.
+// <button data-load-more data-url="/api/..." data-cursor="..." data-target="#list">
+// The endpoint returns {html, next_cursor}; html is appended to the target.
+document.addEventListener('click', function (e) {
+    const button = e.target.closest('[data-load-more]');
+    if (!button) return;
+
+    const url = new URL(button.dataset.url, window.location.origin);
+    url.searchParams.set('cursor', button.dataset.cursor);
+    button.disabled = true;
+
+    fetch(url)
+        .then(r => {
+            if (!r.ok) throw new Error(`HTTP ${r.status}`);
+            return r.json();
+        })
+        .then(page => {
+            document.querySelector(button.dataset.target).insertAdjacentHTML('beforeend', page.html);
+            if (page.next_cursor) {
+                button.dataset.cursor = page.next_cursor;
+                button.disabled = false;
+            } else {
+                button.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error loading more:', error);
+            button.disabled = false;
+        });
+});